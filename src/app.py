@@ -106,7 +106,7 @@ knowledge_service = KnowledgeBaseService(llm_client, services["policy"])
 review_service = ReviewService(services["feedback"], advanced_report_service, llm_client, policy_service=services["policy"])
 
 try:
-    # 如需从 shadow_rules.json 首次导入规则，可调用 seed_shadow_rules()
+    # 如需从 shadow_rules.jsonl 首次导入规则，可调用 seed_shadow_rules()
     knowledge_service.refresh_vector_store()
 except Exception:
     logging.exception("init knowledge base refresh failed")
@@ -953,14 +953,21 @@ def review_backfill_policy() -> Any:
 def list_rules() -> Any:
     q = request.args.get("q")
     category = request.args.get("category")
-    page = int(request.args.get("page", 1) or 1)
-    page_size = int(request.args.get("page_size", 10) or 10)
     try:
-        data = knowledge_service.list_rules(q=q, category=category, page=page, page_size=page_size)
+        page = int(request.args.get("page", 1) or 1)
+        page_size = int(request.args.get("page_size", 10) or 10)
+    except ValueError:
+        return jsonify({"success": False, "error": "page 与 page_size 必须为整数"}), 400
+    cursor = request.args.get("cursor") or None
+    try:
+        data = knowledge_service.list_rules(q=q, category=category, page=page, page_size=page_size, cursor=cursor)
         return jsonify({"success": True, "data": data})
+    except ValueError as exc:
+        # 如无法解析的分页游标，属于请求参数错误
+        return jsonify({"success": False, "error": str(exc)}), 400
     except Exception as exc:
         logging.exception("knowledge list error")
-        return jsonify({"success": False, "error": str(exc)}), 400
+        return jsonify({"success": False, "error": str(exc)}), 500
 
 
 @app.get("/api/v1/knowledge/rules/<rule_id>")
@@ -1009,7 +1016,7 @@ def update_rule(rule_id: str) -> Any:
 @app.post("/api/v1/knowledge/rules/refresh")
 def refresh_rules() -> Any:
     try:
-        meta = knowledge_service.refresh_vector_store()
+        meta = knowledge_service.refresh_vector_store(force=True)
         return jsonify({"success": True, "data": meta})
     except Exception as exc:
         logging.exception("refresh vector store error")
@@ -1816,7 +1823,9 @@ def generate_pdf(report_type: str) -> Any:
                 
                 if report_type == "balance-sheet":
                     from models.financial_schemas import BalanceSheetData
-                    balance_sheet_data = BalanceSheetData(**result.report_data)
+                    balance_sheet_data = result.report_model
+                    if not isinstance(balance_sheet_data, BalanceSheetData):
+                        balance_sheet_data = BalanceSheetData(**result.report_data)
                     # 如果启用AI分析，先生成分析
                     ai_analysis = None
                     if config.enable_ai_analysis:
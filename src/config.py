@@ -35,9 +35,17 @@ class Settings(BaseModel):
     embedding_model: str = Field(
         default_factory=lambda: os.getenv("EMBEDDING_MODEL", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
     )
+    # 向量入库时每批嵌入的文本条数
+    embedding_batch_size: int = Field(default_factory=lambda: int(os.getenv("EMBEDDING_BATCH_SIZE", "32")))
     ocr_endpoints: List[str] = Field(
         default_factory=lambda: [endpoint.strip() for endpoint in os.getenv("OCR_ENDPOINTS", "").split(",") if endpoint.strip()]
     )
+    # 支持直接接收 multipart 图片上传的 OCR 接口（免 base64），需同时出现在 OCR_ENDPOINTS 中
+    ocr_binary_endpoints: List[str] = Field(
+        default_factory=lambda: [
+            endpoint.strip() for endpoint in os.getenv("OCR_BINARY_ENDPOINTS", "").split(",") if endpoint.strip()
+        ]
+    )
     baidu_app_id: str = Field(default_factory=lambda: os.getenv("BAIDU_APP_ID", ""))
     baidu_api_key: str = Field(default_factory=lambda: os.getenv("BAIDU_API_KEY", ""))
     baidu_secret_key: str = Field(default_factory=lambda: os.getenv("BAIDU_SECRET_KEY", ""))
@@ -62,6 +70,11 @@ class Settings(BaseModel):
     anomaly_ml_min_samples: int = Field(default_factory=lambda: int(os.getenv("ANOMALY_ML_MIN_SAMPLES", "25")))
     enable_anomaly_ml: bool = Field(default_factory=lambda: os.getenv("ENABLE_ANOMALY_ML", "false").lower() == "true")
     analytics_cache_limit: int = Field(default_factory=lambda: int(os.getenv("ANALYTICS_CACHE_LIMIT", "5000")))
+    # 智能问答结果缓存有效期（秒）；近似问题命中需额外开启并依赖 sentence-transformers
+    qa_cache_ttl: float = Field(default_factory=lambda: float(os.getenv("QA_CACHE_TTL", "7200")))
+    qa_cache_max_entries: int = Field(default_factory=lambda: int(os.getenv("QA_CACHE_MAX_ENTRIES", "1000")))
+    qa_semantic_cache: bool = Field(default_factory=lambda: os.getenv("QA_SEMANTIC_CACHE", "false").lower() == "true")
+    qa_semantic_threshold: float = Field(default_factory=lambda: float(os.getenv("QA_SEMANTIC_THRESHOLD", "0.95")))
 
     # Feature toggles
     enable_policy_rag: bool = Field(default_factory=lambda: os.getenv("ENABLE_POLICY_RAG", "true").lower() == "true")
@@ -21,6 +21,10 @@ def init_db() -> None:
     from models import db_models  # noqa: F401
 
     Base.metadata.create_all(bind=engine)
+    # create_all 不会给已存在的表补建索引，后续新增声明的索引在此补齐
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
 
 
 @contextmanager
@@ -14,6 +14,9 @@ class LLMClient:
         base_url = base_url or os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
         self.model = model or os.getenv("DEEPSEEK_MODEL", "deepseek-chat")
         self.enabled = bool(api_key)
+        # 服务端支持按键复用前缀 KV 缓存时（如 OpenAI prompt_cache_key）才透传 cache_key，
+        # 避免不认识该字段的兼容接口报错；DeepSeek 等按前缀自动缓存的服务无需开启
+        self.send_cache_key = os.getenv("LLM_PROMPT_CACHE_KEY", "false").lower() == "true"
         self.client = OpenAI(api_key=api_key or "", base_url=base_url)
 
     def chat(self, messages: List[dict[str, str]], **kwargs: Any) -> str:
@@ -32,6 +35,9 @@ class LLMClient:
                 if rf_lower in {"json", "json_object"}:
                     response_format = {"type": "json_object"}
             params["response_format"] = response_format
+        cache_key = kwargs.get("cache_key")
+        if cache_key and self.send_cache_key:
+            params["extra_body"] = {"prompt_cache_key": cache_key}
 
         response = self.client.chat.completions.create(**params)
         return response.choices[0].message.content.strip()
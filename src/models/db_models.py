@@ -4,7 +4,7 @@ from __future__ import annotations
 from datetime import datetime
 from typing import Any, Dict
 
-from sqlalchemy import JSON, Column, DateTime, Float, ForeignKey, Integer, String, Text
+from sqlalchemy import JSON, Column, DateTime, Float, ForeignKey, Index, Integer, String, Text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from database import Base
@@ -61,6 +61,15 @@ class LedgerEntry(Base):
     document = relationship("Document", back_populates="ledger_entries")
 
 
+class LedgerVersion(Base):
+    """账务数据版本号（单行，id 固定为 1），分录/票据写入时在同一事务内递增，供报表缓存跨进程判断过期。"""
+
+    __tablename__ = "ledger_version"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    version: Mapped[int] = mapped_column(Integer, default=0)
+
+
 class AssistantLog(Base):
     __tablename__ = "assistant_logs"
 
@@ -76,6 +85,11 @@ class PolicyRule(Base):
     """知识库规则主表。"""
 
     __tablename__ = "policy_rules"
+    # 覆盖 list_rules 的分类 + 状态过滤，以及按 (updated_at, id) 的键集分页
+    __table_args__ = (
+        Index("ix_policy_rules_category_status", "category", "status"),
+        Index("ix_policy_rules_status_updated_id", "status", "updated_at", "id"),
+    )
 
     id: Mapped[str] = mapped_column(String, primary_key=True, default=lambda: generate_id("rule"))
     title: Mapped[str] = mapped_column(String(255))
@@ -2,6 +2,7 @@
 from __future__ import annotations
 
 from datetime import datetime
+from enum import IntEnum
 from typing import Any, Dict, List, Optional
 
 from pydantic import BaseModel, Field
@@ -19,6 +20,24 @@ class ReportConfig(BaseModel):
     company_name: Optional[str] = Field(None, description="公司名称")
 
 
+class EntryType(IntEnum):
+    """分录类型编码，聚合阶段由 LedgerEntry.entry_type 字符串转换而来。"""
+
+    REVENUE = 1
+    EXPENSE = 2
+    ASSET = 3
+    LIABILITY = 4
+    EQUITY = 5
+
+    @classmethod
+    def from_label(cls, label: Optional[str]) -> "EntryType":
+        """将分录类型字符串转换为编码，未知或缺失时按 expense 处理。"""
+        return _ENTRY_TYPE_BY_LABEL.get((label or "expense").lower(), cls.EXPENSE)
+
+
+_ENTRY_TYPE_BY_LABEL: Dict[str, EntryType] = {member.name.lower(): member for member in EntryType}
+
+
 class FinancialData(BaseModel):
     """财务数据聚合结果。"""
 
@@ -26,8 +45,8 @@ class FinancialData(BaseModel):
     account_classification: Dict[str, List[str]] = Field(
         default_factory=dict, description="科目分类：资产/负债/权益/收入/费用"
     )
-    account_entry_types: Dict[str, str] = Field(
-        default_factory=dict, description="科目标记：expense/revenue"
+    account_entry_types: Dict[str, EntryType] = Field(
+        default_factory=dict, description="科目标记：EntryType 编码（revenue/expense 等）"
     )
     period_start: Optional[datetime] = Field(None, description="期间开始日期")
     period_end: Optional[datetime] = Field(None, description="期间结束日期")
@@ -136,6 +155,7 @@ class ReportResponse(BaseModel):
 
     report_type: str = Field(..., description="报表类型：balance_sheet/income_statement/cash_flow")
     report_data: Dict[str, Any] = Field(..., description="报表数据（结构化）")
+    report_model: Optional[Any] = Field(None, exclude=True, description="报表数据模型（服务内复用，不参与序列化）")
     markdown_content: str = Field("", description="Markdown格式的报表内容")
     pdf_path: Optional[str] = Field(None, description="PDF文件路径（如果已生成）")
     ai_analysis: Optional[str] = Field(None, description="AI分析内容（如果启用）")
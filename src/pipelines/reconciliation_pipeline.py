@@ -54,15 +54,15 @@ class ReconciliationPipeline:
         if request.policies:
             self.policy.ingest_policies(request.policies)
 
+        policy_payloads: List[dict] = []
         for payload in request.documents:
             ingestion_result = self.ingestion.ingest(payload)
             ocr_result = self.ocr.recognize(ingestion_result)
             schema = self.extraction.extract(ocr_result)
             normalized = self.normalization.normalize(schema, payload.meta)
             category = self.categorization.categorize(schema)
-            policy_flags: List[PolicyFlag] = []
             if request.options.enable_policy_validation:
-                policy_flags = self.policy.validate({**normalized, "document_id": payload.document_id()})
+                policy_payloads.append({**normalized, "document_id": payload.document_id()})
             anomaly_out = self.anomaly.analyze(payload.document_id(), normalized)
 
             document_results.append(
@@ -79,7 +79,7 @@ class ReconciliationPipeline:
                     normalized_fields=normalized,
                     ocr_confidence=ocr_result.get("confidence", 0.0),
                     ocr_spans=ocr_result.get("spans", []),
-                    policy_flags=policy_flags,
+                    policy_flags=[],
                     anomalies=anomaly_out["anomalies"],
                     duplicate_candidates=anomaly_out["duplicates"],
                     reasoning_trace=[
@@ -88,6 +88,11 @@ class ReconciliationPipeline:
                     ],
                 )
             )
+        if policy_payloads:
+            # 所有单据解析完毕后统一做政策校验，便于合并 LLM 调用
+            batch_flags: List[List[PolicyFlag]] = self.policy.validate_batch(policy_payloads)
+            for doc, flags in zip(document_results, batch_flags):
+                doc.policy_flags = flags
         # Analytics & report
 
         self.analytics_service.sync(document_results)
@@ -3,7 +3,8 @@ from __future__ import annotations
 
 import hashlib
 from dataclasses import dataclass
-from typing import Any, Dict, List, Sequence
+from itertools import islice
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set
 
 import numpy as np
 
@@ -14,6 +15,19 @@ from config import get_settings
 class VectorRecord:
     vector: np.ndarray
     metadata: Dict[str, Any]
+    key: Optional[str] = None  # 增量同步用的稳定标识；未指定时只能随 clear() 整体清除
+    fingerprint: int = 0  # 标题/摘要/正文指纹，入库时计算一次，检索结果去重用
+
+
+def content_fingerprint(metadata: Dict[str, Any]) -> int:
+    """基于 title/summary/content 的进程内指纹。"""
+    return hash(
+        (
+            str(metadata.get("title", "")),
+            str(metadata.get("summary", "")),
+            str(metadata.get("content", "")),
+        )
+    )
 
 
 class VectorStore:
@@ -21,6 +35,8 @@ class VectorStore:
         self.settings = get_settings()
         self.model = None
         self.records: List[VectorRecord] = []
+        # 每次写入/删除递增，供上层缓存判断索引内容是否变化
+        self.version = 0
         self._dim = 384
         self._load_model()
 
@@ -34,11 +50,11 @@ class VectorStore:
         except Exception:
             self.model = None
 
-    def _embed(self, texts: Sequence[str]) -> np.ndarray:
+    def _embed(self, texts: Sequence[str], batch_size: int = 32) -> np.ndarray:
         if not texts:
             return np.empty((0, self._dim))
         if self.model is not None:
-            return self.model.encode(list(texts), convert_to_numpy=True)
+            return self.model.encode(list(texts), batch_size=batch_size, convert_to_numpy=True)
         vectors = []
         for text in texts:
             digest = hashlib.sha256(text.encode("utf-8", errors="ignore")).digest()
@@ -49,30 +65,91 @@ class VectorStore:
             vectors.append(vec)
         return np.vstack(vectors)
 
-    def add_texts(self, texts: Sequence[str], metadatas: Sequence[Dict[str, Any]]) -> None:
-        if not texts:
-            return
-        vectors = self._embed(texts)
-        for vec, meta in zip(vectors, metadatas):
-            self.records.append(VectorRecord(vector=vec, metadata=meta))
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Iterable[Dict[str, Any]],
+        batch_size: int | None = None,
+    ) -> None:
+        """
+        按批嵌入并写入；batch_size 缺省取 EMBEDDING_BATCH_SIZE。
+        texts/metadatas 可为生成器，逐批消费，中间结果只占用一个批次的内存。
+        """
+        batch_size = max(1, batch_size or self.settings.embedding_batch_size)
+        pairs = zip(texts, metadatas)
+        added = False
+        while True:
+            chunk = list(islice(pairs, batch_size))
+            if not chunk:
+                break
+            vectors = self._embed([text for text, _ in chunk], batch_size=batch_size)
+            self.records.extend(
+                VectorRecord(vector=vec, metadata=meta, fingerprint=content_fingerprint(meta))
+                for vec, (_, meta) in zip(vectors, chunk)
+            )
+            added = True
+        if added:
+            self.version += 1
 
     def similarity_search(self, query: str, top_k: int = 3) -> List[Dict[str, Any]]:
         if not self.records:
             return []
-        query_vec = self._embed([query])[0]
-        query_norm = np.linalg.norm(query_vec) + 1e-9
-        results = []
-        for record in self.records:
-            score = float(np.dot(query_vec, record.vector) / (query_norm * (np.linalg.norm(record.vector) + 1e-9)))
-            results.append((score, record.metadata))
-        results.sort(key=lambda item: item[0], reverse=True)
-        return [
-            {"score": round(score, 4), **metadata}
-            for score, metadata in results[:top_k]
-        ]
+        return self.similarity_search_batch([query], top_k=top_k)[0]
+
+    def similarity_search_batch(self, queries: Sequence[str], top_k: int = 3) -> List[List[Dict[str, Any]]]:
+        """多条查询一次嵌入、一次矩阵运算打分，返回与 queries 对应的 top_k 结果列表。"""
+        if not queries:
+            return []
+        # 取一次快照：打分矩阵与结果元数据必须来自同一组记录，并发 upsert/delete 不影响本次检索
+        records = list(self.records)
+        if not records:
+            return [[] for _ in queries]
+        query_vecs = np.asarray(self._embed(queries), dtype=np.float32)
+        matrix = np.vstack([record.vector for record in records]).astype(np.float32, copy=False)
+        scores = (query_vecs @ matrix.T) / np.outer(
+            np.linalg.norm(query_vecs, axis=1) + 1e-9, np.linalg.norm(matrix, axis=1) + 1e-9
+        )
+        results: List[List[Dict[str, Any]]] = []
+        for row in scores:
+            # 稳定排序：同分时保持入库顺序
+            order = np.argsort(-row, kind="stable")[:top_k]
+            results.append(
+                [
+                    {"score": round(float(row[idx]), 4), **records[idx].metadata, "_fp": records[idx].fingerprint}
+                    for idx in order
+                ]
+            )
+        return results
+
+    def upsert(
+        self,
+        keys: Sequence[str],
+        texts: Iterable[str],
+        metadatas: Iterable[Dict[str, Any]],
+        batch_size: int | None = None,
+    ) -> None:
+        """按 key 替换或新增记录，仅对传入文本重新嵌入。"""
+        if not keys:
+            return
+        self.delete(keys)
+        start = len(self.records)
+        self.add_texts(texts, metadatas, batch_size=batch_size)
+        for record, key in zip(self.records[start:], keys):
+            record.key = key
+
+    def delete(self, keys: Sequence[str]) -> None:
+        """删除指定 key 的记录。"""
+        drop = set(keys)
+        if drop:
+            self.records[:] = [record for record in self.records if record.key not in drop]
+            self.version += 1
+
+    def keys(self) -> Set[str]:
+        return {record.key for record in self.records if record.key is not None}
 
     def clear(self) -> None:
         self.records.clear()
+        self.version += 1
 
 
-__all__ = ["VectorStore"]
+__all__ = ["VectorStore", "content_fingerprint"]
@@ -10,7 +10,7 @@ from typing import Dict, List, Sequence
 from llm_client import LLMClient
 from models.schemas import AnalyticsInsight, AnalyticsQueryRequest, AnalyticsRecord, DocumentResult
 from utils.file_ops import read_analytics_cache, write_analytics_cache
-from utils.prompts import NL_QUERY_PROMPT
+from utils.prompts import render_nl_query
 
 
 class AnalyticsService:
@@ -49,7 +49,7 @@ class AnalyticsService:
             return AnalyticsInsight(question=request.question, answer="暂无可用的历史数据用于分析", generated_sql=None)
 
         prompt_payload = json.dumps([record.prompt_payload() for record in context_records], ensure_ascii=False)
-        prompt = NL_QUERY_PROMPT.format(records=prompt_payload, question=request.question)
+        prompt = render_nl_query(prompt_payload, request.question)
         messages = [
             {"role": "system", "content": "你是一名资深的企业财务分析助理，必须确保输出遵守 JSON 格式。"},
             {"role": "user", "content": prompt},
@@ -69,9 +69,8 @@ class AnalyticsService:
     # Internal helpers
     # ------------------------------------------------------------------ #
     def _load_cache(self) -> None:
-        """读取 JSON 缓存并恢复为结构化记录。"""
-        raw_records = read_analytics_cache()
-        for payload in raw_records:
+        """逐条读取 JSON 缓存并恢复为结构化记录。"""
+        for payload in read_analytics_cache():
             try:
                 record = AnalyticsRecord(**payload)
             except Exception:
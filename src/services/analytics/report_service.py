@@ -6,7 +6,7 @@ from typing import List
 
 from llm_client import LLMClient
 from models.schemas import DocumentResult
-from utils.prompts import REPORT_PROMPT
+from utils.prompts import render_report
 
 
 class ReportService:
@@ -15,7 +15,7 @@ class ReportService:
 
     def generate(self, documents: List[DocumentResult]) -> str:
         payload = json.dumps([doc.model_dump() for doc in documents], ensure_ascii=False)
-        prompt = REPORT_PROMPT.format(payload=payload)
+        prompt = render_report(payload)
         try:
             return self.llm.chat([
                 {"role": "system", "content": "你是财务审核总结机器人"},
@@ -4,14 +4,83 @@ from __future__ import annotations
 import logging
 from collections import defaultdict
 from datetime import datetime
+from itertools import chain
 from typing import Dict, List, Optional
 
-from database import db_session
-from models.db_models import LedgerEntry
-from models.financial_schemas import FinancialData
+from sqlalchemy import event, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from database import db_session, engine
+from models.db_models import Document, LedgerEntry
+from models.financial_schemas import EntryType, FinancialData
 
 logger = logging.getLogger(__name__)
 
+# 账务数据版本号存放在单行表 ledger_version 中，与分录/票据写入在同一事务内递增并一起提交，
+# 因此多个进程（多 worker、批量导入脚本）看到的是同一版本号，报表缓存据此判断数据是否过期
+_BUMP_LEDGER_VERSION_SQL = text(
+    "INSERT INTO ledger_version (id, version) VALUES (1, 1) ON CONFLICT(id) DO UPDATE SET version = version + 1"
+)
+_READ_LEDGER_VERSION_SQL = text("SELECT version FROM ledger_version WHERE id = 1")
+
+
+def get_ledger_version() -> Optional[int]:
+    """返回已提交的账务数据版本号；版本表不存在（未执行 init_db）时返回 None，调用方应跳过缓存。"""
+    try:
+        with engine.connect() as conn:
+            return conn.execute(_READ_LEDGER_VERSION_SQL).scalar() or 0
+    except OperationalError:
+        logger.warning("读取账务数据版本号失败，本次不使用报表缓存", exc_info=True)
+        return None
+
+
+def bump_ledger_version(session: Session) -> None:
+    """在 session 当前事务内递增版本号，随写入一起提交或回滚；同一事务只递增一次。"""
+    if session.info.get("ledger_dirty"):
+        return
+    session.info["ledger_dirty"] = True
+    try:
+        session.connection().execute(_BUMP_LEDGER_VERSION_SQL)
+    except OperationalError:
+        # 版本表缺失不应让业务写入失败；此时读取方也拿不到版本号，会跳过缓存
+        logger.warning("递增账务数据版本号失败，请先执行 init_db", exc_info=True)
+
+
+@event.listens_for(Session, "after_flush")
+def _mark_ledger_flush(session, flush_context) -> None:
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, (LedgerEntry, Document)):
+            bump_ledger_version(session)
+            return
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _mark_ledger_bulk_write(orm_execute_state) -> None:
+    # query(LedgerEntry).delete() 等批量语句不会出现在 session.new/dirty/deleted 中
+    if not (orm_execute_state.is_delete or orm_execute_state.is_update):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and mapper.class_ in (LedgerEntry, Document):
+        bump_ledger_version(orm_execute_state.session)
+
+
+@event.listens_for(Session, "after_commit")
+def _purge_on_commit(session) -> None:
+    if session.info.pop("ledger_dirty", False):
+        # 问答缓存持久化在磁盘上、无法按版本号判断过期，源数据变更后直接清空
+        from services.qa_cache import purge_qa_cache
+
+        try:
+            purge_qa_cache()
+        except Exception:  # noqa: BLE001
+            logger.exception("清空问答缓存失败")
+
+
+@event.listens_for(Session, "after_rollback")
+def _clear_on_rollback(session) -> None:
+    session.info.pop("ledger_dirty", None)
+
 
 class DataAggregator:
     """财务数据聚合器。"""
@@ -69,9 +138,9 @@ class DataAggregator:
         )
 
         # 记录每个科目的 entry_type （可能被后续覆盖但允许 revenue override expense）
-        account_entry_types: Dict[str, str] = {}
+        account_entry_types: Dict[str, EntryType] = {}
         for entry in entries:
-            entry_type = (entry.entry_type or "expense").lower()
+            entry_type = EntryType.from_label(entry.entry_type)
             for acct in [entry.debit_account, entry.credit_account]:
                 if acct:
                     account_entry_types[acct] = entry_type
@@ -202,4 +271,4 @@ class DataAggregator:
         )
 
 
-__all__ = ["DataAggregator"]
+__all__ = ["DataAggregator", "bump_ledger_version", "get_ledger_version"]
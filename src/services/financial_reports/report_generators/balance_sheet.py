@@ -3,6 +3,7 @@ from __future__ import annotations
 
 import logging
 from datetime import datetime
+from math import fsum
 from typing import Any, Dict, List
 
 from models.financial_schemas import (
@@ -390,8 +391,8 @@ class BalanceSheetGenerator:
         return equity
 
     def _calculate_total(self, items: List[BalanceSheetItem]) -> float:
-        """计算项目总计。"""
-        return sum(item.amount for item in items)
+        """计算项目总计（fsum 在 C 层累加并避免浮点误差累积）。"""
+        return fsum([item.amount for item in items])
 
 
 __all__ = ["BalanceSheetGenerator"]
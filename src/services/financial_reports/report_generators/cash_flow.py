@@ -3,6 +3,7 @@ from __future__ import annotations
 
 import logging
 from datetime import datetime
+from math import fsum
 from typing import List
 
 from models.financial_schemas import CashFlowData, CashFlowItem, FinancialData, ReportConfig
@@ -158,8 +159,8 @@ class CashFlowGenerator:
         return financing_activities
 
     def _calculate_total(self, items: List[CashFlowItem]) -> float:
-        """计算项目总计。"""
-        return sum(item.amount for item in items)
+        """计算项目总计（fsum 在 C 层累加并避免浮点误差累积）。"""
+        return fsum([item.amount for item in items])
 
 
 __all__ = ["CashFlowGenerator"]
@@ -3,9 +3,16 @@ from __future__ import annotations
 
 import logging
 from datetime import datetime
-from typing import List
+from math import fsum
+from typing import List, Tuple
 
-from models.financial_schemas import FinancialData, IncomeStatementData, IncomeStatementItem, ReportConfig
+from models.financial_schemas import (
+    EntryType,
+    FinancialData,
+    IncomeStatementData,
+    IncomeStatementItem,
+    ReportConfig,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -26,11 +33,8 @@ class IncomeStatementGenerator:
         account_balances = financial_data.account_balances
         entry_types = financial_data.account_entry_types
 
-        # 构建收入项目
-        revenue = self._build_revenue(account_balances, entry_types)
-
-        # 构建营业费用（含所有 expense）
-        operating_expenses = self._build_operating_expenses(account_balances, entry_types)
+        # 一次遍历科目余额，同时拆分收入与营业费用（含所有 expense）
+        revenue, operating_expenses = self._partition_accounts(account_balances, entry_types)
 
         total_revenue = self._calculate_total(revenue)
         total_expenses = self._calculate_total(operating_expenses)
@@ -45,7 +49,7 @@ class IncomeStatementGenerator:
         period_start = config.start_date or financial_data.period_start or datetime.now()
         period_end = config.end_date or financial_data.period_end or datetime.now()
 
-        return IncomeStatementData(
+        return IncomeStatementData.model_construct(
             report_date=period_end,
             company_name=config.company_name,
             period_start=period_start,
@@ -58,46 +62,36 @@ class IncomeStatementGenerator:
             net_profit=net_profit,
         )
 
-    def _build_revenue(
-        self, account_balances: dict[str, float], entry_types: dict[str, str]
-    ) -> List[IncomeStatementItem]:
-        """构建收入项目。"""
+    def _partition_accounts(
+        self, account_balances: dict[str, float], entry_types: dict[str, EntryType]
+    ) -> Tuple[List[IncomeStatementItem], List[IncomeStatementItem]]:
+        """按科目标记拆分收入项目与营业费用项目。"""
+        if not account_balances or not entry_types:
+            # 无分录期间直接返回占位收入行，跳过遍历
+            return [IncomeStatementItem.model_construct(name="营业收入", amount=0.0)], []
+
         revenue: List[IncomeStatementItem] = []
-        revenue_items: List[IncomeStatementItem] = []
-        for account, entry_type in entry_types.items():
-            if entry_type == "revenue":
-                amount = account_balances.get(account, 0.0)
-                if amount != 0.0:
-                    revenue_items.append(IncomeStatementItem(name=account, amount=amount))
-
-        if revenue_items:
-            revenue.extend(revenue_items)
-        else:
-            revenue.append(IncomeStatementItem(name="营业收入", amount=0.0))
-
-        return revenue
-
-    def _build_operating_expenses(
-        self, account_balances: dict[str, float], entry_types: dict[str, str]
-    ) -> List[IncomeStatementItem]:
-        """构建营业费用项目。"""
         operating_expenses: List[IncomeStatementItem] = []
-        expense_items: List[IncomeStatementItem] = []
-
-        for account, entry_type in entry_types.items():
-            if entry_type != "revenue":
-                amount = account_balances.get(account, 0.0)
-                if amount != 0.0:
-                    expense_items.append(IncomeStatementItem(name=account, amount=amount))
-
-        if expense_items:
-            operating_expenses.extend(expense_items)
-
-        return operating_expenses
+        add_revenue = revenue.append
+        add_expense = operating_expenses.append
+        for account, amount in account_balances.items():
+            if amount == 0.0:
+                continue
+            entry_type = entry_types.get(account)
+            if entry_type is None:
+                continue
+            # 输入来自内部聚合器且类型已确定，跳过 pydantic 校验
+            item = IncomeStatementItem.model_construct(name=account, amount=amount)
+            if entry_type is EntryType.REVENUE:
+                add_revenue(item)
+            else:
+                add_expense(item)
+
+        return revenue or [IncomeStatementItem.model_construct(name="营业收入", amount=0.0)], operating_expenses
 
     def _calculate_total(self, items: List[IncomeStatementItem]) -> float:
-        """计算项目总计。"""
-        return sum(item.amount for item in items)
+        """计算项目总计（fsum 在 C 层累加并避免浮点误差累积）。"""
+        return fsum([item.amount for item in items])
 
 
 __all__ = ["IncomeStatementGenerator"]
@@ -2,17 +2,21 @@
 from __future__ import annotations
 
 import logging
-from typing import Dict, Optional
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple, Union
 
 from models.financial_schemas import (
     BalanceSheetData,
     CashFlowData,
+    FinancialData,
     IncomeStatementData,
     ReportConfig,
     ReportResponse,
 )
 from services.financial_reports.ai_analyzer import AIAnalyzer
-from services.financial_reports.data_aggregator import DataAggregator
+from services.financial_reports.data_aggregator import DataAggregator, get_ledger_version
 from services.financial_reports.exporters.markdown_exporter import MarkdownExporter
 from services.financial_reports.exporters.pdf_exporter import PDFExporter
 from services.financial_reports.report_generators.balance_sheet import BalanceSheetGenerator
@@ -25,6 +29,9 @@ logger = logging.getLogger(__name__)
 class FinancialReportService:
     """财务报表服务。"""
 
+    # 聚合结果缓存的最大条目数
+    AGGREGATE_CACHE_SIZE = 32
+
     def __init__(self, llm_client=None) -> None:
         """初始化服务。
         
@@ -32,12 +39,46 @@ class FinancialReportService:
             llm_client: LLM客户端，用于AI分析（可选）
         """
         self.data_aggregator = DataAggregator()
+        self._aggregate_cache: "OrderedDict[Tuple, FinancialData]" = OrderedDict()
+        self._aggregate_cache_lock = threading.Lock()
         self.balance_sheet_generator = BalanceSheetGenerator()
         self.income_statement_generator = IncomeStatementGenerator()
         self.cash_flow_generator = CashFlowGenerator()
         self.markdown_exporter = MarkdownExporter()
         self.pdf_exporter = PDFExporter()
         self.ai_analyzer = AIAnalyzer(llm_client=llm_client)
+        # PDF 渲染为 CPU 密集型且与 Markdown/AI 分析互不依赖，放到后台线程与之并行
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="report-pdf")
+
+    def _aggregate(self, config: ReportConfig) -> FinancialData:
+        """聚合财务数据，同一期间且账务未变更时直接复用缓存结果（LRU）。
+
+        账务版本号存放在数据库中、随写入事务一起提交，其他进程的写入同样会使缓存失效；
+        读不到版本号时不读写缓存。
+        """
+        version = get_ledger_version()
+        key = (config.user_id, config.start_date, config.end_date, version)
+        if version is not None:
+            with self._aggregate_cache_lock:
+                cached = self._aggregate_cache.get(key)
+                if cached is not None:
+                    self._aggregate_cache.move_to_end(key)
+                    logger.debug("命中财务数据聚合缓存: %s", key)
+                    return cached
+
+        financial_data = self.data_aggregator.aggregate_ledger_data(
+            start_date=config.start_date,
+            end_date=config.end_date,
+            user_id=config.user_id,
+        )
+
+        if version is not None:
+            with self._aggregate_cache_lock:
+                self._aggregate_cache[key] = financial_data
+                self._aggregate_cache.move_to_end(key)
+                while len(self._aggregate_cache) > self.AGGREGATE_CACHE_SIZE:
+                    self._aggregate_cache.popitem(last=False)
+        return financial_data
 
     def generate_balance_sheet(self, config: ReportConfig) -> ReportResponse:
         """生成资产负债表。
@@ -49,15 +90,16 @@ class FinancialReportService:
             ReportResponse: 报表响应
         """
         # 1. 聚合财务数据
-        financial_data = self.data_aggregator.aggregate_ledger_data(
-            start_date=config.start_date,
-            end_date=config.end_date,
-            user_id=config.user_id,
-        )
+        financial_data = self._aggregate(config)
 
         # 2. 生成报表数据
         report_data = self.balance_sheet_generator.generate(financial_data, config)
 
+        # 未启用AI分析时PDF无需等待分析结果，提前提交到后台线程与Markdown导出并行
+        pdf_future = None
+        if not config.enable_ai_analysis:
+            pdf_future = self._executor.submit(self.pdf_exporter.export_balance_sheet, report_data, config, None)
+
         # 3. 导出为Markdown
         markdown_content = self.markdown_exporter.export_balance_sheet(report_data, config)
 
@@ -70,7 +112,10 @@ class FinancialReportService:
         pdf_path: Optional[str] = None
         try:
             logger.debug("开始导出资产负债表为PDF")
-            pdf_path = self.pdf_exporter.export_balance_sheet(report_data, config, ai_analysis=ai_analysis)
+            if pdf_future is not None:
+                pdf_path = pdf_future.result()
+            else:
+                pdf_path = self.pdf_exporter.export_balance_sheet(report_data, config, ai_analysis=ai_analysis)
             if pdf_path:
                 logger.info(f"资产负债表PDF导出成功: {pdf_path}")
             else:
@@ -91,13 +136,7 @@ class FinancialReportService:
                 except Exception as e2:
                     logger.exception(f"markdown转换方式也失败: {e2}")
 
-        return ReportResponse(
-            report_type="balance_sheet",
-            report_data=report_data.model_dump(),
-            markdown_content=markdown_content,
-            pdf_path=pdf_path,
-            ai_analysis=ai_analysis,
-        )
+        return self._build_response("balance_sheet", report_data, markdown_content, pdf_path, ai_analysis)
 
     def generate_income_statement(self, config: ReportConfig) -> ReportResponse:
         """生成利润表。
@@ -109,11 +148,7 @@ class FinancialReportService:
             ReportResponse: 报表响应
         """
         # 1. 聚合财务数据
-        financial_data = self.data_aggregator.aggregate_ledger_data(
-            start_date=config.start_date,
-            end_date=config.end_date,
-            user_id=config.user_id,
-        )
+        financial_data = self._aggregate(config)
 
         # 2. 生成报表数据
         report_data = self.income_statement_generator.generate(financial_data, config)
@@ -121,16 +156,18 @@ class FinancialReportService:
         # 3. 导出为Markdown
         markdown_content = self.markdown_exporter.export_income_statement(report_data, config)
 
-        # 4. AI分析（如果启用）- 在PDF生成之前进行，以便合并到PDF中
+        # PDF 仅依赖Markdown内容，提交到后台线程，与AI分析并行
+        pdf_future = self._executor.submit(self.pdf_exporter.export_income_statement, markdown_content, config)
+
+        # 4. AI分析（如果启用）
         ai_analysis: Optional[str] = None
         if config.enable_ai_analysis:
             ai_analysis = self.ai_analyzer.analyze_income_statement(report_data)
 
-        # 5. 导出为PDF（使用markdown转换方式）
+        # 5. 等待PDF导出完成（使用markdown转换方式）
         pdf_path: Optional[str] = None
         try:
-            logger.debug("开始导出利润表为PDF")
-            pdf_path = self.pdf_exporter.export_income_statement(markdown_content, config)
+            pdf_path = pdf_future.result()
             if pdf_path:
                 logger.info(f"利润表PDF导出成功: {pdf_path}")
             else:
@@ -138,13 +175,7 @@ class FinancialReportService:
         except Exception as e:
             logger.exception(f"利润表PDF导出失败: {e}")
 
-        return ReportResponse(
-            report_type="income_statement",
-            report_data=report_data.model_dump(),
-            markdown_content=markdown_content,
-            pdf_path=pdf_path,
-            ai_analysis=ai_analysis,
-        )
+        return self._build_response("income_statement", report_data, markdown_content, pdf_path, ai_analysis)
 
     def generate_cash_flow(self, config: ReportConfig) -> ReportResponse:
         """生成现金流量表。
@@ -156,11 +187,7 @@ class FinancialReportService:
             ReportResponse: 报表响应
         """
         # 1. 聚合财务数据
-        financial_data = self.data_aggregator.aggregate_ledger_data(
-            start_date=config.start_date,
-            end_date=config.end_date,
-            user_id=config.user_id,
-        )
+        financial_data = self._aggregate(config)
 
         # 2. 生成报表数据
         report_data = self.cash_flow_generator.generate(financial_data, config)
@@ -168,16 +195,18 @@ class FinancialReportService:
         # 3. 导出为Markdown
         markdown_content = self.markdown_exporter.export_cash_flow(report_data, config)
 
-        # 4. AI分析（如果启用）- 在PDF生成之前进行，以便合并到PDF中
+        # PDF 仅依赖Markdown内容，提交到后台线程，与AI分析并行
+        pdf_future = self._executor.submit(self.pdf_exporter.export_cash_flow, markdown_content, config)
+
+        # 4. AI分析（如果启用）
         ai_analysis: Optional[str] = None
         if config.enable_ai_analysis:
             ai_analysis = self.ai_analyzer.analyze_cash_flow(report_data)
 
-        # 5. 导出为PDF（使用markdown转换方式）
+        # 5. 等待PDF导出完成（使用markdown转换方式）
         pdf_path: Optional[str] = None
         try:
-            logger.debug("开始导出现金流量表为PDF")
-            pdf_path = self.pdf_exporter.export_cash_flow(markdown_content, config)
+            pdf_path = pdf_future.result()
             if pdf_path:
                 logger.info(f"现金流量表PDF导出成功: {pdf_path}")
             else:
@@ -185,9 +214,21 @@ class FinancialReportService:
         except Exception as e:
             logger.exception(f"现金流量表PDF导出失败: {e}")
 
-        return ReportResponse(
-            report_type="cash_flow",
+        return self._build_response("cash_flow", report_data, markdown_content, pdf_path, ai_analysis)
+
+    @staticmethod
+    def _build_response(
+        report_type: str,
+        report_data: Union[BalanceSheetData, IncomeStatementData, CashFlowData],
+        markdown_content: str,
+        pdf_path: Optional[str],
+        ai_analysis: Optional[str],
+    ) -> ReportResponse:
+        """组装报表响应：报表数据只序列化一次，且不再对序列化结果重复校验。"""
+        return ReportResponse.model_construct(
+            report_type=report_type,
             report_data=report_data.model_dump(),
+            report_model=report_data,
             markdown_content=markdown_content,
             pdf_path=pdf_path,
             ai_analysis=ai_analysis,
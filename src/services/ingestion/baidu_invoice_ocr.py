@@ -2,15 +2,26 @@
 from __future__ import annotations
 
 import base64
+import copy
+import hashlib
+import logging
+import re
 import threading
 import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import Any, BinaryIO, Dict, Union
+from typing import Any, BinaryIO, Dict, Optional, Union
+from urllib.parse import quote_from_bytes
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from config import get_settings
+from utils import fast_json
 
+logger = logging.getLogger(__name__)
 
 TOKEN_URL = "https://aip.baidubce.com/oauth/2.0/token"
 OCR_URL = "https://aip.baidubce.com/rest/2.0/ocr/v1/vat_invoice"
@@ -18,95 +29,199 @@ TAXI_URL = "https://aip.baidubce.com/rest/2.0/ocr/v1/taxi_receipt"
 TRAIN_URL = "https://aip.baidubce.com/rest/2.0/ocr/v1/train_ticket"
 GENERAL_URL = "https://aip.baidubce.com/rest/2.0/ocr/v1/general_basic"
 
+# token 剩余有效期低于该秒数时触发后台续期
+TOKEN_REFRESH_AHEAD = 300
+# 后台续期失败后，间隔该秒数才再次尝试，避免续期窗口内每个请求都去请求 token 接口
+TOKEN_REFRESH_BACKOFF = 30
+
+# access token 无效/过期相关的错误码
+TOKEN_ERROR_CODES = frozenset({"100", "110", "111"})
+
+# 增值税发票接口的附加表单参数（已按 x-www-form-urlencoded 编码）
+VAT_PARAMS = b"&accuracy=high&multi_detect=true"
+
+# 票据类型关键词，预编译为单个正则，一次扫描即可判定
+_TAXI_RE = re.compile("出租车|出租汽车|上车时间|下车时间|车牌号|单价|里程")
+_TRAIN_RE = re.compile("火车|车次|动车|高铁|检票口|始发站|到达站")
+# 文件名提示为出租车票/火车票时不预取增值税接口（预取请求一旦发出即计费）
+_NON_VAT_HINT_RE = re.compile("taxi|train|rail|出租|的士|火车|高铁|动车|车票", re.IGNORECASE)
+
 
 class BaiduOCRException(Exception):
     """百度 OCR 调用异常。"""
 
+    def __init__(self, message: str, error_code: Optional[str] = None) -> None:
+        super().__init__(message)
+        self.error_code = error_code
+
 
 class BaiduInvoiceOCRClient:
-    def __init__(self, app_id: str, api_key: str, secret_key: str) -> None:
+    # 按图片内容哈希缓存识别结果的最大条目数（重复上传同一票据时跳过网络往返）
+    RESULT_CACHE_SIZE = 256
+    # 进程内共享的 I/O 线程池，用于并发发起通用与增值税识别请求
+    _executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="baidu-ocr")
+
+    def __init__(self, app_id: str, api_key: str, secret_key: str, keep_raw: bool = False) -> None:
         self.app_id = app_id
         self.api_key = api_key
         self.secret_key = secret_key
+        # 原始返回体可能很大，仅在调试时保留到结果的 "raw" 字段
+        self.keep_raw = keep_raw
         self._token: str | None = None
         self._token_expire_ts: float = 0.0
         self._lock = threading.Lock()
-        self._session = requests.Session()
+        # 保证同一时间最多只有一个后台续期线程
+        self._refresh_lock = threading.Lock()
+        self._refresh_failed_ts: float = 0.0
+        self._session = self._build_session()
+        self._result_cache: "OrderedDict[tuple[str, bytes], Dict[str, Any]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    @staticmethod
+    def _build_session() -> requests.Session:
+        """复用 TCP/TLS 连接；连接池与共享线程池同量级，避免并发识别时排队等待连接。"""
+        session = requests.Session()
+        retry = Retry(
+            total=2,
+            backoff_factor=0.2,
+            status_forcelist=[500, 502, 503, 504],
+            allowed_methods=frozenset({"GET", "POST"}),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=32, pool_maxsize=32, max_retries=retry)
+        session.mount("https://", adapter)
+        return session
 
     @classmethod
-    def from_settings(cls) -> "BaiduInvoiceOCRClient":
+    def from_settings(cls, keep_raw: bool = False) -> "BaiduInvoiceOCRClient":
         settings = get_settings()
         if not (settings.baidu_app_id and settings.baidu_api_key and settings.baidu_secret_key):
             raise RuntimeError("百度OCR配置缺失，请设置 baidu_app_id / baidu_api_key / baidu_secret_key")
-        return cls(settings.baidu_app_id, settings.baidu_api_key, settings.baidu_secret_key)
+        return cls(settings.baidu_app_id, settings.baidu_api_key, settings.baidu_secret_key, keep_raw=keep_raw)
 
     def recognize(self, file: Union[Path, bytes, BinaryIO]) -> Dict[str, Any]:
         """兼容旧接口：直接按增值税入口调用，失败时降级通用。"""
-        token = self._access_token()
         image_bytes = self._read_bytes(file)
-        image_b64 = base64.b64encode(image_bytes).decode("utf-8")
-        data = {
-            "image": image_b64,
-            "accuracy": "high",
-            "multi_detect": "true",
-        }
+        digest = self._digest(image_bytes)
+        cached = self._cache_get("recognize", digest)
+        if cached is not None:
+            return cached
+
+        token = self._access_token()
+        image_field = self._encode_image(image_bytes)
         try:
-            payload = self._call_api(OCR_URL, token, data)
+            payload = self._call_api(OCR_URL, token, self._form_body(image_field, VAT_PARAMS))
         except BaiduOCRException as exc:
             if "282103" in str(exc) or "failed to match the template" in str(exc):
-                payload = self._call_general(token, image_b64)
+                payload = self._call_general(token, image_field)
             else:
                 raise
-        return self._package_payload(payload)
+        return self._cache_put("recognize", digest, self._package_payload(payload))
 
-    def recognize_smart(self, file: Union[Path, bytes, BinaryIO]) -> Dict[str, Any]:
+    def recognize_smart(self, file: Union[Path, bytes, BinaryIO], hint: Optional[str] = None) -> Dict[str, Any]:
         """
         先通用OCR获取文本做类型判定，再分流到增值税/出租车/火车票接口，最后兜底通用。
+
+        hint 为文件名等元信息（传入 Path 时默认取文件名），用于判断是否值得预取增值税接口。
         """
-        token = self._access_token()
+        if hint is None and isinstance(file, Path):
+            hint = file.name
         image_bytes = self._read_bytes(file)
-        image_b64 = base64.b64encode(image_bytes).decode("utf-8")
+        digest = self._digest(image_bytes)
+        cached = self._cache_get("smart", digest)
+        if cached is not None:
+            return cached
 
-        # 1) 通用文字识别
-        general_payload = self._call_general(token, image_b64)
+        token = self._access_token()
+        # 只做一次 base64 + URL 编码，通用与专用接口共用同一份请求体片段
+        image_field = self._encode_image(image_bytes)
+
+        # 1) 通用文字识别（中间结果同样缓存，分流失败重试时可复用）；
+        #    多数票据为增值税发票，识别的同时预先发起增值税接口请求以隐藏网络延迟。
+        #    代价：实际为出租车票/火车票时这次增值税调用白白计费，因此文件名已提示非增值税票据时不预取
+        general_payload = self._cache_get("general", digest)
+        vat_future: Optional[Future] = None
+        if general_payload is None:
+            if not (hint and _NON_VAT_HINT_RE.search(hint)):
+                vat_future = self._executor.submit(
+                    self._call_api, OCR_URL, token, self._form_body(image_field, VAT_PARAMS)
+                )
+            try:
+                general_payload = self._cache_put("general", digest, self._call_general(token, image_field))
+            except Exception:
+                # 通用识别失败时放弃预取结果：仍在排队则取消，已发出的请求结果直接丢弃
+                if vat_future is not None:
+                    vat_future.cancel()
+                raise
         general_text, _ = self._extract_text_and_fields(general_payload)
         doc_type = self._classify_doc_type(general_text)
 
         # 2) 分流
         if doc_type == "taxi":
-            try:
-                specific = self._call_api(TAXI_URL, token, {"image": image_b64})
-                specific["engine"] = "baidu_taxi_receipt"
-                return self._package_payload(specific)
-            except Exception:
-                pass
+            url, body, engine = TAXI_URL, self._form_body(image_field), "baidu_taxi_receipt"
         elif doc_type == "train":
-            try:
-                specific = self._call_api(TRAIN_URL, token, {"image": image_b64})
-                specific["engine"] = "baidu_train_ticket"
-                return self._package_payload(specific)
-            except Exception:
-                pass
+            url, body, engine = TRAIN_URL, self._form_body(image_field), "baidu_train_ticket"
         else:
-            try:
-                specific = self._call_api(
-                    OCR_URL,
-                    token,
-                    {
-                        "image": image_b64,
-                        "accuracy": "high",
-                        "multi_detect": "true",
-                    },
-                )
-                specific["engine"] = "baidu_invoice_ocr"
-                return self._package_payload(specific)
-            except Exception:
-                pass
+            url, body, engine = OCR_URL, self._form_body(image_field, VAT_PARAMS), "baidu_invoice_ocr"
+        if doc_type != "vat" and vat_future is not None:
+            # 只有仍在线程池排队时 cancel 才生效；请求已发出的话照常计费，这里仅丢弃其结果
+            vat_future.cancel()
+            vat_future = None
+        try:
+            specific = self._call_specialized(url, token, body, vat_future)
+            specific["engine"] = engine
+            return self._cache_put("smart", digest, self._package_payload(specific))
+        except Exception as exc:  # noqa: BLE001
+            logger.debug("百度专用票据接口失败，降级通用结果: %s", exc)
 
-        # 3) 兜底用通用结果
+        # 3) 兜底用通用结果；专用接口可能只是超时或限流，降级结果不写入 "smart" 缓存，下次上传仍会重试
         general_payload["engine"] = "baidu_general_basic"
         return self._package_payload(general_payload)
 
+    def _call_specialized(
+        self, url: str, token: str, body: bytes, prefetched: Optional[Future] = None
+    ) -> Dict[str, Any]:
+        """调用专用票据接口；token 失效时强制刷新并重试一次，避免后续请求反复浪费一次调用。"""
+        try:
+            return prefetched.result() if prefetched is not None else self._call_api(url, token, body)
+        except BaiduOCRException as exc:
+            if exc.error_code not in TOKEN_ERROR_CODES:
+                raise
+            with self._lock:
+                if self._token == token:
+                    self._token_expire_ts = 0.0
+            return self._call_api(url, self._access_token(), body)
+
+    @staticmethod
+    def _encode_image(image_bytes: bytes) -> bytes:
+        """base64 后直接做 URL 编码，全程停留在 bytes，省去 decode/urlencode 产生的副本。"""
+        return quote_from_bytes(base64.b64encode(image_bytes), safe="").encode("ascii")
+
+    @staticmethod
+    def _form_body(image_field: bytes, params: bytes = b"") -> bytes:
+        return b"image=" + image_field + params
+
+    @staticmethod
+    def _digest(image_bytes: bytes) -> bytes:
+        return hashlib.blake2b(image_bytes, digest_size=16).digest()
+
+    def _cache_get(self, kind: str, digest: bytes) -> Optional[Dict[str, Any]]:
+        with self._cache_lock:
+            hit = self._result_cache.get((kind, digest))
+            if hit is None:
+                return None
+            self._result_cache.move_to_end((kind, digest))
+        # 返回副本，避免调用方修改结果污染缓存
+        return copy.deepcopy(hit)
+
+    def _cache_put(self, kind: str, digest: bytes, result: Dict[str, Any]) -> Dict[str, Any]:
+        with self._cache_lock:
+            self._result_cache[(kind, digest)] = copy.deepcopy(result)
+            self._result_cache.move_to_end((kind, digest))
+            while len(self._result_cache) > self.RESULT_CACHE_SIZE:
+                self._result_cache.popitem(last=False)
+        return result
+
     def _extract_text_and_fields(self, payload: Dict[str, Any]) -> tuple[str, Dict[str, str]]:
         words_result = payload.get("words_result", [])
         fields: Dict[str, str] = {}
@@ -141,7 +256,7 @@ class BaiduInvoiceOCRClient:
 
         return text, fields
 
-    def _call_api(self, url: str, token: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    def _call_api(self, url: str, token: str, data: bytes) -> Dict[str, Any]:
         try:
             response = self._session.post(
                 f"{url}?access_token={token}",
@@ -153,14 +268,17 @@ class BaiduInvoiceOCRClient:
         except requests.RequestException as exc:
             raise BaiduOCRException(f"请求百度OCR失败: {exc}") from exc
 
-        payload = response.json()
+        payload = fast_json.loads(response.content)
         if "error_code" in payload:
-            raise BaiduOCRException(f"Baidu OCR error {payload.get('error_code')}: {payload.get('error_msg')}")
+            raise BaiduOCRException(
+                f"Baidu OCR error {payload.get('error_code')}: {payload.get('error_msg')}",
+                error_code=str(payload.get("error_code")),
+            )
         return payload
 
-    def _call_general(self, token: str, image_b64: str) -> Dict[str, Any]:
+    def _call_general(self, token: str, image_field: bytes) -> Dict[str, Any]:
         """通用文字识别：用于前置分类或兜底。"""
-        payload = self._call_api(GENERAL_URL, token, {"image": image_b64})
+        payload = self._call_api(GENERAL_URL, token, self._form_body(image_field))
         payload["engine"] = "baidu_general_basic"
         return payload
 
@@ -179,23 +297,25 @@ class BaiduInvoiceOCRClient:
 
     def _classify_doc_type(self, text: str) -> str:
         t = text or ""
-        if any(k in t for k in ["出租车", "出租汽车", "上车时间", "下车时间", "车牌号", "单价", "里程"]):
+        if _TAXI_RE.search(t):
             return "taxi"
-        if any(k in t for k in ["火车", "车次", "动车", "高铁", "检票口", "始发站", "到达站"]):
+        if _TRAIN_RE.search(t):
             return "train"
         return "vat"
 
     def _package_payload(self, payload: Dict[str, Any]) -> Dict[str, Any]:
         text, fields = self._extract_text_and_fields(payload)
         confidence = self._extract_confidence(payload)
-        return {
+        result = {
             "engine": payload.get("engine", "baidu_invoice_ocr"),
             "text": text,
             "confidence": confidence,
             "fields": fields,
-            "raw": payload,
             "app_id": self.app_id,
         }
+        if self.keep_raw:
+            result["raw"] = payload
+        return result
 
     def _read_bytes(self, file: Union[Path, bytes, BinaryIO]) -> bytes:
         if isinstance(file, Path):
@@ -206,32 +326,61 @@ class BaiduInvoiceOCRClient:
 
     def _access_token(self) -> str:
         now = time.time()
-        if self._token and now < self._token_expire_ts - 30:
-            return self._token
-
+        token = self._token
+        if token and now < self._token_expire_ts - 30:
+            # 临近过期时在后台续期，当前请求继续使用仍有效的旧 token
+            if (
+                now > self._token_expire_ts - TOKEN_REFRESH_AHEAD
+                and now - self._refresh_failed_ts >= TOKEN_REFRESH_BACKOFF
+                and self._refresh_lock.acquire(blocking=False)
+            ):
+                threading.Thread(target=self._refresh_token_async, daemon=True).start()
+            return token
+
+        # 真正过期时才同步阻塞刷新
         with self._lock:
             now = time.time()
             if self._token and now < self._token_expire_ts - 30:
                 return self._token
-
-            params = {
-                "grant_type": "client_credentials",
-                "client_id": self.api_key,
-                "client_secret": self.secret_key,
-            }
-            try:
-                response = self._session.post(TOKEN_URL, params=params, timeout=10)
-                response.raise_for_status()
-            except requests.RequestException as exc:
-                raise BaiduOCRException(f"获取百度OCR token 失败: {exc}") from exc
-
-            payload = response.json()
-            self._token = payload.get("access_token")
-            expires_in = int(payload.get("expires_in", 0))
-            self._token_expire_ts = now + max(expires_in - 60, 0)
-            if not self._token:
-                raise BaiduOCRException("无法获取百度OCR access_token")
+            self._token, self._token_expire_ts = self._fetch_token()
             return self._token
 
+    def _refresh_token_async(self) -> None:
+        try:
+            token, expire_ts = self._fetch_token()
+            with self._lock:
+                self._token, self._token_expire_ts = token, expire_ts
+        # 捕获全部异常：后台线程不能带着未记录的异常退出
+        except Exception as exc:  # noqa: BLE001
+            self._refresh_failed_ts = time.time()
+            logger.warning("百度OCR token 后台续期失败，%s 秒后再试: %s", TOKEN_REFRESH_BACKOFF, exc)
+        else:
+            self._refresh_failed_ts = 0.0
+        finally:
+            self._refresh_lock.release()
+
+    def _fetch_token(self) -> tuple[str, float]:
+        now = time.time()
+        params = {
+            "grant_type": "client_credentials",
+            "client_id": self.api_key,
+            "client_secret": self.secret_key,
+        }
+        try:
+            response = self._session.post(TOKEN_URL, params=params, timeout=10)
+            response.raise_for_status()
+        except requests.RequestException as exc:
+            raise BaiduOCRException(f"获取百度OCR token 失败: {exc}") from exc
+
+        try:
+            payload = fast_json.loads(response.content)
+        except ValueError as exc:
+            raise BaiduOCRException(f"百度OCR token 响应不是合法 JSON: {exc}") from exc
+        token = payload.get("access_token")
+        if not token:
+            raise BaiduOCRException("无法获取百度OCR access_token")
+        expires_in = int(payload.get("expires_in", 0))
+        return token, now + max(expires_in - 60, 0)
+
 
 __all__ = ["BaiduInvoiceOCRClient", "BaiduOCRException"]
@@ -1,7 +1,9 @@
 """Baidu 多票据智能识别（自动分类 13 类票据）。"""
 from __future__ import annotations
 
-import base64
+import hashlib
+import json
+import os
 import threading
 import time
 from pathlib import Path
@@ -9,11 +11,19 @@ from typing import Any, BinaryIO, Dict, Union
 
 import requests
 
-from config import get_settings
+from config import DATA_DIR, get_settings
+from utils import fast_json
+
+try:  # 可选依赖：SIMD 加速的 base64 编码，未安装时回退标准库
+    import pybase64 as _b64  # type: ignore
+except Exception:  # noqa: BLE001
+    import base64 as _b64
 
 
 TOKEN_URL = "https://aip.baidubce.com/oauth/2.0/token"
 MULTI_URL = "https://aip.baidubce.com/rest/2.0/ocr/v1/multiple_invoice"
+# 跨进程共享的 token 缓存文件，多个 worker 重启后无需各自重新换取 token
+TOKEN_CACHE_FILE = DATA_DIR / "cache" / ".baidu_token.json"
 
 
 class BaiduMultiInvoiceException(Exception):
@@ -40,7 +50,7 @@ class BaiduMultipleInvoiceClient:
     def recognize(self, file: Union[Path, bytes, BinaryIO]) -> Dict[str, Any]:
         token = self._access_token()
         image_bytes = self._read_bytes(file)
-        image_b64 = base64.b64encode(image_bytes).decode("utf-8")
+        image_b64 = _b64.b64encode(image_bytes).decode("ascii")
         payload = self._call_api(MULTI_URL, token, {"image": image_b64})
 
         # multiple_invoice 返回 words_result: list，每个元素带 invoice_type + result/words_result
@@ -116,6 +126,8 @@ class BaiduMultipleInvoiceClient:
             now = time.time()
             if self._token and now < self._token_expire_ts - 30:
                 return self._token
+            if self._load_shared_token() and now < self._token_expire_ts - 30:
+                return self._token
 
             params = {
                 "grant_type": "client_credentials",
@@ -128,14 +140,43 @@ class BaiduMultipleInvoiceClient:
             except requests.RequestException as exc:
                 raise BaiduMultiInvoiceException(f"获取百度OCR token 失败: {exc}") from exc
 
-            payload = response.json()
+            payload = fast_json.loads(response.content)
             self._token = payload.get("access_token")
             expires_in = int(payload.get("expires_in", 0))
             self._token_expire_ts = now + max(expires_in - 60, 0)
             if not self._token:
                 raise BaiduMultiInvoiceException("无法获取百度OCR access_token")
+            self._store_shared_token()
             return self._token
 
+    def _token_cache_key(self) -> str:
+        return hashlib.sha256(self.api_key.encode("utf-8")).hexdigest()
+
+    def _load_shared_token(self) -> bool:
+        """从共享缓存文件读取其他进程已换取的 token。"""
+        try:
+            cached = fast_json.loads(TOKEN_CACHE_FILE.read_bytes())
+        except (OSError, ValueError):
+            return False
+        if not isinstance(cached, dict) or cached.get("key") != self._token_cache_key():
+            return False
+        if not cached.get("token"):
+            return False
+        self._token = cached["token"]
+        self._token_expire_ts = float(cached.get("exp") or 0.0)
+        return True
+
+    def _store_shared_token(self) -> None:
+        """写临时文件后原子替换，避免并发读到半截内容。"""
+        data = {"key": self._token_cache_key(), "token": self._token, "exp": self._token_expire_ts}
+        tmp_path = TOKEN_CACHE_FILE.with_name(f"{TOKEN_CACHE_FILE.name}.{os.getpid()}.tmp")
+        try:
+            TOKEN_CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path.write_text(json.dumps(data), encoding="utf-8")
+            os.replace(tmp_path, TOKEN_CACHE_FILE)
+        except OSError:
+            pass
+
     def _call_api(self, url: str, token: str, data: Dict[str, Any]) -> Dict[str, Any]:
         try:
             resp = self._session.post(
@@ -148,7 +189,7 @@ class BaiduMultipleInvoiceClient:
         except requests.RequestException as exc:
             raise BaiduMultiInvoiceException(f"请求百度多票据OCR失败: {exc}") from exc
 
-        payload = resp.json()
+        payload = fast_json.loads(resp.content)
         if "error_code" in payload:
             raise BaiduMultiInvoiceException(
                 f"Baidu multiple_invoice error {payload.get('error_code')}: {payload.get('error_msg')}"
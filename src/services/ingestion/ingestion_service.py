@@ -1,9 +1,12 @@
 """文档接入与版面分析服务。"""
 from __future__ import annotations
 
-import hashlib
 import logging
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from dataclasses import dataclass
+from operator import itemgetter
 from pathlib import Path
 from typing import Any, Dict, List, Tuple
 
@@ -12,7 +15,7 @@ from PIL import Image, ImageOps
 
 from config import DATA_DIR, get_settings
 from models.schemas import DocumentPayload
-from utils.file_ops import save_base64_file
+from utils.file_ops import save_base64_file_with_digest
 
 try:  # 可选依赖，缺失时自动跳过区域检测
     import cv2  # type: ignore
@@ -21,8 +24,23 @@ except Exception:  # noqa: BLE001
     cv2 = None
     np = None
 
+try:  # pdfplumber 本身依赖 pypdfium2，直接调用原生渲染可跳过 pdfplumber 的图像封装
+    import pypdfium2 as pdfium  # type: ignore
+except Exception:  # noqa: BLE001
+    pdfium = None
+
 logger = logging.getLogger(__name__)
 
+# PDF 页面渲染分辨率
+PDF_RENDER_DPI = 200
+
+# pdfplumber extract_words 结果中需要的字段
+_WORD_FIELDS = itemgetter("text", "x0", "top", "x1", "bottom")
+
+# 页面预处理与区域检测的线程池，进程内所有文档共用；工作线程长期存活，
+# 各线程缓存的 QRCodeDetector 因而能跨文档复用
+_PAGE_EXECUTOR = ThreadPoolExecutor(max_workers=min(os.cpu_count() or 1, 8), thread_name_prefix="ingest-page")
+
 
 @dataclass
 class PageSlice:
@@ -43,18 +61,36 @@ class PageSlice:
 class DocumentIngestionService:
     """负责接收原始票据、执行版面预处理、产出OCR就绪输入。"""
 
+    # 红章 HSV 阈值：红色 Hue 分布在 0-10 与 160-179 两段
+    RED_HUE_LOW_MAX = 10
+    RED_HUE_HIGH_MIN = 160
+    RED_SAT_MIN = 80
+    RED_VAL_MIN = 80
+
     def __init__(self) -> None:
         self.settings = get_settings()
         self.page_output_dir = DATA_DIR / "output" / "pages"
         self.page_output_dir.mkdir(parents=True, exist_ok=True)
+        if cv2 is not None:
+            # 形态学结构元素只构建一次，各页复用
+            self._kern_table_h = cv2.getStructuringElement(cv2.MORPH_RECT, (40, 1))
+            self._kern_table_v = cv2.getStructuringElement(cv2.MORPH_RECT, (1, 40))
+            self._kern_table_merge = cv2.getStructuringElement(cv2.MORPH_RECT, (15, 15))
+            self._kern_seal_open = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
+            self._kern_seal_merge = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (7, 7))
+        # QRCodeDetector 内部状态非线程安全，_PAGE_EXECUTOR 的每个工作线程各缓存一个实例
+        self._qr_local = threading.local()
 
     def ingest(self, payload: DocumentPayload) -> Dict[str, Any]:
         """入口：接收base64，落地文件，生成 per-page 图像与基础版面信息。"""
         document_id = payload.document_id()
         try:
-            file_path = save_base64_file(payload.file_name, payload.file_content_base64, sub_dir="input")
-            file_hash = hashlib.md5(file_path.read_bytes()).hexdigest()  # noqa: S324
-        except Exception as exc:  # noqa: BLE001
+            file_path, file_hash = save_base64_file_with_digest(
+                payload.file_name, payload.file_content_base64, sub_dir="input"
+            )
+        # 只把磁盘错误与非法 base64（binascii.Error 属于 ValueError）视为保存失败；
+        # 其他异常多为代码或运行环境问题，直接抛出，避免每次上传都被静默记为 save_failed
+        except (OSError, ValueError) as exc:
             logger.exception("保存上传文件失败")
             return {"document_id": document_id, "error": f"save_failed: {exc}"}
 
@@ -78,7 +114,7 @@ class DocumentIngestionService:
                 "document_id": document_id,
                 "file_path": str(file_path),
                 "extension": extension,
-                "file_hash_md5": file_hash,
+                "file_hash_b2b": file_hash,
                 "meta": payload.meta,
             }
         )
@@ -93,68 +129,65 @@ class DocumentIngestionService:
         landscape_pages = 0
         has_table = False
 
-        with pdfplumber.open(file_path) as pdf:
-            for index, page in enumerate(pdf.pages):
-                text = page.extract_text(x_tolerance=2, y_tolerance=2) or ""
-                text_blocks.append(text)
-
-                # 轻量判定扫描件
-                is_scan = len(text.strip()) < 20
-                if is_scan:
-                    scanned_pages += 1
-
-                # 版式属性
-                if page.width > page.height:
-                    landscape_pages += 1
-                if not has_table:
-                    try:
-                        has_table = bool(page.extract_tables())
-                    except Exception:
-                        has_table = False
-
-                # 渲染为图像并做预处理
-                page_image = page.to_image(resolution=200).original
-                processed, rotation = self._preprocess_image(page_image)
-                image_path = self._save_page_image(processed, file_path.stem, index + 1, document_id)
-
-                words = page.extract_words() or []
-                regions = self._detect_regions(processed)
-
-                structured_text_blocks.append(
-                    {
-                        "page_number": index + 1,
-                        "text": text,
-                        "words": [
-                            {
-                                "text": w.get("text", ""),
-                                "bbox": {
-                                    "x0": float(w.get("x0", 0.0)),
-                                    "y0": float(w.get("top", 0.0)),
-                                    "x1": float(w.get("x1", 0.0)),
-                                    "y1": float(w.get("bottom", 0.0)),
-                                },
-                            }
-                            for w in words
-                        ],
-                    }
-                )
+        # PDF 解析与渲染库非线程安全，按页顺序执行；渲染后的预处理、落盘与区域检测
+        # 为 CPU 密集且页间独立（OpenCV/Pillow 计算期间释放 GIL），交给线程池并行
+        pdfium_doc = self._open_pdfium(file_path)
+        page_jobs: List[Tuple[int, float, float, bool, str, Future]] = []
+        try:
+            with pdfplumber.open(file_path) as pdf:
+                for index, page in enumerate(pdf.pages):
+                    text = page.extract_text(x_tolerance=2, y_tolerance=2) or ""
+                    text_blocks.append(text)
+
+                    # 轻量判定扫描件
+                    is_scan = len(text.strip()) < 20
+                    if is_scan:
+                        scanned_pages += 1
+
+                    # 版式属性
+                    if page.width > page.height:
+                        landscape_pages += 1
+                    if not has_table:
+                        try:
+                            has_table = bool(page.extract_tables())
+                        except Exception:
+                            has_table = False
+
+                    # 渲染为图像，预处理等后续步骤提交到线程池
+                    page_image = self._render_pdf_page(pdfium_doc, page, index)
+                    future = _PAGE_EXECUTOR.submit(
+                        self._handle_page_image, page_image, file_path.stem, index + 1, document_id, is_scan
+                    )
+                    page_jobs.append((index, page.width, page.height, is_scan, text, future))
 
-                pages.append(
-                    PageSlice(
-                        page_number=index + 1,
-                        width=page.width,
-                        height=page.height,
-                        bbox={"x0": 0, "y0": 0, "x1": page.width, "y1": page.height},
-                        content_pointer=f"{file_path.name}#page={index+1}",
-                        image_path=str(image_path),
-                        rotation=rotation,
-                        is_scan=is_scan,
-                        text=text,
-                        tables=regions["tables"],
-                        seals=regions["seals"],
-                        qrcodes=regions["qrcodes"],
+                    words = page.extract_words() or []
+                    structured_text_blocks.append(
+                        {"page_number": index + 1, "text": text, "words": self._build_word_boxes(words)}
                     )
-                )
+
+                for index, width, height, is_scan, text, future in page_jobs:
+                    image_path, rotation, regions = future.result()
+                    pages.append(
+                        PageSlice(
+                            page_number=index + 1,
+                            width=width,
+                            height=height,
+                            bbox={"x0": 0, "y0": 0, "x1": width, "y1": height},
+                            content_pointer=f"{file_path.name}#page={index+1}",
+                            image_path=str(image_path),
+                            rotation=rotation,
+                            is_scan=is_scan,
+                            text=text,
+                            tables=regions["tables"],
+                            seals=regions["seals"],
+                            qrcodes=regions["qrcodes"],
+                        )
+                    )
+        finally:
+            # 线程池为共享的长期实例，异常退出时也要等已提交的页面处理完再关闭文档
+            wait([job[-1] for job in page_jobs])
+            if pdfium_doc is not None:
+                pdfium_doc.close()
 
         layout_summary = {
             "page_count": len(pages),
@@ -173,6 +206,62 @@ class DocumentIngestionService:
             "layout": layout_summary,
         }
 
+    def _handle_page_image(
+        self, page_image: Image.Image, stem: str, page_number: int, document_id: str, is_scan: bool
+    ) -> Tuple[Path, int, Dict[str, List[Dict[str, float]]]]:
+        """单页图像处理：预处理、保存 JPEG、区域检测（仅扫描页）。"""
+        processed, rotation = self._preprocess_image(page_image)
+        image_path = self._save_page_image(processed, stem, page_number, document_id)
+        # 有文本层的原生 PDF 页已由 pdfplumber 给出表格信息，跳过整套像素级检测
+        if is_scan:
+            regions = self._detect_regions(processed)
+        else:
+            regions = {"tables": [], "seals": [], "qrcodes": []}
+        return image_path, rotation, regions
+
+    @staticmethod
+    def _build_word_boxes(words: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """批量转换 pdfplumber 单词框；itemgetter 在 C 层一次取出全部字段。"""
+        try:
+            return [
+                {"text": text, "bbox": {"x0": float(x0), "y0": float(top), "x1": float(x1), "y1": float(bottom)}}
+                for text, x0, top, x1, bottom in map(_WORD_FIELDS, words)
+            ]
+        except (KeyError, TypeError, ValueError):
+            # 字段缺失时逐个容错
+            return [
+                {
+                    "text": w.get("text", ""),
+                    "bbox": {
+                        "x0": float(w.get("x0", 0.0)),
+                        "y0": float(w.get("top", 0.0)),
+                        "x1": float(w.get("x1", 0.0)),
+                        "y1": float(w.get("bottom", 0.0)),
+                    },
+                }
+                for w in words
+            ]
+
+    @staticmethod
+    def _open_pdfium(file_path: Path):
+        if pdfium is None:
+            return None
+        try:
+            return pdfium.PdfDocument(str(file_path))
+        except Exception:  # noqa: BLE001
+            logger.warning("pypdfium2 打开 PDF 失败，回退 pdfplumber 渲染: %s", file_path)
+            return None
+
+    @staticmethod
+    def _render_pdf_page(pdfium_doc, page, index: int) -> Image.Image:
+        """优先用 pypdfium2 原生渲染页面，失败时回退 pdfplumber.to_image。"""
+        if pdfium_doc is not None:
+            try:
+                return pdfium_doc[index].render(scale=PDF_RENDER_DPI / 72).to_pil()
+            except Exception:  # noqa: BLE001
+                logger.debug("pypdfium2 渲染第 %s 页失败，回退 pdfplumber", index + 1)
+        return page.to_image(resolution=PDF_RENDER_DPI).original
+
     def _process_image(self, file_path: Path, document_id: str) -> Dict[str, Any]:
         raw_image = Image.open(file_path)
         processed, rotation = self._preprocess_image(raw_image)
@@ -259,6 +348,13 @@ class DocumentIngestionService:
             return image
         scale = max_edge / long_edge
         new_size = (int(width * scale), int(height * scale))
+        if cv2 is not None and np is not None:
+            # OpenCV INTER_AREA 缩小走 SIMD 内核，明显快于 Pillow LANCZOS
+            try:
+                resized = cv2.resize(np.asarray(image), new_size, interpolation=cv2.INTER_AREA)
+                return Image.fromarray(resized)
+            except Exception:  # noqa: BLE001
+                pass
         return image.resize(new_size, Image.Resampling.LANCZOS)
 
     def _save_page_image(self, image: Image.Image, stem: str, page_number: int, document_id: str) -> Path:
@@ -285,16 +381,17 @@ class DocumentIngestionService:
     def _detect_tables(self, bgr: "np.ndarray") -> List[Dict[str, float]]:
         """基于形态学的简易表格区域检测，返回若干大致矩形。"""
         gray = cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY)
-        _, bin_img = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+        h, w = gray.shape
+        # 中间结果尽量写回已有缓冲区（dst=），减少整页大小的临时数组分配
+        _, bin_img = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU, dst=gray)
         # 强化横纵线
-        horiz = cv2.morphologyEx(bin_img, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (40, 1)))
-        vert = cv2.morphologyEx(bin_img, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (1, 40)))
-        mask = cv2.add(horiz, vert)
+        horiz = cv2.morphologyEx(bin_img, cv2.MORPH_OPEN, self._kern_table_h)
+        vert = cv2.morphologyEx(bin_img, cv2.MORPH_OPEN, self._kern_table_v)
+        mask = cv2.add(horiz, vert, dst=horiz)
         # 膨胀合并为区域
-        mask = cv2.dilate(mask, cv2.getStructuringElement(cv2.MORPH_RECT, (15, 15)), iterations=1)
+        mask = cv2.dilate(mask, self._kern_table_merge, dst=vert, iterations=1)
         contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
 
-        h, w = gray.shape
         regions: List[Dict[str, float]] = []
         for cnt in contours:
             x, y, cw, ch = cv2.boundingRect(cnt)
@@ -307,14 +404,17 @@ class DocumentIngestionService:
     def _detect_red_seals(self, bgr: "np.ndarray") -> List[Dict[str, float]]:
         """基于 HSV 的红章区域检测。"""
         hsv = cv2.cvtColor(bgr, cv2.COLOR_BGR2HSV)
-        # 红色有两段 Hue 范围
-        lower_red1 = np.array([0, 80, 80])
-        upper_red1 = np.array([10, 255, 255])
-        lower_red2 = np.array([160, 80, 80])
-        upper_red2 = np.array([179, 255, 255])
-        mask = cv2.bitwise_or(cv2.inRange(hsv, lower_red1, upper_red1), cv2.inRange(hsv, lower_red2, upper_red2))
-        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5)))
-        mask = cv2.dilate(mask, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (7, 7)), iterations=1)
+        # 红色有两段 Hue 范围，一次读取 HSV 合成单个掩码；布尔运算原地进行，
+        # 只保留一个整页大小的掩码缓冲区
+        h, s, v = hsv[..., 0], hsv[..., 1], hsv[..., 2]
+        mask = h <= self.RED_HUE_LOW_MAX
+        mask |= h >= self.RED_HUE_HIGH_MIN
+        mask &= s >= self.RED_SAT_MIN
+        mask &= v >= self.RED_VAL_MIN
+        mask = mask.view(np.uint8)
+        mask *= 255
+        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, self._kern_seal_open, dst=mask)
+        mask = cv2.dilate(mask, self._kern_seal_merge, dst=mask, iterations=1)
         contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
 
         h, w, _ = bgr.shape
@@ -327,9 +427,17 @@ class DocumentIngestionService:
             regions.append({"x0": float(x), "y0": float(y), "x1": float(x + cw), "y1": float(y + ch)})
         return regions
 
+    def _qr_detector(self) -> Any:
+        """返回当前线程缓存的 QRCodeDetector，首次调用时构建。"""
+        detector = getattr(self._qr_local, "detector", None)
+        if detector is None:
+            detector = cv2.QRCodeDetector()
+            self._qr_local.detector = detector
+        return detector
+
     def _detect_qrcodes(self, bgr: "np.ndarray") -> List[Dict[str, float]]:
         """使用 OpenCV QRCodeDetector 检测二维码位置。"""
-        detector = cv2.QRCodeDetector()
+        detector = self._qr_detector()
         regions: List[Dict[str, float]] = []
         try:
             retval, points = detector.detectMulti(bgr)  # type: ignore[arg-type]
@@ -1,18 +1,22 @@
 """多引擎OCR与置信度融合。"""
 from __future__ import annotations
 
-import base64
 import logging
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple
 
 import requests
+from rapidfuzz import fuzz
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from config import get_settings
 from llm_client import LLMClient
 from models.schemas import OCRSpan
 from services.ingestion.baidu_invoice_ocr import BaiduInvoiceOCRClient
 from services.ingestion.baidu_multi_invoice_ocr import BaiduMultipleInvoiceClient
+from utils import fast_json
 
 logger = logging.getLogger(__name__)
 
@@ -23,20 +27,44 @@ except Exception:  # noqa: BLE001
     cv2 = None
     np = None
 
+try:  # 可选依赖：SIMD 加速的 base64 编码，未安装时回退标准库
+    import pybase64 as _b64  # type: ignore
+except Exception:  # noqa: BLE001
+    import base64 as _b64
+
+# 倾斜角估计前的下采样长边（像素）
+SKEW_ESTIMATE_MAX_EDGE = 600
+# 发送给 OCR 引擎的图像长边上限（像素）
+OCR_MAX_EDGE = 1600
+# 本地投票：文本相似度阈值、一致加分、需 LLM 仲裁的分差
+VOTE_AGREE_RATIO = 85.0
+VOTE_AGREE_BONUS = 0.1
+VOTE_TIE_MARGIN = 0.05
+
 
 class MultiEngineOCRService:
     """
     支持：
       1. 调用多个OCR HTTP接口（逐页，优先使用渲染后的 image_path）
       2. 自动倾斜检测与旋转纠偏（OCR引擎角度优先，OpenCV 兜底）
-      3. 可选 LLM 投票融合
+      3. 本地相似度投票融合，难以区分时可选 LLM 仲裁
     """
 
     def __init__(self, llm_client: LLMClient | None = None) -> None:
         self.settings = get_settings()
         self.endpoints = self.settings.ocr_endpoints
+        self.binary_endpoints = set(self.settings.ocr_binary_endpoints)
         self.llm = llm_client
         self.use_llm = bool(llm_client and getattr(llm_client, "enabled", False))
+        # 逐页 × 逐引擎的 OCR 请求复用同一连接池，避免每次调用重新握手
+        self._session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=len(self.endpoints) + 2,
+            pool_maxsize=32,
+            max_retries=Retry(total=2, backoff_factor=0.2),
+        )
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
         try:
             self.baidu_client = BaiduInvoiceOCRClient.from_settings()
         except Exception:
@@ -55,76 +83,29 @@ class MultiEngineOCRService:
         if not self.endpoints and not self.baidu_client:
             logger.warning("OCR 未配置：缺少 OCR_ENDPOINTS 或 Baidu 凭证，返回占位文本")
 
-        for idx, page in enumerate(pages):
-            page_path = Path(page.get("image_path") or original_file)
-            image_bytes, _ = self._prepare_image_bytes(page_path)
-            candidates = []
-
-            # 优先：百度多票据智能识别，一次自动分类13类票据
-            if self.baidu_multi_client:
-                try:
-                    multi = self._request_baidu_multi(image_bytes)
-                    candidates.append(multi)
-                except Exception as exc:
-                    msg = f"Baidu multiple_invoice 调用失败: {exc}"
-                    errors.append(msg)
-                    logger.warning(msg)
-
-            for endpoint in self.endpoints:
-                try:
-                    cand = self._request_ocr(endpoint, image_bytes, page_path.name)
-                    angle = cand.pop("angle", 0.0) or 0.0
-                    if abs(angle) > 0.5:
-                        rotated_bytes = self._rotate_image_bytes(image_bytes, angle)
-                        improved = self._request_ocr(endpoint, rotated_bytes, page_path.name)
-                        improved["engine"] = cand["engine"]
-                        improved["rotation_correction"] = angle
-                        cand = improved if improved.get("confidence", 0.0) >= cand.get("confidence", 0.0) else cand
-                    candidates.append(cand)
-                except Exception:
-                    continue
-
-            if self.baidu_client:
-                try:
-                    candidates.append(self._request_baidu(image_bytes))
-                except Exception as exc:
-                    msg = f"Baidu OCR 调用失败: {exc}"
-                    errors.append(msg)
-                    logger.warning(msg)
-
-            if ingestion_payload.get("text_blocks"):
-                baseline_text = ingestion_payload["text_blocks"][min(idx, len(ingestion_payload["text_blocks"]) - 1)]
-                candidates.append({"engine": "layout-text", "text": baseline_text, "confidence": 0.45})
-
-            if not candidates:
-                if errors:
-                    logger.warning("OCR 全部候选为空，错误: %s", "; ".join(errors))
-                candidates.append(
-                    {
-                        "engine": "not_configured",
-                        "text": "未配置 OCR_ENDPOINTS 或 Baidu OCR，无法识别文本",
-                        "confidence": 0.0,
-                    }
-                )
-
-            fused = self._fuse_candidates(candidates)
-            spans = [
-                OCRSpan(
-                    text=segment.strip(),
-                    confidence=fused["confidence"],
-                    engine=fused["engine"],
-                )
-                for segment in fused["text"].split("\n")
-                if segment.strip()
-            ]
-            page_results.append(
-                {
-                    "text": fused["text"],
-                    "spans": spans,
-                    "confidence": fused["confidence"],
-                    "engine": fused["engine"],
-                }
-            )
+        # 各页、各引擎的请求彼此独立且均为网络 I/O，统一提交到线程池并发执行，
+        # 整体耗时由最慢的一次响应决定，而不是所有请求耗时之和
+        engine_count = len(self.endpoints) + bool(self.baidu_client) + bool(self.baidu_multi_client)
+        max_workers = max(1, min(32, len(pages) * engine_count))
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ocr") as executor:
+            page_tasks: List[List[Tuple[str, Future]]] = []
+            for page in pages:
+                page_path = Path(page.get("image_path") or original_file)
+                image_bytes, _ = self._prepare_image_bytes(page_path)
+                tasks: List[Tuple[str, Future]] = []
+                # 优先：百度多票据智能识别，一次自动分类13类票据
+                if self.baidu_multi_client:
+                    tasks.append(("Baidu multiple_invoice", executor.submit(self._request_baidu_multi, image_bytes)))
+                for endpoint in self.endpoints:
+                    tasks.append(
+                        ("", executor.submit(self._request_endpoint, endpoint, image_bytes, page_path.name))
+                    )
+                if self.baidu_client:
+                    tasks.append(("Baidu OCR", executor.submit(self._request_baidu, image_bytes, page_path.name)))
+                page_tasks.append(tasks)
+
+            for idx, tasks in enumerate(page_tasks):
+                page_results.append(self._collect_page(idx, tasks, ingestion_payload, errors))
 
         full_text = "\n".join(page["text"] for page in page_results)
         avg_conf = sum(page["confidence"] for page in page_results) / max(len(page_results), 1)
@@ -137,14 +118,83 @@ class MultiEngineOCRService:
             "errors": errors,
         }
 
-    def _request_ocr(self, endpoint: str, image_bytes: bytes, file_name: str) -> Dict[str, Any]:
-        payload = {
-            "file_name": file_name,
-            "content_base64": base64.b64encode(image_bytes).decode("utf-8"),
+    def _collect_page(
+        self,
+        idx: int,
+        tasks: List[Tuple[str, Future]],
+        ingestion_payload: Dict[str, Any],
+        errors: List[str],
+    ) -> Dict[str, Any]:
+        """按提交顺序收集单页各引擎结果并融合。"""
+        candidates = []
+        for label, future in tasks:
+            try:
+                candidates.append(future.result())
+            except Exception as exc:
+                # 自定义 OCR 接口失败时静默跳过，百度接口失败记录错误
+                if label:
+                    msg = f"{label} 调用失败: {exc}"
+                    errors.append(msg)
+                    logger.warning(msg)
+
+        if ingestion_payload.get("text_blocks"):
+            baseline_text = ingestion_payload["text_blocks"][min(idx, len(ingestion_payload["text_blocks"]) - 1)]
+            candidates.append({"engine": "layout-text", "text": baseline_text, "confidence": 0.45})
+
+        if not candidates:
+            if errors:
+                logger.warning("OCR 全部候选为空，错误: %s", "; ".join(errors))
+            candidates.append(
+                {
+                    "engine": "not_configured",
+                    "text": "未配置 OCR_ENDPOINTS 或 Baidu OCR，无法识别文本",
+                    "confidence": 0.0,
+                }
+            )
+
+        fused = self._fuse_candidates(candidates)
+        spans = [
+            OCRSpan(
+                text=segment.strip(),
+                confidence=fused["confidence"],
+                engine=fused["engine"],
+            )
+            for segment in fused["text"].split("\n")
+            if segment.strip()
+        ]
+        return {
+            "text": fused["text"],
+            "spans": spans,
+            "confidence": fused["confidence"],
+            "engine": fused["engine"],
         }
-        response = requests.post(endpoint, json=payload, timeout=30)
+
+    def _request_endpoint(self, endpoint: str, image_bytes: bytes, file_name: str) -> Dict[str, Any]:
+        """调用自定义 OCR 接口；返回角度明显时旋转后重试，取置信度更高的结果。"""
+        cand = self._request_ocr(endpoint, image_bytes, file_name)
+        angle = cand.pop("angle", 0.0) or 0.0
+        if abs(angle) > 0.5:
+            rotated_bytes = self._rotate_image_bytes(image_bytes, angle)
+            improved = self._request_ocr(endpoint, rotated_bytes, file_name)
+            improved["engine"] = cand["engine"]
+            improved["rotation_correction"] = angle
+            cand = improved if improved.get("confidence", 0.0) >= cand.get("confidence", 0.0) else cand
+        return cand
+
+    def _request_ocr(self, endpoint: str, image_bytes: bytes, file_name: str) -> Dict[str, Any]:
+        if endpoint in self.binary_endpoints:
+            # multipart 直接上传原始 JPEG，省去 base64 编解码与 1/3 的体积膨胀
+            response = self._session.post(
+                endpoint, files={"file": (file_name, image_bytes, "image/jpeg")}, timeout=30
+            )
+        else:
+            payload = {
+                "file_name": file_name,
+                "content_base64": _b64.b64encode(image_bytes).decode("ascii"),
+            }
+            response = self._session.post(endpoint, json=payload, timeout=30)
         response.raise_for_status()
-        data = response.json()
+        data = fast_json.loads(response.content)
         return {
             "engine": endpoint,
             "text": data.get("text", ""),
@@ -152,10 +202,10 @@ class MultiEngineOCRService:
             "angle": self._extract_angle(data),
         }
 
-    def _request_baidu(self, image_bytes: bytes) -> Dict[str, Any]:
+    def _request_baidu(self, image_bytes: bytes, file_name: str = "") -> Dict[str, Any]:
         if not self.baidu_client:
             raise RuntimeError("Baidu OCR 未配置")
-        result = self.baidu_client.recognize_smart(image_bytes)
+        result = self.baidu_client.recognize_smart(image_bytes, hint=file_name or None)
         return {"engine": result["engine"], "text": result["text"], "confidence": result.get("confidence", 0.8)}
 
     def _request_baidu_multi(self, image_bytes: bytes) -> Dict[str, Any]:
@@ -179,21 +229,37 @@ class MultiEngineOCRService:
         """返回纠偏后的 JPEG 字节与应用角度（OpenCV 兜底）。"""
         if not image_path.exists():
             return b"", 0.0
+        # 只读一次文件，解码直接基于 bytes 的零拷贝视图
+        data = image_path.read_bytes()
         if cv2 is None or np is None:
-            return image_path.read_bytes(), 0.0
+            return data, 0.0
 
         try:
-            img = cv2.imdecode(np.fromfile(str(image_path), dtype=np.uint8), cv2.IMREAD_COLOR)
+            img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
             if img is None:
-                return image_path.read_bytes(), 0.0
+                return data, 0.0
+
+            # 多数 OCR 引擎内部会缩到 1200-1600px，先行限制长边以减小请求体
+            h, w = img.shape[:2]
+            long_edge = max(h, w)
+            resized = long_edge > OCR_MAX_EDGE
+            if resized:
+                scale = OCR_MAX_EDGE / long_edge
+                img = cv2.resize(img, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
 
             angle = self._estimate_skew_angle(img)
-            if abs(angle) > 0.1:
+            rotate = abs(angle) > 0.1
+            if not rotate and not resized:
+                # 无需纠偏与缩放时原样返回，避免无意义的 JPEG 重编码
+                return data, 0.0
+            if rotate:
                 img = self._rotate_cv_image(img, angle)
+            else:
+                angle = 0.0
             ok, encoded = cv2.imencode(".jpg", img, [int(cv2.IMWRITE_JPEG_QUALITY), 85])
-            return (encoded.tobytes() if ok else image_path.read_bytes(), angle if ok else 0.0)
+            return (encoded.tobytes(), angle) if ok else (data, 0.0)
         except Exception:
-            return image_path.read_bytes(), 0.0
+            return data, 0.0
 
     def _rotate_image_bytes(self, image_bytes: bytes, angle: float) -> bytes:
         if abs(angle) < 0.1:
@@ -212,6 +278,12 @@ class MultiEngineOCRService:
             return image_bytes
 
     def _estimate_skew_angle(self, img: "np.ndarray") -> float:
+        # 先缩到 SKEW_ESTIMATE_MAX_EDGE 再估计：倾角与尺度无关，
+        # findNonZero/minAreaRect 处理的前景点数随面积下降一个数量级
+        long_edge = max(img.shape[:2])
+        if long_edge > SKEW_ESTIMATE_MAX_EDGE:
+            scale = SKEW_ESTIMATE_MAX_EDGE / long_edge
+            img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
         gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
         gray = cv2.GaussianBlur(gray, (3, 3), 0)
         _, thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
@@ -252,8 +324,15 @@ class MultiEngineOCRService:
     def _fuse_candidates(self, candidates: List[Dict[str, Any]]) -> Dict[str, Any]:
         if not candidates:
             return {"engine": "empty", "text": "", "confidence": 0.0}
-        if len(candidates) == 1 or not self.use_llm:
-            return max(candidates, key=lambda item: item.get("confidence", 0.0))
+        if len(candidates) == 1:
+            return candidates[0]
+        if not self.use_llm:
+            return self._best_candidate(candidates)
+
+        # 先本地投票：文本一致或分差明显时无需 LLM 仲裁
+        ranked = self._vote_candidates(candidates)
+        if ranked is not None:
+            return ranked
 
         prompt = "\n".join(
             f"候选{idx+1} (engine={cand['engine']}, conf={cand['confidence']:.2f}):\n{cand['text']}"
@@ -269,7 +348,49 @@ class MultiEngineOCRService:
             winner_idx = int("".join(ch for ch in reply if ch.isdigit())) - 1
             return candidates[max(0, min(winner_idx, len(candidates) - 1))]
         except Exception:
-            return max(candidates, key=lambda item: item.get("confidence", 0.0))
+            return self._best_candidate(candidates)
+
+    @staticmethod
+    def _vote_candidates(candidates: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """
+        本地确定性投票：
+          1. 归一化文本（去空白、大小写折叠）全部一致时直接取最高置信度
+          2. 否则与至少两个其它候选相似（fuzz.ratio ≥ 阈值）的候选加分
+          3. 前两名分差不足 VOTE_TIE_MARGIN 时返回 None，交由 LLM 仲裁
+        """
+        normalized = ["".join(str(cand.get("text", "")).split()).casefold() for cand in candidates]
+        if len(set(normalized)) == 1:
+            return MultiEngineOCRService._best_candidate(candidates)
+
+        count = len(candidates)
+        agreements = [0] * count
+        for i in range(count):
+            for j in range(i + 1, count):
+                if fuzz.ratio(normalized[i], normalized[j]) >= VOTE_AGREE_RATIO:
+                    agreements[i] += 1
+                    agreements[j] += 1
+
+        scores = [
+            float(cand.get("confidence", 0.0)) + (VOTE_AGREE_BONUS if agreements[idx] >= 2 else 0.0)
+            for idx, cand in enumerate(candidates)
+        ]
+        order = sorted(range(count), key=scores.__getitem__, reverse=True)
+        if scores[order[0]] - scores[order[1]] < VOTE_TIE_MARGIN:
+            return None
+        return candidates[order[0]]
+
+    @staticmethod
+    def _best_candidate(candidates: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """单次扫描取置信度最高者（并列取靠前者）；已达满分即提前返回。"""
+        best = candidates[0]
+        best_conf = best.get("confidence", 0.0)
+        for cand in candidates[1:]:
+            if best_conf >= 1.0:
+                break
+            conf = cand.get("confidence", 0.0)
+            if conf > best_conf:
+                best, best_conf = cand, conf
+        return best
 
 
 __all__ = ["MultiEngineOCRService"]
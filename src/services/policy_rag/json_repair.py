@@ -1,9 +1,52 @@
 from __future__ import annotations
 
 import json
-from typing import Any, Callable, List, Optional
+import re
+from typing import Any, Callable, Iterator, List, Optional
 
 from llm_client import LLMClient
+from utils import fast_json
+from utils.json_scan import locate_json
+
+_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$", re.MULTILINE)
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+_UNPARSED = object()
+
+
+def _matches(value: Any, expect: Optional[type]) -> bool:
+    return expect is None or isinstance(value, expect)
+
+
+def _outer_slices(raw: str) -> Iterator[str]:
+    """按出现先后，分别从第一个 [ 与第一个 { 截到与之同类的最后一个闭括号。"""
+    for start, opener in sorted((raw.find(opener), opener) for opener in "[{"):
+        if start < 0:
+            continue
+        end = raw.rfind("]" if opener == "[" else "}")
+        if end > start:
+            yield raw[start : end + 1]
+
+
+def _local_repair(raw: str, expect: Optional[type] = None) -> Any:
+    """本地修复常见问题：Markdown 代码块、前后说明文字、尾随逗号。失败或类型不符返回 _UNPARSED。"""
+    candidates: List[str] = []
+    stripped = _FENCE_RE.sub("", raw.strip())
+    candidates.append(stripped)
+    located = locate_json(stripped, allow_array=True, expect=expect)
+    if located is not None:
+        candidates.append(located)
+    for candidate in list(candidates):
+        fixed = _TRAILING_COMMA_RE.sub(r"\1", candidate)
+        if fixed != candidate:
+            candidates.append(fixed)
+    for candidate in candidates:
+        try:
+            value = json.loads(candidate)
+        except Exception:
+            continue
+        if _matches(value, expect):
+            return value
+    return _UNPARSED
 
 
 def repair_json(
@@ -12,16 +55,36 @@ def repair_json(
     schema_hint: str = "",
     logger: Optional[Callable[[str], None]] = None,
     max_len: int = 50_000,
+    expect: Optional[type] = None,
 ) -> Any:
     """
     尝试容错解析 LLM JSON 输出；失败时用 LLM 纠正，并做长度保护。
+
+    expect 为 dict 或 list 时，本地解析只接受该类型的结果，避免把 JSON 前的 "[1]" 之类引用标注当成结果。
     """
     if len(raw) > max_len:
         return []
     try:
-        return json.loads(raw)
+        value = fast_json.loads(raw)
+        if _matches(value, expect):
+            return value
     except Exception:
         pass
+    # 常见情形是 JSON 前后带说明文字：先直接截取最外层括号再严格解析，成本只有几次查找；
+    # 先出现的括号解析失败或类型不符时再试另一种括号
+    for outer in _outer_slices(raw):
+        try:
+            value = fast_json.loads(outer)
+        except Exception:
+            continue
+        if _matches(value, expect):
+            return value
+
+    # 严格解析失败（含 NaN 等 orjson 不接受的写法）交给本地修复的标准库解析兜底；
+    # 绝大多数失败是格式噪声，先本地修复，仍失败才调用 LLM
+    local = _local_repair(raw, expect)
+    if local is not _UNPARSED:
+        return local
 
     prompt_lines: List[str] = [
         "请把下面内容修复为严格合法的 JSON。",
@@ -51,9 +114,3 @@ def repair_json(
 
 
 __all__ = ["repair_json"]
-
-
-
-
-
-
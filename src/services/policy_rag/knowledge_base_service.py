@@ -1,18 +1,23 @@
 """知识库规则管理服务：增删改查 + 版本控制 + RAG 同步。"""
 from __future__ import annotations
 
+import base64
 from datetime import datetime
-import json
+import hashlib
+import threading
 from typing import Any, Dict, List, Tuple
 
-from pathlib import Path
+from sqlalchemy import Row, and_, func, or_, select
+
 from database import db_session
 from llm_client import LLMClient
 from models.db_models import PolicyRule, PolicyRuleVersion
-from models.schemas import KnowledgeRulePayload, PolicyDocument
+from models.schemas import KnowledgeRulePayload, PolicyDocument, generate_id
+from utils import fast_json
 
 from .rule_summarizer import RuleSummarizer
 from .policy_service import PolicyValidationService
+from .shadow_store import SHADOW_RULES_FILE, append_shadow_item, load_shadow_items, migrate_legacy_shadow
 
 
 def _now() -> datetime:
@@ -23,7 +28,11 @@ class KnowledgeBaseService:
     def __init__(self, llm: LLMClient, policy_service: PolicyValidationService) -> None:
         self.summarizer = RuleSummarizer(llm)
         self.policy_service = policy_service
-        self.shadow_path = Path(__file__).with_name("shadow_rules.json")
+        self.shadow_path = SHADOW_RULES_FILE
+        migrate_legacy_shadow(self.shadow_path)
+        # 向量索引中每条记录（key）对应的内容哈希，用于增量同步
+        self._vector_hashes: Dict[str, str] = {}
+        self._vector_lock = threading.Lock()
 
     # ------------- 查询接口 -------------
     def list_rules(
@@ -32,9 +41,15 @@ class KnowledgeBaseService:
         category: str | None = None,
         page: int = 1,
         page_size: int = 10,
+        cursor: str | None = None,
     ) -> Dict[str, Any]:
+        """
+        分页查询规则。传入 cursor（上一页返回的 next_cursor）时走键集分页：
+        按 (updated_at, id) 定位，代价与页深无关，此时不返回 total。
+        """
         page = max(1, page)
         page_size = max(1, min(50, page_size))
+        ordering = (PolicyRule.updated_at.desc(), PolicyRule.id.desc())
         with db_session() as session:
             query = session.query(PolicyRule).filter(PolicyRule.status != "deleted")
             if q:
@@ -42,20 +57,64 @@ class KnowledgeBaseService:
                 query = query.filter((PolicyRule.title.ilike(like)) | (PolicyRule.content.ilike(like)))
             if category:
                 query = query.filter(PolicyRule.category == category)
-            total = query.count()
-            rules = (
-                query.order_by(PolicyRule.updated_at.desc())
-                .offset((page - 1) * page_size)
-                .limit(page_size)
-                .all()
-            )
+
+            total: int | None
+            if cursor:
+                cursor_ts, cursor_id = self._decode_cursor(cursor)
+                rules = (
+                    query.filter(
+                        or_(
+                            PolicyRule.updated_at < cursor_ts,
+                            and_(PolicyRule.updated_at == cursor_ts, PolicyRule.id < cursor_id),
+                        )
+                    )
+                    .order_by(*ordering)
+                    .limit(page_size + 1)
+                    .all()
+                )
+                has_more = len(rules) > page_size
+                rules = rules[:page_size]
+                total = None
+            else:
+                # 总数用窗口函数随分页结果一并返回，省去单独的 COUNT 扫描
+                rows = (
+                    query.add_columns(func.count().over().label("total"))
+                    .order_by(*ordering)
+                    .offset((page - 1) * page_size)
+                    .limit(page_size)
+                    .all()
+                )
+                if rows:
+                    total = rows[0][1]
+                else:
+                    # 页码越界时窗口函数无行可依附，才退回单独计数
+                    total = query.count() if page > 1 else 0
+                rules = [rule for rule, _ in rows]
+                has_more = total > page * page_size
             return {
                 "items": [self._to_dict(rule) for rule in rules],
                 "total": total,
                 "page": page,
                 "page_size": page_size,
+                "next_cursor": self._encode_cursor(rules[-1]) if has_more and rules else None,
             }
 
+    @staticmethod
+    def _encode_cursor(rule: PolicyRule) -> str | None:
+        if rule.updated_at is None:
+            return None
+        raw = f"{rule.updated_at.isoformat()}|{rule.id}"
+        return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+    @staticmethod
+    def _decode_cursor(cursor: str) -> Tuple[datetime, str]:
+        try:
+            raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+            ts, rule_id = raw.split("|", 1)
+            return datetime.fromisoformat(ts), rule_id
+        except Exception as exc:
+            raise ValueError("无效的分页游标") from exc
+
     def get_rule(self, rule_id: str) -> Dict[str, Any] | None:
         with db_session() as session:
             rule = session.query(PolicyRule).filter(PolicyRule.id == rule_id).first()
@@ -122,10 +181,12 @@ class KnowledgeBaseService:
                 created_at=_now(),
             )
             session.add(version)
+        # expire_on_commit=False，提交后直接由内存对象构建返回值，无需再查库
+        result = self._to_dict(rule)
         # 同步向量索引
-        self.refresh_vector_store()
+        self._sync_rule_vector(rule)
         self._append_shadow_rule(rule)
-        return self.get_rule(rule.id) or {}
+        return result
 
     def update_rule(self, rule_id: str, payload: KnowledgeRulePayload, user_id: str | None = None) -> Dict[str, Any]:
         with db_session() as session:
@@ -159,97 +220,171 @@ class KnowledgeBaseService:
                 created_at=_now(),
             )
             session.add(version)
-        self.refresh_vector_store()
-        return self.get_rule(rule_id) or {}
+        result = self._to_dict(rule)
+        self._sync_rule_vector(rule)
+        return result
 
-    def refresh_vector_store(self) -> Dict[str, Any]:
-        """将知识库规则同步到向量索引，同时加入影子规则；跳过 LLM 摘要，直接用已有 summary。"""
-        texts: List[str] = []
-        metas: List[dict] = []
+    def refresh_vector_store(self, force: bool = False, session: Any = None) -> Dict[str, Any]:
+        """
+        将知识库规则同步到向量索引，同时加入影子规则；跳过 LLM 摘要，直接用已有 summary。
+        默认按内容哈希增量同步，只重新嵌入新增/变更的规则；force=True 时清空重建。
+        传入 session 时在调用方的会话内读取规则，不再另开连接。
+        """
+        entries = self._collect_vector_entries(session)
+        store = self.policy_service.store
+        batch_size = self.policy_service.settings.embedding_batch_size
 
-        with db_session() as session:
-            rules = session.query(PolicyRule).filter(PolicyRule.status == "active").all()
-            for r in rules:
-                summary = r.summary or r.content
-                texts.append(summary)
-                metas.append(
-                    {
-                        "title": r.title,
-                        "content": r.content,
-                        "summary": summary,
-                        "description": summary,
-                        "source": "policy",
-                        **(r.tags or {}),
-                        "risk_tags": r.risk_tags or {},
-                        "scope": r.scope or {},
-                    }
+        with self._vector_lock:
+            indexed = store.keys()
+            # 存在无 key 的记录（如直接上传的政策）时无法增量比对，沿用整体重建
+            if force or len(indexed) != len(store.records):
+                store.clear()
+                self._vector_hashes.clear()
+                indexed = set()
+
+            removed = [key for key in indexed if key not in entries]
+            changed = [
+                key
+                for key, (_text, _meta, digest) in entries.items()
+                if key not in indexed or self._vector_hashes.get(key) != digest
+            ]
+            store.delete(removed)
+            for key in removed:
+                self._vector_hashes.pop(key, None)
+            if changed:
+                store.upsert(
+                    changed,
+                    (entries[key][0] for key in changed),
+                    (entries[key][1] for key in changed),
+                    batch_size=batch_size,
                 )
+                for key in changed:
+                    self._vector_hashes[key] = entries[key][2]
+        return {"count": len(entries), "upserted": len(changed), "removed": len(removed)}
+
+    def _collect_vector_entries(self, session: Any = None) -> Dict[str, Tuple[str, dict, str]]:
+        """收集待索引的规则与影子规则：key -> (文本, 元数据, 内容哈希)。"""
+        entries: Dict[str, Tuple[str, dict, str]] = {}
+
+        if session is None:
+            with db_session() as own_session:
+                return self._collect_vector_entries(own_session)
+        # 只取建索引所需的列，避免整行 ORM 对象水合
+        rows = session.execute(
+            select(
+                PolicyRule.id,
+                PolicyRule.title,
+                PolicyRule.content,
+                PolicyRule.summary,
+                PolicyRule.tags,
+                PolicyRule.risk_tags,
+                PolicyRule.scope,
+            ).where(PolicyRule.status == "active")
+        )
+        entries.update(self._rule_entry(row) for row in rows)
+
+        # 加入 shadow_rules.jsonl（仅追加写入，下标稳定）
+        for idx, item in enumerate(load_shadow_items(self.shadow_path)):
+            summary = item.get("summary") or item.get("content") or ""
+            content = item.get("content") or summary
+            meta = {
+                "title": item.get("title", "shadow_rule"),
+                "content": content,
+                "summary": summary,
+                "description": summary,
+                "source": "shadow_rule",
+                "expense_type": item.get("expense_type") or [],
+                "scene": item.get("scene") or [],
+                "city_level": item.get("city_level") or "",
+            }
+            entries[f"shadow:{idx}"] = (summary, meta, self._content_hash(summary, meta))
+        return entries
+
+    def _rule_entry(self, rule: PolicyRule | Row) -> Tuple[str, Tuple[str, dict, str]]:
+        """规则 -> (key, (文本, 元数据, 内容哈希))；ORM 对象与列查询行均可。"""
+        summary = rule.summary or rule.content
+        meta = {
+            "title": rule.title,
+            "content": rule.content,
+            "summary": summary,
+            "description": summary,
+            "source": "policy",
+            **(rule.tags or {}),
+            "risk_tags": rule.risk_tags or {},
+            "scope": rule.scope or {},
+        }
+        return f"policy:{rule.id}", (summary, meta, self._content_hash(summary, meta))
 
-        # 加入 shadow_rules.json
-        if self.shadow_path.exists():
-            try:
-                data = json.loads(self.shadow_path.read_text(encoding="utf-8"))
-                for item in data if isinstance(data, list) else []:
-                    summary = item.get("summary") or item.get("content") or ""
-                    content = item.get("content") or summary
-                    texts.append(summary)
-                    metas.append(
-                        {
-                            "title": item.get("title", "shadow_rule"),
-                            "content": content,
-                            "summary": summary,
-                            "description": summary,
-                            "source": "shadow_rule",
-                            "expense_type": item.get("expense_type") or [],
-                            "scene": item.get("scene") or [],
-                            "city_level": item.get("city_level") or "",
-                        }
+    def _sync_rule_vector(self, rule: PolicyRule) -> None:
+        """单条规则写入后只更新其自身向量；索引状态无法增量比对时回退到全量同步。"""
+        store = self.policy_service.store
+        with self._vector_lock:
+            consistent = bool(self._vector_hashes) and len(store.keys()) == len(store.records)
+            if consistent:
+                key, (text, meta, digest) = self._rule_entry(rule)
+                if self._vector_hashes.get(key) != digest:
+                    store.upsert(
+                        [key], [text], [meta], batch_size=self.policy_service.settings.embedding_batch_size
                     )
-            except Exception:
-                pass
+                    self._vector_hashes[key] = digest
+                return
+        self.refresh_vector_store()
 
-        self.policy_service.store.clear()
-        if texts:
-            self.policy_service.store.add_texts(texts, metas)
-        return {"count": len(texts)}
+    def _remove_rule_vectors(self, rule_ids: List[str]) -> None:
+        """规则删除后直接移除其向量，无需重读全部规则；索引状态无法增量比对时回退全量同步。"""
+        store = self.policy_service.store
+        with self._vector_lock:
+            if self._vector_hashes and len(store.keys()) == len(store.records):
+                keys = [f"policy:{rule_id}" for rule_id in rule_ids]
+                store.delete(keys)
+                for key in keys:
+                    self._vector_hashes.pop(key, None)
+                return
+        self.refresh_vector_store()
+
+    @staticmethod
+    def _content_hash(text: str, meta: dict) -> str:
+        return hashlib.sha256(fast_json.dumps_bytes([text, meta], sort_keys=True)).hexdigest()
 
     def delete_rules(self, ids: List[str]) -> Dict[str, Any]:
         if not ids:
             return {"deleted": 0}
-        deleted = 0
+        deleted_ids: List[str] = []
         with db_session() as session:
             rules = session.query(PolicyRule).filter(PolicyRule.id.in_(ids)).all()
             for r in rules:
                 r.status = "deleted"
                 r.updated_at = _now()
                 session.add(r)
-                deleted += 1
-        if deleted:
-            self.refresh_vector_store()
-        return {"deleted": deleted}
+                deleted_ids.append(r.id)
+        if deleted_ids:
+            self._remove_rule_vectors(deleted_ids)
+        return {"deleted": len(deleted_ids)}
 
     def seed_shadow_rules(self) -> Dict[str, Any]:
-        """读取 shadow_rules.json，将不存在的规则写入数据库。"""
-        if not self.shadow_path.exists():
-            return {"imported": 0}
-        data = []
-        try:
-            data = json.loads(self.shadow_path.read_text(encoding="utf-8"))
-        except Exception:
+        """读取 shadow_rules.jsonl，将不存在的规则写入数据库。"""
+        data = load_shadow_items(self.shadow_path)
+        if not data:
             return {"imported": 0}
-        imported = 0
+        ids = [item["id"] for item in data if item.get("id")]
+        titles = [item["title"] for item in data if item.get("title")]
+        rules: List[PolicyRule] = []
+        versions: List[PolicyRuleVersion] = []
         with db_session() as session:
-            for item in data if isinstance(data, list) else []:
+            # 一次查询取回已存在的 id/标题，避免逐条 SELECT + flush
+            existing = (
+                session.query(PolicyRule.id, PolicyRule.title)
+                .filter(or_(PolicyRule.id.in_(ids), PolicyRule.title.in_(titles)))
+                .all()
+            )
+            seen_ids = {row.id for row in existing}
+            seen_titles = {row.title for row in existing}
+            for item in data:
                 title = item.get("title")
                 content = item.get("content") or item.get("summary") or ""
                 if not title or not content:
                     continue
-                exists = (
-                    session.query(PolicyRule)
-                    .filter((PolicyRule.id == item.get("id")) | (PolicyRule.title == title))
-                    .first()
-                )
-                if exists:
+                if item.get("id") in seen_ids or title in seen_titles:
                     continue
                 payload = KnowledgeRulePayload(
                     title=title,
@@ -262,42 +397,49 @@ class KnowledgeBaseService:
                     change_note="导入影子规则",
                 )
                 summary, tags, risk_tags, scope = self._prepare_rule(payload)
-                rule = PolicyRule(
-                    id=item.get("id") or None,
-                    title=payload.title,
-                    content=payload.content,
-                    summary=summary,
-                    category=payload.category,
-                    tags=tags,
-                    risk_tags=risk_tags,
-                    scope=scope,
-                    status="active",
-                    version=1,
-                    created_by="shadow_seed",
-                    updated_by="shadow_seed",
-                    created_at=_now(),
-                    updated_at=_now(),
+                # 预先生成主键，规则与版本记录可在提交时一次性批量写入
+                rule_id = item.get("id") or generate_id("rule")
+                seen_ids.add(rule_id)
+                seen_titles.add(title)
+                rules.append(
+                    PolicyRule(
+                        id=rule_id,
+                        title=payload.title,
+                        content=payload.content,
+                        summary=summary,
+                        category=payload.category,
+                        tags=tags,
+                        risk_tags=risk_tags,
+                        scope=scope,
+                        status="active",
+                        version=1,
+                        created_by="shadow_seed",
+                        updated_by="shadow_seed",
+                        created_at=_now(),
+                        updated_at=_now(),
+                    )
                 )
-                session.add(rule)
-                session.flush()
-                version = PolicyRuleVersion(
-                    rule_id=rule.id,
-                    version=1,
-                    title=rule.title,
-                    content=rule.content,
-                    summary=rule.summary,
-                    category=rule.category,
-                    risk_tags=rule.risk_tags,
-                    scope=rule.scope,
-                    change_note="导入影子规则",
-                    created_by="shadow_seed",
-                    created_at=_now(),
+                versions.append(
+                    PolicyRuleVersion(
+                        rule_id=rule_id,
+                        version=1,
+                        title=payload.title,
+                        content=payload.content,
+                        summary=summary,
+                        category=payload.category,
+                        risk_tags=risk_tags,
+                        scope=scope,
+                        change_note="导入影子规则",
+                        created_by="shadow_seed",
+                        created_at=_now(),
+                    )
                 )
-                session.add(version)
-                imported += 1
-        if imported:
+            session.add_all(rules)
+            session.add_all(versions)
+        # 与其他写路径一致，提交成功后再同步索引，避免提交失败时索引里残留未落库的规则
+        if rules:
             self.refresh_vector_store()
-        return {"imported": imported}
+        return {"imported": len(rules)}
 
     # ------------- 辅助方法 -------------
     def _prepare_rule(self, payload: KnowledgeRulePayload) -> Tuple[str, Dict[str, Any], Dict[str, Any], Dict[str, Any]]:
@@ -340,15 +482,10 @@ class KnowledgeBaseService:
         return []
 
     def _append_shadow_rule(self, rule: PolicyRule) -> None:
-        """追加规则到 shadow_rules.json，保持模板字段。"""
+        """追加规则到 shadow_rules.jsonl（单行追加），保持模板字段。"""
         if not self.shadow_path:
             return
         try:
-            payload = []
-            if self.shadow_path.exists():
-                payload = json.loads(self.shadow_path.read_text(encoding="utf-8"))
-            if not isinstance(payload, list):
-                payload = []
             tag_items = []
             if isinstance(rule.tags, dict) and isinstance(rule.tags.get("items"), list):
                 tag_items = rule.tags["items"]
@@ -358,7 +495,8 @@ class KnowledgeBaseService:
             scope_items = []
             if isinstance(rule.scope, dict) and isinstance(rule.scope.get("items"), list):
                 scope_items = rule.scope["items"]
-            payload.append(
+            append_shadow_item(
+                self.shadow_path,
                 {
                     "id": rule.id,
                     "title": rule.title,
@@ -370,9 +508,8 @@ class KnowledgeBaseService:
                     "funding_scope": [],
                     "risk_tags": risk_items,
                     "severity_default": "MEDIUM",
-                }
+                },
             )
-            self.shadow_path.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
         except Exception:
             pass
 
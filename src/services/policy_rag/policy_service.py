@@ -1,18 +1,22 @@
 """基于RAG的政策校验模块，最小侵入增强版。"""
 from __future__ import annotations
 
-import json
+import hashlib
+import threading
+import time
+from collections import OrderedDict
 from dataclasses import dataclass
-from pathlib import Path
 from typing import Any, Dict, List, Tuple
 
 from config import get_settings
 from llm_client import LLMClient
 from models.schemas import PolicyDocument, PolicyFlag
 from repositories.vector_store import VectorStore
+from utils import fast_json
 
 from .rag_retriever import RAGRetriever
 from .rule_summarizer import RuleSummarizer
+from .shadow_store import SHADOW_RULES_FILE, load_shadow_items, migrate_legacy_shadow
 from .two_stage_llm import TwoStageLLM
 
 
@@ -25,6 +29,14 @@ class PolicyValidationDebugResult:
 
 
 class PolicyValidationService:
+    # 校验结果缓存：同内容单据重复校验时跳过检索与 LLM；索引变化后自动失效
+    VALIDATION_CACHE_SIZE = 1024
+    VALIDATION_CACHE_TTL = 3600.0
+    # 不影响校验结论、每张单据都不同的字段
+    VOLATILE_FIELDS = ("document_id",)
+    # 批量校验时单次 LLM 调用最多打包的票据数
+    VALIDATION_BATCH_SIZE = 8
+
     def __init__(self, vector_store: VectorStore, llm_client: LLMClient) -> None:
         self.settings = get_settings()
         self.store = vector_store
@@ -36,18 +48,15 @@ class PolicyValidationService:
             enable_query_rewrite=getattr(self.settings, "enable_policy_query_rewrite", False),
         )
         self.two_stage = TwoStageLLM(llm_client)
-        self.shadow_path = Path(__file__).with_name("shadow_rules.json")
+        self.shadow_path = SHADOW_RULES_FILE
+        migrate_legacy_shadow(self.shadow_path)
+        self._validation_cache: "OrderedDict[str, Tuple[float, List[PolicyFlag]]]" = OrderedDict()
+        self._validation_cache_lock = threading.Lock()
 
     def _load_shadow_rules(self) -> Tuple[List[str], List[dict]]:
-        if not self.shadow_path.exists():
-            return [], []
-        try:
-            data = json.loads(self.shadow_path.read_text(encoding="utf-8"))
-        except Exception:
-            return [], []
         texts: List[str] = []
         metas: List[dict] = []
-        for item in data if isinstance(data, list) else []:
+        for item in load_shadow_items(self.shadow_path):
             summary = item.get("summary") or item.get("content") or ""
             content = item.get("content") or summary
             tags = {
@@ -93,12 +102,75 @@ class PolicyValidationService:
         if not self.settings.enable_policy_rag or not self.store.records:
             return []
 
+        key = self._validation_key(document_payload)
+        cached = self._validation_cache_get(key)
+        if cached is not None:
+            return cached
+
         context_text, _hits = self.retriever.retrieve(document_payload)
         if not context_text:
             return []
 
         flags_raw, _ = self.two_stage.generate_flags_with_reasoning(context_text, document_payload)
-        return self._to_flags(flags_raw)
+        flags = self._to_flags(flags_raw)
+        self._validation_cache_put(key, flags)
+        return flags
+
+    def validate_batch(self, document_payloads: List[Dict[str, Any]]) -> List[List[PolicyFlag]]:
+        """批量校验：检索到相同规则上下文的票据合并为一次 LLM 调用，结果按输入顺序返回。"""
+        results: List[List[PolicyFlag]] = [[] for _ in document_payloads]
+        if not self.settings.enable_policy_rag or not self.store.records:
+            return results
+
+        # context_text -> [(位置, 缓存键, payload)]
+        groups: Dict[str, List[Tuple[int, str, Dict[str, Any]]]] = {}
+        for pos, payload in enumerate(document_payloads):
+            key = self._validation_key(payload)
+            cached = self._validation_cache_get(key)
+            if cached is not None:
+                results[pos] = cached
+                continue
+            context_text, _hits = self.retriever.retrieve(payload)
+            if context_text:
+                groups.setdefault(context_text, []).append((pos, key, payload))
+
+        size = self.VALIDATION_BATCH_SIZE
+        for context_text, members in groups.items():
+            for start in range(0, len(members), size):
+                chunk = members[start : start + size]
+                batch_raw = self.two_stage.generate_flags_batch(context_text, [payload for _, _, payload in chunk])
+                for (pos, key, _payload), flags_raw in zip(chunk, batch_raw):
+                    flags = self._to_flags(flags_raw)
+                    self._validation_cache_put(key, flags)
+                    results[pos] = flags
+        return results
+
+    def _validation_key(self, document_payload: Dict[str, Any]) -> str:
+        stable = {k: v for k, v in document_payload.items() if k not in self.VOLATILE_FIELDS}
+        digest = hashlib.blake2b(fast_json.dumps_bytes(stable, sort_keys=True), digest_size=16).hexdigest()
+        return f"{self.store.version}:{digest}"
+
+    def _validation_cache_get(self, key: str) -> List[PolicyFlag] | None:
+        with self._validation_cache_lock:
+            cached = self._validation_cache.get(key)
+            if cached is None:
+                return None
+            expires_at, flags = cached
+            if expires_at < time.monotonic():
+                del self._validation_cache[key]
+                return None
+            self._validation_cache.move_to_end(key)
+        return [flag.model_copy() for flag in flags]
+
+    def _validation_cache_put(self, key: str, flags: List[PolicyFlag]) -> None:
+        with self._validation_cache_lock:
+            self._validation_cache[key] = (
+                time.monotonic() + self.VALIDATION_CACHE_TTL,
+                [flag.model_copy() for flag in flags],
+            )
+            self._validation_cache.move_to_end(key)
+            while len(self._validation_cache) > self.VALIDATION_CACHE_SIZE:
+                self._validation_cache.popitem(last=False)
 
     def validate_with_debug(self, document_payload: Dict[str, Any]) -> PolicyValidationDebugResult:
         if not self.settings.enable_policy_rag or not self.store.records:
@@ -1,12 +1,31 @@
 from __future__ import annotations
 
-import json
+import heapq
+import threading
+from collections import OrderedDict
 from dataclasses import dataclass
 from textwrap import dedent
-from typing import Any, Dict, List, Optional, Sequence, Tuple
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
 
 from llm_client import LLMClient
-from repositories.vector_store import VectorStore
+from repositories.vector_store import VectorStore, content_fingerprint
+from utils import fast_json
+
+
+NL_QUERY_PROMPT = dedent(
+    """
+    将以下报销 payload 总结为一句中文检索语句，便于匹配相关报销政策。
+    只输出一句话，不要 JSON。
+    payload: {payload}
+    """
+)
+
+# 关键词召回使用的 payload 字段
+KEYWORD_KEYS = ("doc_type", "type", "category", "expense_type", "invoice_type")
+
+
+def _score(item: Dict[str, Any]) -> float:
+    return item.get("score", 0)
 
 
 def _estimate_tokens(text: str) -> int:
@@ -20,12 +39,18 @@ class QuerySpec:
     kind: str  # "payload_json" | "keywords" | "fallback" | "nl_query"
 
 
+# 兜底关键词查询，提升政策通用召回
+FALLBACK_QUERY = QuerySpec("报销 票据 发票 费用 规则 限额 审批 差旅 餐饮 交通 住宿", "fallback")
+
+
 class RAGRetriever:
     """
     多路召回 + 去重 + 截断的检索器，带 query 权重、可选 NL 重写、证据编号。
     """
 
     WEIGHTS = {"payload_json": 1.2, "keywords": 1.0, "nl_query": 1.3, "fallback": 0.7}
+    # NL 重写结果按规范化 payload 缓存，相同单据重复校验不再调用 LLM
+    NL_QUERY_CACHE_SIZE = 1024
 
     def __init__(
         self,
@@ -42,19 +67,21 @@ class RAGRetriever:
         self.max_items = max_items
         self.max_tokens = max_tokens
         self.enable_query_rewrite = enable_query_rewrite
+        self._nl_cache: "OrderedDict[str, str]" = OrderedDict()
+        self._nl_cache_lock = threading.Lock()
 
     def _build_nl_query(self, payload: Dict[str, Any]) -> Optional[str]:
         if not self.enable_query_rewrite or not self.llm:
             return None
-        prompt = dedent(
-            f"""
-            将以下报销 payload 总结为一句中文检索语句，便于匹配相关报销政策。
-            只输出一句话，不要 JSON。
-            payload: {json.dumps(payload, ensure_ascii=False)}
-            """
-        )
+        key = fast_json.dumps(payload, sort_keys=True)
+        with self._nl_cache_lock:
+            cached = self._nl_cache.get(key)
+            if cached is not None:
+                self._nl_cache.move_to_end(key)
+                return cached
+        prompt = NL_QUERY_PROMPT.format(payload=fast_json.dumps(payload))
         try:
-            return self.llm.chat(
+            nl_query = self.llm.chat(
                 [
                     {"role": "system", "content": "你是检索语句生成器，只输出一句话。"},
                     {"role": "user", "content": prompt},
@@ -64,23 +91,20 @@ class RAGRetriever:
             )
         except Exception:
             return None
+        with self._nl_cache_lock:
+            self._nl_cache[key] = nl_query
+            self._nl_cache.move_to_end(key)
+            while len(self._nl_cache) > self.NL_QUERY_CACHE_SIZE:
+                self._nl_cache.popitem(last=False)
+        return nl_query
 
-    def _build_queries(self, payload: Dict[str, Any]) -> List[QuerySpec]:
-        queries: List[QuerySpec] = []
-        payload_json = json.dumps(payload, ensure_ascii=False)
-        if payload_json:
-            queries.append(QuerySpec(payload_json, "payload_json"))
+    @staticmethod
+    def _payload_query(payload: Dict[str, Any]) -> str:
+        return fast_json.dumps(payload)
 
-        keywords: List[str] = []
-        for key in (
-            "doc_type",
-            "type",
-            "category",
-            "expense_type",
-            "invoice_type",
-        ):
-            if payload.get(key):
-                keywords.append(str(payload[key]))
+    @staticmethod
+    def _keyword_query(payload: Dict[str, Any]) -> str:
+        keywords = [str(payload[key]) for key in KEYWORD_KEYS if payload.get(key)]
 
         vendor = payload.get("vendor") or payload.get("vendor_name")
         if vendor:
@@ -93,32 +117,37 @@ class RAGRetriever:
         amount = payload.get("total_amount") or payload.get("amount")
         if amount is not None:
             keywords.append(f"金额 {amount}")
+        return " ".join(keywords)
+
+    def _build_queries(self, payload: Dict[str, Any]) -> List[QuerySpec]:
+        queries: List[QuerySpec] = []
+        payload_json = self._payload_query(payload)
+        if payload_json:
+            queries.append(QuerySpec(payload_json, "payload_json"))
 
-        if keywords:
-            queries.append(QuerySpec(" ".join(keywords), "keywords"))
+        keyword_text = self._keyword_query(payload)
+        if keyword_text:
+            queries.append(QuerySpec(keyword_text, "keywords"))
 
         nl_query = self._build_nl_query(payload)
         if nl_query:
             queries.append(QuerySpec(nl_query, "nl_query"))
 
         # 兜底关键词，提升政策通用召回
-        queries.append(QuerySpec("报销 票据 发票 费用 规则 限额 审批 差旅 餐饮 交通 住宿", "fallback"))
+        queries.append(FALLBACK_QUERY)
         return [q for q in queries if q.text.strip()]
 
     def _dedup(self, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        seen = set()
-        uniq: List[Dict[str, Any]] = []
+        """按入库时预计算的指纹去重，同一规则保留加权得分最高的一次命中。"""
+        best: Dict[int, Dict[str, Any]] = {}
         for item in results:
-            fingerprint = (
-                str(item.get("title", "")),
-                str(item.get("summary", "")),
-                str(item.get("content", "")),
-            )
-            if fingerprint in seen:
-                continue
-            seen.add(fingerprint)
-            uniq.append(item)
-        return uniq
+            fingerprint = item.get("_fp")
+            if fingerprint is None:
+                fingerprint = content_fingerprint(item)
+            kept = best.get(fingerprint)
+            if kept is None or item.get("score", 0) > kept.get("score", 0):
+                best[fingerprint] = item
+        return list(best.values())
 
     def _tag_score(self, item: Dict[str, Any], payload: Dict[str, Any]) -> float:
         score = 0.0
@@ -136,6 +165,18 @@ class RAGRetriever:
             score += 0.03
         return score
 
+    def _ranked(self, items: List[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """
+        按得分降序产出候选。通常只会用到前 max_items 条，先用 nlargest 取 2 倍余量；
+        余量被空文本跳过耗尽时才对全部候选排序，结果与整体排序一致。
+        """
+        limit = self.max_items * 2
+        if len(items) <= limit:
+            yield from sorted(items, key=_score, reverse=True)
+            return
+        yield from heapq.nlargest(limit, items, key=_score)
+        yield from sorted(items, key=_score, reverse=True)[limit:]
+
     def retrieve(self, payload: Dict[str, Any]) -> Tuple[str, List[Dict[str, Any]]]:
         """
         返回拼接后的上下文字符串与命中的原始记录。
@@ -145,23 +186,23 @@ class RAGRetriever:
 
         queries = self._build_queries(payload)
         candidates: List[Dict[str, Any]] = []
-        for query in queries:
+        # 小 k 的结果是大 k 结果的前缀，按最大 k 一次性批量检索全部查询即可
+        top_k = max(self.top_ks) if self.top_ks else 0
+        batch_hits = self.store.similarity_search_batch([q.text for q in queries], top_k=top_k) if top_k else []
+        for query, hits in zip(queries, batch_hits):
             weight = self.WEIGHTS.get(query.kind, 1.0)
-            for k in self.top_ks:
-                hits = self.store.similarity_search(query.text, top_k=k)
-                for h in hits:
-                    base = h.get("score", 0)
-                    h["score"] = base * weight + self._tag_score(h, payload)
-                    h["_q_kind"] = query.kind
-                candidates.extend(hits)
+            for h in hits:
+                base = h.get("score", 0)
+                h["score"] = base * weight + self._tag_score(h, payload)
+                h["_q_kind"] = query.kind
+            candidates.extend(hits)
 
         uniq = self._dedup(candidates)
-        uniq.sort(key=lambda x: x.get("score", 0), reverse=True)
 
         fragments: List[str] = []
         kept: List[Dict[str, Any]] = []
         token_count = 0
-        for idx, item in enumerate(uniq, start=1):
+        for idx, item in enumerate(self._ranked(uniq), start=1):
             text = item.get("summary") or item.get("content") or ""
             if not text.strip():
                 continue
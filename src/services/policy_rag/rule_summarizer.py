@@ -1,7 +1,12 @@
 from __future__ import annotations
 
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from textwrap import dedent
-from typing import Dict, List, Sequence, Tuple
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
 from llm_client import LLMClient
 from models.schemas import PolicyDocument
@@ -21,25 +26,93 @@ SUMMARY_PROMPT = dedent(
     """
 )
 
+TAGS_PROMPT = dedent(
+    """
+    请根据以下政策文本，提取简单标签并用JSON返回：
+    - expense_type: 如 "出租车" "住宿" "餐饮" "机票" 等
+    - scene: 如 "差旅" "市内交通" "加班打车"
+    - city_level: "一线" "二线" "其他" 或留空
+    只输出 JSON 对象。
+    政策：{content}
+    """
+)
+
+# 结构化政策中的关键段落（限额/条件/例外/凭证），命中足够多时直接抽取摘要
+SECTION_RE = re.compile(r"(限额|上限|条件|例外|所需凭证|发票)[：:]?\s*([^\n。；]{0,80})")
+EXTRACTIVE_MIN_HITS = 2
+SUMMARY_MAX_CHARS = 120
+
+# 送入 LLM / 抽取的正文长度上限
+SUMMARY_SOURCE_CHARS = 2000
+TAGS_SOURCE_CHARS = 1500
+
+
+def extractive_summary(content: str, title: str = "") -> str | None:
+    """按关键段落抽取摘要，以规则标题开头以便检索时区分规则主体；命中不足 EXTRACTIVE_MIN_HITS 时返回 None。"""
+    parts: List[str] = []
+    for label, body in SECTION_RE.findall(content):
+        body = body.strip(" ，,：:")
+        if not body:
+            continue
+        part = f"{label}：{body}"
+        if part not in parts:
+            parts.append(part)
+    if len(parts) < EXTRACTIVE_MIN_HITS:
+        return None
+    summary = "；".join(parts)
+    title = title.strip()
+    if title:
+        summary = f"{title}：{summary}"
+    return summary[:SUMMARY_MAX_CHARS]
+
+
+def _content_digest(content: str) -> str:
+    """正文哈希。不按正文缓存（会长期持有整篇政策）；批量处理时每篇算一次，传给摘要与标签共用。"""
+    return hashlib.blake2b(content.encode("utf-8"), digest_size=16).hexdigest()
+
 
 class RuleSummarizer:
     """对政策做结构化摘要，提升后续 RAG 的可判别性。"""
 
+    # 摘要/标签结果按 (类型, 标题, 正文哈希) 缓存，同一政策重复入库不再调用 LLM
+    CACHE_SIZE = 1024
+    # summarize_batch 的 LLM 并发上限
+    BATCH_CONCURRENCY = 8
+
     def __init__(self, llm: LLMClient, fallback_chars: int = 400) -> None:
         self.llm = llm
         self.fallback_chars = fallback_chars
-
-    def _extract_tags(self, policy: PolicyDocument) -> Dict[str, str]:
-        prompt = dedent(
-            f"""
-            请根据以下政策文本，提取简单标签并用JSON返回：
-            - expense_type: 如 "出租车" "住宿" "餐饮" "机票" 等
-            - scene: 如 "差旅" "市内交通" "加班打车"
-            - city_level: "一线" "二线" "其他" 或留空
-            只输出 JSON 对象。
-            政策：{policy.content[:1500]}
-            """
-        )
+        self._cache: "OrderedDict[Tuple[str, str, str], Any]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    @staticmethod
+    def _cache_key(kind: str, policy: PolicyDocument, digest: Optional[str] = None) -> Tuple[str, str, str]:
+        return kind, policy.title, digest or _content_digest(policy.content)
+
+    def _cache_get(self, key: Tuple[str, str, str]) -> Any:
+        with self._cache_lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+            return cached
+
+    def _cache_put(self, key: Tuple[str, str, str], value: Any) -> None:
+        with self._cache_lock:
+            self._cache[key] = value
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.CACHE_SIZE:
+                self._cache.popitem(last=False)
+
+    def cache_clear(self) -> None:
+        with self._cache_lock:
+            self._cache.clear()
+
+    def _extract_tags(self, policy: PolicyDocument, digest: Optional[str] = None) -> Dict[str, str]:
+        key = self._cache_key("tags", policy, digest)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return dict(cached)
+        prompt = TAGS_PROMPT.format(content=policy.content[:TAGS_SOURCE_CHARS])
         try:
             raw = self.llm.chat(
                 [
@@ -49,18 +122,33 @@ class RuleSummarizer:
                 max_tokens=200,
                 temperature=0.2,
             )
-            data = repair_json(raw, self.llm, schema_hint='{"expense_type": str, "scene": str, "city_level": str}')
-            return {k: str(v) for k, v in data.items() if v} if isinstance(data, dict) else {}
+            data = repair_json(
+                raw, self.llm, schema_hint='{"expense_type": str, "scene": str, "city_level": str}', expect=dict
+            )
+            tags = {k: str(v) for k, v in data.items() if v} if isinstance(data, dict) else {}
         except Exception:
             return {}
-
-    def summarize(self, policy: PolicyDocument) -> str:
+        self._cache_put(key, tags)
+        return dict(tags)
+
+    def summarize(self, policy: PolicyDocument, digest: Optional[str] = None) -> str:
+        key = self._cache_key("summary", policy, digest)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
+        # 结构清晰的政策直接抽取要点，无需调用 LLM
+        # 抽取与 LLM 只看同一段前 SUMMARY_SOURCE_CHARS 字，切片一次复用
+        excerpt = policy.content[:SUMMARY_SOURCE_CHARS]
+        extracted = extractive_summary(excerpt, policy.title)
+        if extracted:
+            self._cache_put(key, extracted)
+            return extracted
         prompt = SUMMARY_PROMPT.format(
             title=policy.title,
-            content=policy.content[:2000],
+            content=excerpt,
         )
         try:
-            return self.llm.chat(
+            summary = self.llm.chat(
                 [
                     {"role": "system", "content": "你是严谨的政策摘要助手"},
                     {"role": "user", "content": prompt},
@@ -69,15 +157,34 @@ class RuleSummarizer:
                 temperature=0.2,
             )
         except Exception:
-            # 当 LLM 不可用时，退化为截断原文
+            # 当 LLM 不可用时，退化为截断原文（不缓存，LLM 恢复后重新生成）
             return policy.content[: self.fallback_chars]
+        self._cache_put(key, summary)
+        return summary
 
     def summarize_batch(self, policies: Sequence[PolicyDocument]) -> Tuple[List[str], List[dict]]:
         texts: List[str] = []
         metas: List[dict] = []
-        for policy in policies:
-            summary = self.summarize(policy)
-            tags = self._extract_tags(policy)
+        # 每篇正文只哈希一次，摘要与标签两次取缓存键共用
+        digests = [_content_digest(policy.content) for policy in policies]
+        if len(policies) > 1 and getattr(self.llm, "enabled", True):
+            # 摘要与标签抽取均为独立的 LLM 网络调用，有界并发执行，结果按原顺序组装
+            workers = min(self.BATCH_CONCURRENCY, 2 * len(policies))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rule-summary") as executor:
+                summary_futures = [
+                    executor.submit(self.summarize, policy, digest) for policy, digest in zip(policies, digests)
+                ]
+                tag_futures = [
+                    executor.submit(self._extract_tags, policy, digest) for policy, digest in zip(policies, digests)
+                ]
+                results = [(f.result(), t.result()) for f, t in zip(summary_futures, tag_futures)]
+        else:
+            results = [
+                (self.summarize(policy, digest), self._extract_tags(policy, digest))
+                for policy, digest in zip(policies, digests)
+            ]
+
+        for policy, (summary, tags) in zip(policies, results):
             texts.append(summary)
             metas.append(
                 {
@@ -91,10 +198,4 @@ class RuleSummarizer:
         return texts, metas
 
 
-__all__ = ["RuleSummarizer"]
-
-
-
-
-
-
+__all__ = ["RuleSummarizer", "extractive_summary"]
@@ -0,0 +1,86 @@
+"""
+影子规则文件读写：JSON Lines 格式，每行一条规则。
+- 读取按 (路径, mtime, 大小) 缓存解析结果，文件未变时不重复解析
+- 追加只写入一行，无需读回并重写整个文件
+"""
+from __future__ import annotations
+
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+from utils import fast_json
+
+SHADOW_RULES_FILE = Path(__file__).with_name("shadow_rules.jsonl")
+
+
+@lru_cache(maxsize=4)
+def _parse_shadow(path: str, mtime_ns: int, size: int) -> Tuple[Dict[str, Any], ...]:
+    items: List[Dict[str, Any]] = []
+    with open(path, "rb") as fh:
+        for line in fh:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = fast_json.loads(line)
+            except ValueError:
+                continue  # 跳过损坏的单行，不影响其余规则
+            if isinstance(item, dict):
+                items.append(item)
+    return tuple(items)
+
+
+def migrate_legacy_shadow(path: Path) -> None:
+    """一次性迁移：同名旧版 JSON 数组文件存在而 JSONL 文件缺失时转换格式。"""
+    legacy = path.with_suffix(".json")
+    if path.exists() or not legacy.exists():
+        return
+    try:
+        data = fast_json.loads(legacy.read_bytes())
+    except Exception:
+        return
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp_path, "wb") as fh:
+            for item in data if isinstance(data, list) else []:
+                if isinstance(item, dict):
+                    fh.write(fast_json.dumps_bytes(item) + b"\n")
+        os.replace(tmp_path, path)
+    except OSError:
+        return
+    invalidate_shadow_cache()
+
+
+def load_shadow_items(path: Path) -> Tuple[Dict[str, Any], ...]:
+    """
+    返回影子规则条目（只读，调用方不得修改）。
+    文件不存在或读取失败时返回空元组。
+    """
+    try:
+        st = path.stat()
+        return _parse_shadow(str(path), st.st_mtime_ns, st.st_size)
+    except Exception:
+        return ()
+
+
+def append_shadow_item(path: Path, item: Dict[str, Any]) -> None:
+    """以追加方式写入一条规则。"""
+    with open(path, "ab") as fh:
+        fh.write(fast_json.dumps_bytes(item) + b"\n")
+    invalidate_shadow_cache()
+
+
+def invalidate_shadow_cache() -> None:
+    """写入影子规则文件后调用，避免同一时间戳精度内的修改被缓存掩盖。"""
+    _parse_shadow.cache_clear()
+
+
+__all__ = [
+    "SHADOW_RULES_FILE",
+    "append_shadow_item",
+    "invalidate_shadow_cache",
+    "load_shadow_items",
+    "migrate_legacy_shadow",
+]
@@ -1,10 +1,12 @@
 from __future__ import annotations
 
-import json
+import hashlib
+from functools import lru_cache
 from textwrap import dedent
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Tuple
 
 from llm_client import LLMClient
+from utils import fast_json
 
 from .json_repair import repair_json
 
@@ -48,9 +50,84 @@ JSON_PROMPT = dedent(
 )
 
 
+# 单次调用时推理与 JSON 之间的分隔标记
+JSON_SENTINEL = "===JSON==="
+
+COMBINED_PROMPT = (
+    REASONING_PROMPT
+    + dedent(
+        f"""
+        推理结束后，单独输出一行 {JSON_SENTINEL}，随后按以下要求输出 JSON：
+        """
+    )
+    + JSON_PROMPT
+)
+
+BATCH_PROMPT = dedent(
+    """
+    你将基于“政策规则 + 多张票据信息”逐张进行合规性判断。
+    严重程度定义：
+    - HIGH：明确违反金额/对象/范围等硬性规定，应驳回报销
+    - MEDIUM：信息缺失、不符合流程要求、需要补充材料或说明
+    - LOW：基本符合，只是有建议或轻微风险
+
+    规则编号说明：上下文中形如 [R1] [R2] 的编号是规则证据，引用时请使用这些编号。
+    规则：
+    {rules}
+
+    {payloads}
+
+    请对每张票据分别判断，输出严格 JSON 数组，每张票据一个元素：
+    [{{"index": 票据编号, "flags": [...]}}]
+    flags 元素字段：
+    - rule_title: string
+    - severity: "LOW" | "MEDIUM" | "HIGH"（按上述定义）
+    - kind: "VIOLATION" | "MISSING_INFO" | "SUGGESTION"
+    - message: string
+    - references: string[] 可选，必须使用形如 "R1" "R2" 的规则编号
+    某张票据全部符合时其 flags 为空数组 []。只输出 JSON，不得出现额外文本。
+    """
+)
+
+SCHEMA_HINT = (
+    'JSON 数组元素形如: {"rule_title": str, "severity": "LOW"|"MEDIUM"|"HIGH", '
+    '"kind": "VIOLATION"|"MISSING_INFO"|"SUGGESTION", "message": str, "references": [str]}'
+)
+
+
+BATCH_SCHEMA_HINT = 'JSON 数组元素形如: {"index": int, "flags": [...]}，flags 元素同单票格式'
+
+
+@lru_cache(maxsize=8)
+def _split_template(template: str, slot: str) -> Tuple[str, str]:
+    """按单票/多票占位符拆成 (头部模板, 已渲染的尾部)；尾部不含其他占位符。"""
+    head, tail = template.split("{" + slot + "}")
+    return head, tail.format()
+
+
+@lru_cache(maxsize=16)
+def _render_head(template: str, slot: str, rules: str) -> str:
+    return _split_template(template, slot)[0].format(rules=rules)
+
+
+def _render_prompt(template: str, slot: str, rules: str, value: str) -> str:
+    """同一批票据共用规则时，规则部分只渲染一次，每张票据只做字符串拼接。"""
+    return _render_head(template, slot, rules) + value + _split_template(template, slot)[1]
+
+
+@lru_cache(maxsize=256)
+def _rules_cache_key(rules: str) -> str:
+    """同一规则上下文的稳定标识，供服务端复用以规则开头的提示前缀缓存。"""
+    return "rules-" + hashlib.blake2b(rules.encode("utf-8"), digest_size=8).hexdigest()
+
+
 class TwoStageLLM:
     """二阶段推理，降低幻觉并确保 JSON 输出。"""
 
+    # 批量模式下每张票据预留的输出 token
+    BATCH_TOKENS_PER_PAYLOAD = 300
+    BATCH_MAX_TOKENS = 4000
+
     def __init__(self, llm: LLMClient) -> None:
         self.llm = llm
 
@@ -58,10 +135,11 @@ class TwoStageLLM:
         return self.llm.chat(
             [
                 {"role": "system", "content": "你是严谨的报销政策审查员，先做推理后再给结论。"},
-                {"role": "user", "content": REASONING_PROMPT.format(rules=rules, payload=payload)},
+                {"role": "user", "content": _render_prompt(REASONING_PROMPT, "payload", rules, payload)},
             ],
             max_tokens=800,
             temperature=0.2,
+            cache_key=_rules_cache_key(rules),
         )
 
     def _to_json(self, reasoning: str) -> Any:
@@ -73,17 +151,75 @@ class TwoStageLLM:
             max_tokens=400,
             temperature=0.1,
         )
-        schema_hint = (
-            'JSON 数组元素形如: {"rule_title": str, "severity": "LOW"|"MEDIUM"|"HIGH", '
-            '"kind": "VIOLATION"|"MISSING_INFO"|"SUGGESTION", "message": str, "references": [str]}'
+        return repair_json(reply, self.llm, schema_hint=SCHEMA_HINT, expect=list)
+
+    def _reason_and_json(self, rules: str, payload: str) -> tuple[str, Any] | None:
+        """一次调用同时拿到推理与 JSON；回复中缺少分隔标记时返回 None。"""
+        reply = self.llm.chat(
+            [
+                {"role": "system", "content": "你是严谨的报销政策审查员，先做推理后再给结论。"},
+                {"role": "user", "content": _render_prompt(COMBINED_PROMPT, "payload", rules, payload)},
+            ],
+            max_tokens=1200,
+            temperature=0.2,
+            cache_key=_rules_cache_key(rules),
         )
-        return repair_json(reply, self.llm, schema_hint=schema_hint)
+        reasoning, sep, json_part = reply.partition(JSON_SENTINEL)
+        if not sep:
+            return None
+        return reasoning.strip(), repair_json(json_part, self.llm, schema_hint=SCHEMA_HINT, expect=list)
 
     def generate_flags_with_reasoning(self, rules: str, payload: Dict[str, Any]) -> tuple[List[Dict[str, Any]], str]:
-        reasoning = self._reason(rules, json.dumps(payload, ensure_ascii=False))
-        raw = self._to_json(reasoning)
+        payload_text = fast_json.dumps(payload)
+        merged = self._reason_and_json(rules, payload_text)
+        if merged is not None:
+            reasoning, raw = merged
+        else:
+            # 模型未按约定输出分隔标记，回退到两次调用
+            reasoning = self._reason(rules, payload_text)
+            raw = self._to_json(reasoning)
+        return self._normalize_flags(raw), reasoning
+
+    def generate_flags_batch(self, rules: str, payloads: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        """共用同一段规则上下文，一次调用校验多张票据；返回与 payloads 等长、按位置对应的结果。"""
+        if not payloads:
+            return []
+        if len(payloads) == 1:
+            return [self.generate_flags(rules, payloads[0])]
+        payload_block = "\n".join(
+            f"票据[{idx}]: {fast_json.dumps(payload)}" for idx, payload in enumerate(payloads, start=1)
+        )
+        reply = self.llm.chat(
+            [
+                {"role": "system", "content": "你是严谨的报销政策审查员，严格按要求输出 JSON。"},
+                {"role": "user", "content": _render_prompt(BATCH_PROMPT, "payloads", rules, payload_block)},
+            ],
+            max_tokens=min(self.BATCH_MAX_TOKENS, self.BATCH_TOKENS_PER_PAYLOAD * len(payloads) + 200),
+            temperature=0.2,
+            cache_key=_rules_cache_key(rules),
+        )
+        raw = repair_json(reply, self.llm, schema_hint=BATCH_SCHEMA_HINT, expect=list)
+        results: List[List[Dict[str, Any]] | None] = [None] * len(payloads)
+        if isinstance(raw, list):
+            for item in raw:
+                if not isinstance(item, dict):
+                    continue
+                try:
+                    pos = int(item.get("index")) - 1
+                except (TypeError, ValueError):
+                    continue
+                if 0 <= pos < len(payloads) and results[pos] is None:
+                    results[pos] = self._normalize_flags(item.get("flags"))
+        # 模型漏掉的票据单独补跑，保证每张都有结果
+        return [
+            flags if flags is not None else self.generate_flags(rules, payloads[pos])
+            for pos, flags in enumerate(results)
+        ]
+
+    @staticmethod
+    def _normalize_flags(raw: Any) -> List[Dict[str, Any]]:
         if not isinstance(raw, list):
-            return [], reasoning
+            return []
         flags: List[Dict[str, Any]] = []
         for item in raw:
             if not isinstance(item, dict):
@@ -108,7 +244,7 @@ class TwoStageLLM:
                     "references": list(references) if isinstance(references, list) else [],
                 }
             )
-        return flags, reasoning
+        return flags
 
     def generate_flags(self, rules: str, payload: Dict[str, Any]) -> List[Dict[str, Any]]:
         flags, _ = self.generate_flags_with_reasoning(rules, payload)
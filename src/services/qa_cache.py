@@ -0,0 +1,219 @@
+"""智能问答结果的持久化缓存（SQLite），可选基于嵌入的近似问题命中。"""
+from __future__ import annotations
+
+import logging
+import math
+import re
+import sqlite3
+import time
+from contextlib import closing
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from config import DATA_DIR, get_settings
+from utils import fast_json
+
+try:  # 可选依赖，仅近似命中时使用
+    import numpy as np
+except Exception:  # noqa: BLE001
+    np = None
+
+logger = logging.getLogger(__name__)
+
+QA_CACHE_FILE = DATA_DIR / "cache" / "qa_cache.db"
+
+# 归一化只合并空白、去掉句末语气标点；比较符、负号、小数点等都会改变 SQL 语义，必须保留
+_WHITESPACE_RE = re.compile(r"\s+")
+_TRAILING_PUNCT = "？?。!！"
+
+# 缓存键格式版本：键的生成规则变化时递增，旧文件中的条目在启动时清空
+_KEY_FORMAT_VERSION = 3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS qa_cache (
+    key TEXT PRIMARY KEY,
+    scope TEXT NOT NULL,
+    result TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    embedding BLOB,
+    cost REAL NOT NULL DEFAULT 0,
+    hits INTEGER NOT NULL DEFAULT 0
+)
+"""
+
+# 旧版缓存文件缺少的列，启动时补齐
+_ADDED_COLUMNS = {
+    "cost": "REAL NOT NULL DEFAULT 0",
+    "hits": "INTEGER NOT NULL DEFAULT 0",
+}
+
+
+def normalize_question(question: str) -> str:
+    return _WHITESPACE_RE.sub(" ", (question or "").lower()).strip().rstrip(_TRAILING_PUNCT).rstrip()
+
+
+def _retention_priority(cost: float, hits: int, age: float) -> float:
+    """GDSF 风格的保留优先级：生成越贵、命中越多、越新的条目越晚被淘汰。"""
+    return (cost or 0.0) * (1.0 + math.log1p(hits or 0)) / ((age or 0.0) + 1.0)
+
+
+@lru_cache(maxsize=1)
+def _embedding_model():
+    """与向量库使用同一个 sentence-transformers 模型；加载失败时返回 None。"""
+    try:
+        from sentence_transformers import SentenceTransformer  # type: ignore
+
+        return SentenceTransformer(get_settings().embedding_model)
+    except Exception:  # noqa: BLE001
+        logger.warning("问答语义缓存不可用：嵌入模型加载失败")
+        return None
+
+
+class QACache:
+    """问答结果缓存，进程重启后仍有效。
+
+    精确命中：归一化问题 + 日期范围 + 行数限制。日期须由调用方解析为具体值（不能用 None 表示
+    "最近30天"，否则跨天后仍会命中旧窗口）。开启 QA_SEMANTIC_CACHE 后，未精确命中时
+    在同一日期范围与行数限制下最近 SEMANTIC_SCAN_LIMIT 条记录中按问题嵌入的余弦相似度查找。
+    超出容量时按 生成耗时 × 命中次数 × 新近程度 淘汰，优先保留昂贵的答案。
+    """
+
+    SEMANTIC_SCAN_LIMIT = 200
+
+    def __init__(self, path: Path = QA_CACHE_FILE) -> None:
+        settings = get_settings()
+        self.path = path
+        self.ttl = settings.qa_cache_ttl
+        self.semantic = settings.qa_semantic_cache and np is not None
+        self.semantic_threshold = settings.qa_semantic_threshold
+        self.max_entries = max(1, settings.qa_cache_max_entries)
+        with closing(self._connect()) as conn, conn:
+            conn.execute(_SCHEMA)
+            existing = {row[1] for row in conn.execute("PRAGMA table_info(qa_cache)")}
+            for column, ddl in _ADDED_COLUMNS.items():
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE qa_cache ADD COLUMN {column} {ddl}")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_qa_cache_scope_created ON qa_cache (scope, created_at)")
+            if conn.execute("PRAGMA user_version").fetchone()[0] < _KEY_FORMAT_VERSION:
+                conn.execute("DELETE FROM qa_cache")
+                conn.execute(f"PRAGMA user_version = {_KEY_FORMAT_VERSION}")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(str(self.path), timeout=5)
+
+    @staticmethod
+    def make_scope(start_date: Optional[str], end_date: Optional[str], limit: int) -> str:
+        return f"{start_date}|{end_date}|{limit}"
+
+    def make_key(self, question: str, start_date: Optional[str], end_date: Optional[str], limit: int) -> str:
+        return f"{normalize_question(question)}|{self.make_scope(start_date, end_date, limit)}"
+
+    def _embed(self, question: str) -> Optional[bytes]:
+        if not self.semantic:
+            return None
+        model = _embedding_model()
+        if model is None:
+            return None
+        vec = np.asarray(model.encode([normalize_question(question)], convert_to_numpy=True)[0], dtype=np.float32)
+        vec /= np.linalg.norm(vec) + 1e-9
+        return vec.tobytes()
+
+    def get(
+        self, question: str, start_date: Optional[str], end_date: Optional[str], limit: int
+    ) -> Optional[Dict[str, Any]]:
+        key = self.make_key(question, start_date, end_date, limit)
+        cutoff = time.time() - self.ttl
+        try:
+            with closing(self._connect()) as conn, conn:
+                row = conn.execute(
+                    "SELECT result FROM qa_cache WHERE key = ? AND created_at >= ?", (key, cutoff)
+                ).fetchone()
+                if row is not None:
+                    conn.execute("UPDATE qa_cache SET hits = hits + 1 WHERE key = ?", (key,))
+                    return fast_json.loads(row[0])
+                if not self.semantic:
+                    return None
+                return self._semantic_get(conn, question, self.make_scope(start_date, end_date, limit), cutoff)
+        except sqlite3.Error:
+            logger.exception("读取问答缓存失败")
+            return None
+
+    def _semantic_get(
+        self, conn: sqlite3.Connection, question: str, scope: str, cutoff: float
+    ) -> Optional[Dict[str, Any]]:
+        rows = conn.execute(
+            "SELECT key, result, embedding FROM qa_cache WHERE scope = ? AND created_at >= ? AND embedding IS NOT NULL "
+            "ORDER BY created_at DESC LIMIT ?",
+            (scope, cutoff, self.SEMANTIC_SCAN_LIMIT),
+        ).fetchall()
+        if not rows:
+            return None
+        query = self._embed(question)
+        if query is None:
+            return None
+        query_vec = np.frombuffer(query, dtype=np.float32)
+        matrix = np.vstack([np.frombuffer(emb, dtype=np.float32) for _, _, emb in rows])
+        scores = matrix @ query_vec  # 入库时已归一化，点积即余弦相似度
+        best = int(np.argmax(scores))
+        if float(scores[best]) < self.semantic_threshold:
+            return None
+        hit_key, result, _ = rows[best]
+        conn.execute("UPDATE qa_cache SET hits = hits + 1 WHERE key = ?", (hit_key,))
+        return fast_json.loads(result)
+
+    def put(
+        self,
+        question: str,
+        start_date: Optional[str],
+        end_date: Optional[str],
+        limit: int,
+        result: Dict[str, Any],
+        cost: float = 0.0,
+    ) -> None:
+        """写入结果；cost 为生成该结果的耗时（秒），用于淘汰排序。"""
+        key = self.make_key(question, start_date, end_date, limit)
+        try:
+            payload = fast_json.dumps(result)
+            embedding = self._embed(question)
+            with closing(self._connect()) as conn, conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO qa_cache (key, scope, result, created_at, embedding, cost, hits) "
+                    "VALUES (?, ?, ?, ?, ?, ?, 0)",
+                    (key, self.make_scope(start_date, end_date, limit), payload, time.time(), embedding, cost),
+                )
+                self._evict(conn)
+        except (sqlite3.Error, TypeError, ValueError):
+            logger.exception("写入问答缓存失败")
+
+    def clear(self) -> None:
+        """清空全部条目；票据/分录数据变更后调用，避免返回基于旧数据的答案。"""
+        try:
+            with closing(self._connect()) as conn, conn:
+                conn.execute("DELETE FROM qa_cache")
+        except sqlite3.Error:
+            logger.exception("清空问答缓存失败")
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        now = time.time()
+        conn.execute("DELETE FROM qa_cache WHERE created_at < ?", (now - self.ttl,))
+        overflow = conn.execute("SELECT COUNT(*) FROM qa_cache").fetchone()[0] - self.max_entries
+        if overflow <= 0:
+            return
+        rows = conn.execute("SELECT key, cost, hits, created_at FROM qa_cache").fetchall()
+        rows.sort(key=lambda row: _retention_priority(row[1], row[2], now - row[3]))
+        conn.executemany("DELETE FROM qa_cache WHERE key = ?", [(row[0],) for row in rows[:overflow]])
+
+
+@lru_cache(maxsize=1)
+def get_qa_cache() -> QACache:
+    """进程内共享的缓存实例（QAService 按请求创建，不宜各自持有缓存）。"""
+    return QACache()
+
+
+def purge_qa_cache() -> None:
+    """清空进程共享的问答缓存（由票据/分录提交后的钩子调用）。"""
+    get_qa_cache().clear()
+
+
+__all__ = ["QACache", "QA_CACHE_FILE", "get_qa_cache", "normalize_question", "purge_qa_cache"]
@@ -5,16 +5,131 @@ import logging
 import re
 import json
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 from functools import lru_cache
 from sqlalchemy import text
 from sqlalchemy.orm import Session
 
 from llm_client import LLMClient
+from services.qa_cache import QACache, get_qa_cache
+from utils import fast_json
+from utils.json_scan import locate_json
+
+try:  # 可选依赖：SQL 语法树校验，未安装时回退正则检查
+    import sqlglot
+    from sqlglot import exp
+except Exception:  # noqa: BLE001
+    sqlglot = None
+    exp = None
 
 logger = logging.getLogger(__name__)
 
+# QAService 按请求创建，后台任务共用一个小线程池
+_WARMUP_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="qa-warmup")
+
+# 正则与提示词模板在模块加载时构建一次
+_FROM_RE = re.compile(r'from\s+(\w+)')
+_LIMIT_RE = re.compile(r'limit\s+\d+', re.IGNORECASE)
+_JSON_OBJECT_RE = re.compile(r'\{[\s\S]*\}')
+# 明确要求列出明细的问题，直接渲染表格作答
+_LISTING_QUESTION_RE = re.compile(r'^\s*(列出|显示|查询|show|list)', re.IGNORECASE)
+
+QUERY_PLAN_PROMPT = """你是一个SQL查询生成助手。根据用户问题生成安全的SQL查询计划。
+
+数据库表结构：
+- documents表：包含发票数据
+  列：id, user_id, file_name, file_path, vendor, amount, tax_amount, currency, category, status, created_at
+
+约束条件：
+1. 只能使用SELECT语句，禁止INSERT/UPDATE/DELETE/DDL
+2. 只能查询documents表
+3. 不要选择大型字段（如raw_result等JSON/BLOB字段）
+4. 必须包含LIMIT子句（非聚合查询默认20条）
+5. 如果用户问"全部/所有"，仍需限制条数并说明"仅展示前N条"
+6. {date_info}
+7. 使用参数化查询，将值放在params中
+8. 日期字段使用created_at（不是invoice_date）
+
+用户问题：{question}
+
+请生成JSON格式的查询计划（不要包含任何其他文字）：
+{{
+  "task": "sql",
+  "sql": "SELECT id, vendor, amount, category, status, created_at FROM documents WHERE created_at >= :start_date AND created_at <= :end_date LIMIT :limit",
+  "params": {{"start_date": "{start_date}", "end_date": "{end_date}", "limit": {limit}}},
+  "explain": "简短说明",
+  "limit": {limit}
+}}
+
+如果无法通过SQL回答，返回：
+{{
+  "task": "need_more",
+  "questions": ["需要澄清的问题1", "需要澄清的问题2"]
+}}
+
+只返回JSON，不要包含其他内容。"""
+
+@lru_cache(maxsize=256)
+def _compiled_sql(sql: str):
+    """复用同一条 SQL 的 TextClause，SQLAlchemy 编译缓存与驱动预编译语句缓存都以其为键。
+    键为 _enforce_limit 处理后的原文，不做空白/大小写归一化，以免改动字符串字面量。"""
+    return text(sql)
+
+
+def _default_date_range() -> Tuple[str, str]:
+    """未指定日期时使用的默认范围：最近30天（按当天日期计算）。"""
+    now = datetime.now()
+    return (now - timedelta(days=30)).strftime('%Y-%m-%d'), now.strftime('%Y-%m-%d')
+
+
+@lru_cache(maxsize=64)
+def _table_header(columns: tuple) -> str:
+    """Markdown 表头与分隔行；同一查询形态的列名组合反复出现，故缓存。"""
+    return "| " + " | ".join(columns) + " |\n| " + " | ".join(["---"] * len(columns)) + " |"
+
+
+def _numeric_summary(rows: List[Dict], columns: List[str]) -> Dict[str, Dict[str, float]]:
+    """数值列的 count/sum/avg/min/max，代替原始行放入提示词。"""
+    summary: Dict[str, Dict[str, float]] = {}
+    for col in columns:
+        values = [
+            row[col] for row in rows
+            if isinstance(row.get(col), (int, float)) and not isinstance(row.get(col), bool)
+        ]
+        if not values:
+            continue
+        total = sum(values)
+        summary[col] = {
+            "count": len(values),
+            "sum": round(total, 2),
+            "avg": round(total / len(values), 2),
+            "min": min(values),
+            "max": max(values),
+        }
+    return summary
+
+
+# 语法树中出现即拒绝的节点类型（不同 sqlglot 版本类名略有差异，按存在与否收集）
+_FORBIDDEN_NODE_TYPES = tuple(
+    getattr(exp, name)
+    for name in (
+        "Insert", "Update", "Delete", "Merge", "Drop", "Create", "Alter", "AlterTable",
+        "TruncateTable", "Command", "Pragma", "Attach", "Detach", "Union", "Transaction",
+    )
+    if exp is not None and hasattr(exp, name)
+)
+
+
+@lru_cache(maxsize=256)
+def _parse_sql(sql: str):
+    """解析为语法树列表；无法解析时返回 None。LLM 常重复生成同一条 SQL，故缓存。"""
+    try:
+        return tuple(tree for tree in sqlglot.parse(sql, read="sqlite") if tree is not None)
+    except Exception:  # noqa: BLE001
+        return None
+
 
 class QAService:
     """智能问答服务。"""
@@ -26,25 +141,29 @@ class QAService:
         "pragma", "attach", "detach", "information_schema", "pg_catalog",
         "union", "exec", "execute"
     }
+    # 所有禁止关键字合并为一个正则，一次扫描完成
+    _FORBIDDEN_RE = re.compile(r"\b(" + "|".join(sorted(FORBIDDEN_KEYWORDS)) + r")\b")
     
     # 最大返回行数
     MAX_ROWS = 200
     DEFAULT_LIMIT = 20
+    # 生成答案时提示词内附带的明细行数，超出部分以数值汇总代替
+    ANSWER_PREVIEW_ROWS = 10
     
     # 查询超时（秒）
     QUERY_TIMEOUT = 10
     
-    def __init__(self, db: Session, llm_client: LLMClient):
+    def __init__(self, db: Session, llm_client: LLMClient, cache: Optional[QACache] = None):
         """初始化问答服务。
         
         Args:
             db: 数据库会话
             llm_client: LLM客户端
+            cache: 结果缓存（可选，默认使用进程共享的持久化缓存）
         """
         self.db = db
         self.llm_client = llm_client
-        self._cache: Dict[str, tuple[Any, float]] = {}
-        self._cache_ttl = 30  # 缓存30秒
+        self._cache = cache or get_qa_cache()
     
     def ask(
         self, 
@@ -66,16 +185,26 @@ class QAService:
         """
         logger.info(f"收到问题: {question}")
         
-        # 检查缓存
-        cache_key = self._make_cache_key(question, start_date, end_date)
-        cached = self._get_from_cache(cache_key)
+        # 检查缓存：默认日期窗口先解析成具体日期，行数限制取实际生效值，二者都计入缓存键
+        if not start_date and not end_date:
+            cache_start, cache_end = _default_date_range()
+        else:
+            cache_start, cache_end = start_date, end_date
+        cache_limit = limit or self.DEFAULT_LIMIT
+        cached = self._cache.get(question, cache_start, cache_end, cache_limit)
         if cached:
             logger.info("从缓存返回结果")
             return cached
         
+        started = time.perf_counter()
         try:
-            # Step A: 使用LLM生成查询计划
-            query_plan = self._generate_query_plan(question, start_date, end_date, limit)
+            # Step A: 使用LLM生成查询计划；等待LLM期间并行预热数据库连接
+            warmup = _WARMUP_EXECUTOR.submit(self._warm_connection)
+            try:
+                query_plan = self._generate_query_plan(question, start_date, end_date, limit)
+            finally:
+                # 会话不支持并发使用：预热结束后主线程才能继续用 self.db
+                self._await_warmup(warmup)
             
             if query_plan.get("task") == "need_more":
                 # 需要更多信息
@@ -128,7 +257,9 @@ class QAService:
             }
             
             # 缓存结果
-            self._put_to_cache(cache_key, result)
+            self._cache.put(
+                question, cache_start, cache_end, cache_limit, result, cost=time.perf_counter() - started
+            )
             
             return result
             
@@ -140,6 +271,17 @@ class QAService:
                 "followups": None
             }
     
+    def _warm_connection(self) -> None:
+        """执行一次轻量查询，使连接在SQL就绪前已检出并可用。"""
+        self.db.execute(text("SELECT 1"))
+    
+    def _await_warmup(self, warmup: Future) -> None:
+        """等待预热完成（不设超时，保证会话不会被两个线程同时使用）；预热失败不影响后续流程。"""
+        try:
+            warmup.result()
+        except Exception as e:
+            logger.debug(f"数据库连接预热失败: {e}")
+    
     def _generate_query_plan(
         self, 
         question: str, 
@@ -163,57 +305,34 @@ class QAService:
         if start_date and end_date:
             date_info = f"用户指定的日期范围：{start_date} 到 {end_date}"
         elif not start_date and not end_date:
-            # 默认最近30天
-            default_start = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
-            default_end = datetime.now().strftime('%Y-%m-%d')
+            default_start, default_end = _default_date_range()
             date_info = f"默认日期范围（最近30天）：{default_start} 到 {default_end}"
             start_date = default_start
             end_date = default_end
         
-        prompt = f"""你是一个SQL查询生成助手。根据用户问题生成安全的SQL查询计划。
-
-数据库表结构：
-- documents表：包含发票数据
-  列：id, user_id, file_name, file_path, vendor, amount, tax_amount, currency, category, status, created_at
-
-约束条件：
-1. 只能使用SELECT语句，禁止INSERT/UPDATE/DELETE/DDL
-2. 只能查询documents表
-3. 不要选择大型字段（如raw_result等JSON/BLOB字段）
-4. 必须包含LIMIT子句（非聚合查询默认20条）
-5. 如果用户问"全部/所有"，仍需限制条数并说明"仅展示前N条"
-6. {date_info}
-7. 使用参数化查询，将值放在params中
-8. 日期字段使用created_at（不是invoice_date）
-
-用户问题：{question}
-
-请生成JSON格式的查询计划（不要包含任何其他文字）：
-{{
-  "task": "sql",
-  "sql": "SELECT id, vendor, amount, category, status, created_at FROM documents WHERE created_at >= :start_date AND created_at <= :end_date LIMIT :limit",
-  "params": {{"start_date": "{start_date}", "end_date": "{end_date}", "limit": {limit or self.DEFAULT_LIMIT}}},
-  "explain": "简短说明",
-  "limit": {limit or self.DEFAULT_LIMIT}
-}}
-
-如果无法通过SQL回答，返回：
-{{
-  "task": "need_more",
-  "questions": ["需要澄清的问题1", "需要澄清的问题2"]
-}}
-
-只返回JSON，不要包含其他内容。"""
+        prompt = QUERY_PLAN_PROMPT.format(
+            date_info=date_info,
+            question=question,
+            start_date=start_date,
+            end_date=end_date,
+            limit=limit or self.DEFAULT_LIMIT,
+        )
         
         try:
             messages = [{"role": "system", "content": prompt}]
             response = self.llm_client.chat(messages)
             logger.debug(f"LLM查询计划响应: {response}")
             
-            # 提取JSON
-            json_match = re.search(r'\{[\s\S]*\}', response)
+            # 提取JSON：优先取第一个完整对象，失败再退回贪婪匹配
+            candidate = locate_json(response)
+            if candidate is not None:
+                try:
+                    return fast_json.loads(candidate)
+                except json.JSONDecodeError:
+                    pass
+            json_match = _JSON_OBJECT_RE.search(response)
             if json_match:
-                query_plan = json.loads(json_match.group())
+                query_plan = fast_json.loads(json_match.group())
                 return query_plan
             else:
                 logger.warning("LLM响应中未找到有效的JSON")
@@ -235,6 +354,14 @@ class QAService:
         if not sql or not sql.strip():
             return False
         
+        # 检查是否包含分号（防止多语句）
+        if ';' in sql:
+            logger.warning("SQL包含分号")
+            return False
+        
+        if sqlglot is not None:
+            return self._validate_sql_ast(sql)
+        
         sql_lower = sql.lower().strip()
         
         # 必须以SELECT开头
@@ -243,25 +370,57 @@ class QAService:
             return False
         
         # 检查禁止的关键字
-        for keyword in self.FORBIDDEN_KEYWORDS:
-            if re.search(fr"\b{keyword}\b", sql_lower):
-                logger.warning(f"SQL包含禁止的关键字: {keyword}")
-                return False
+        forbidden_match = self._FORBIDDEN_RE.search(sql_lower)
+        if forbidden_match:
+            logger.warning(f"SQL包含禁止的关键字: {forbidden_match.group(1)}")
+            return False
         
         # 检查是否只查询允许的表
         # 简单的表名检查（可以改进）
-        from_match = re.search(r'from\s+(\w+)', sql_lower)
+        from_match = _FROM_RE.search(sql_lower)
         if from_match:
             table_name = from_match.group(1)
             if table_name not in self.ALLOWED_TABLES:
                 logger.warning(f"SQL查询了不允许的表: {table_name}")
                 return False
         
-        # 检查是否包含分号（防止多语句）
-        if ';' in sql:
-            logger.warning("SQL包含分号")
+        return True
+    
+    def _validate_sql_ast(self, sql: str) -> bool:
+        """基于 sqlglot 语法树校验：单条 SELECT、无写操作节点、只引用白名单表。
+        
+        Args:
+            sql: SQL语句
+            
+        Returns:
+            bool: 是否安全
+        """
+        trees = _parse_sql(sql)
+        if not trees or len(trees) != 1:
+            logger.warning("SQL无法解析或包含多条语句")
+            return False
+        tree = trees[0]
+        
+        if not isinstance(tree, exp.Select):
+            logger.warning(f"SQL不是SELECT语句: {type(tree).__name__}")
             return False
         
+        forbidden = tree.find(*_FORBIDDEN_NODE_TYPES)
+        if forbidden is not None:
+            logger.warning(f"SQL包含禁止的语句: {type(forbidden).__name__}")
+            return False
+        
+        # CTE 名称可在语句内当作表引用
+        cte_names = {cte.alias_or_name.lower() for cte in tree.find_all(exp.CTE)}
+        for table in tree.find_all(exp.Table):
+            table_name = table.name.lower()
+            if table.args.get("db") or table.args.get("catalog"):
+                logger.warning(f"SQL引用了其他库的表: {table.sql()}")
+                return False
+            if table_name not in self.ALLOWED_TABLES and table_name not in cte_names:
+                logger.warning(f"SQL查询了不允许的表: {table_name}")
+                return False
+        
         return True
     
     def _enforce_limit(self, sql: str, limit: int) -> str:
@@ -279,7 +438,7 @@ class QAService:
         # 如果已有LIMIT，替换它
         if 'limit' in sql_lower:
             # 使用正则替换LIMIT值
-            sql = re.sub(r'limit\s+\d+', f'LIMIT {limit}', sql, flags=re.IGNORECASE)
+            sql = _LIMIT_RE.sub(f'LIMIT {limit}', sql)
         else:
             # 添加LIMIT
             sql = sql.rstrip(';') + f' LIMIT {limit}'
@@ -300,20 +459,24 @@ class QAService:
             logger.debug(f"执行SQL: {sql}, 参数: {params}")
             
             # 执行查询（带超时）
-            result = self.db.execute(text(sql), params)
+            result = self.db.execute(_compiled_sql(sql), params)
             
             # 获取列名
             columns = list(result.keys()) if result.keys() else []
             
             # 获取所有行
-            rows = []
-            for row in result:
-                row_dict = dict(zip(columns, row))
-                # 转换日期类型为字符串
-                for key, value in row_dict.items():
-                    if isinstance(value, (datetime, )):
-                        row_dict[key] = value.strftime('%Y-%m-%d %H:%M:%S')
-                rows.append(row_dict)
+            rows = [dict(mapping) for mapping in result.mappings()]
+            
+            # 转换日期类型为字符串：按列取首个非空值判断类型，只处理日期列
+            dt_columns = [
+                col for col in columns
+                if isinstance(next((row[col] for row in rows if row[col] is not None), None), datetime)
+            ]
+            for row in rows:
+                for col in dt_columns:
+                    value = row[col]
+                    if isinstance(value, datetime):
+                        row[col] = value.strftime('%Y-%m-%d %H:%M:%S')
             
             logger.info(f"查询返回 {len(rows)} 行数据")
             return rows, columns
@@ -348,8 +511,15 @@ class QAService:
         Returns:
             str: Markdown格式的答案
         """
-        # 准备紧凑的上下文
-        rows_preview = rows[:20] if rows else []
+        # 列表类问题直接渲染表格，无需 LLM 复述数据
+        if rows and _LISTING_QUESTION_RE.match(question):
+            return self._render_table_answer(rows, columns, start_date, end_date, limit)
+        
+        # 准备紧凑的上下文：行数较多时只附前若干行，另给数值列汇总
+        rows_preview = rows[:self.ANSWER_PREVIEW_ROWS] if rows else []
+        summary_block = ""
+        if len(rows) > self.ANSWER_PREVIEW_ROWS:
+            summary_block = f"\n数值列汇总（基于全部{len(rows)}行）：\n{fast_json.dumps(_numeric_summary(rows, columns))}\n"
         
         # 构建提示词
         prompt = f"""根据以下查询结果回答用户问题。
@@ -357,13 +527,13 @@ class QAService:
 用户问题：{question}
 
 执行的SQL：{sql}
-参数：{json.dumps(params, ensure_ascii=False)}
+参数：{fast_json.dumps(params)}
 
 查询结果（共{len(rows)}行，显示前{len(rows_preview)}行）：
 列名：{', '.join(columns)}
-
+{summary_block}
 数据：
-{json.dumps(rows_preview, ensure_ascii=False, indent=2)}
+{fast_json.dumps(rows_preview)}
 
 要求：
 1. 用Markdown格式回答
@@ -382,23 +552,37 @@ class QAService:
         except Exception as e:
             logger.exception(f"生成答案失败: {e}")
             # 回退到简单格式
-            if not rows:
-                return f"未找到符合条件的数据。\n\n**数据范围**：{start_date} 到 {end_date}"
-            
-            # 生成简单的表格
-            answer = f"查询到 {len(rows)} 条记录（显示前{min(len(rows), 10)}条）：\n\n"
-            
-            if rows_preview:
-                # 创建Markdown表格
-                answer += "| " + " | ".join(columns) + " |\n"
-                answer += "| " + " | ".join(["---"] * len(columns)) + " |\n"
-                
-                for row in rows_preview[:10]:
-                    answer += "| " + " | ".join(str(row.get(col, "")) for col in columns) + " |\n"
-            
-            answer += f"\n**数据范围**：{start_date} 到 {end_date}，限制：前{limit}条"
+            return self._render_table_answer(rows, columns, start_date, end_date, limit)
+    
+    def _render_table_answer(
+        self,
+        rows: List[Dict],
+        columns: List[str],
+        start_date: Optional[str],
+        end_date: Optional[str],
+        limit: int
+    ) -> str:
+        """不经 LLM，直接把查询结果渲染为 Markdown 表格答案。
+        
+        Args:
+            rows: 查询结果
+            columns: 列名
+            start_date: 开始日期
+            end_date: 结束日期
+            limit: 限制行数
             
-            return answer
+        Returns:
+            str: Markdown格式的答案
+        """
+        if not rows:
+            return f"未找到符合条件的数据。\n\n**数据范围**：{start_date} 到 {end_date}"
+        
+        # 生成简单的表格
+        lines = [f"查询到 {len(rows)} 条记录（显示前{min(len(rows), 10)}条）：\n", _table_header(tuple(columns))]
+        for row in rows[:10]:
+            lines.append("| " + " | ".join(str(row.get(col, "")) for col in columns) + " |")
+        lines.append(f"\n**数据范围**：{start_date} 到 {end_date}，限制：前{limit}条")
+        return "\n".join(lines)
     
     def _generate_followups(self, question: str, rows: List[Dict]) -> Optional[List[str]]:
         """生成后续问题建议。
@@ -431,52 +615,6 @@ class QAService:
                 followups.append("按类别分组统计")
         
         return followups[:3] if followups else None
-    
-    def _make_cache_key(self, question: str, start_date: Optional[str], end_date: Optional[str]) -> str:
-        """生成缓存键。
-        
-        Args:
-            question: 问题
-            start_date: 开始日期
-            end_date: 结束日期
-            
-        Returns:
-            str: 缓存键
-        """
-        return f"{question}|{start_date}|{end_date}"
-    
-    def _get_from_cache(self, key: str) -> Optional[Dict[str, Any]]:
-        """从缓存获取结果。
-        
-        Args:
-            key: 缓存键
-            
-        Returns:
-            Optional[Dict]: 缓存的结果，如果过期或不存在返回None
-        """
-        if key in self._cache:
-            result, timestamp = self._cache[key]
-            if time.time() - timestamp < self._cache_ttl:
-                return result
-            else:
-                # 过期，删除
-                del self._cache[key]
-        return None
-    
-    def _put_to_cache(self, key: str, result: Dict[str, Any]) -> None:
-        """将结果放入缓存。
-        
-        Args:
-            key: 缓存键
-            result: 结果
-        """
-        self._cache[key] = (result, time.time())
-        
-        # 简单的缓存清理：如果缓存超过100项，清除最旧的一半
-        if len(self._cache) > 100:
-            sorted_items = sorted(self._cache.items(), key=lambda x: x[1][1])
-            for old_key, _ in sorted_items[:50]:
-                del self._cache[old_key]
 
 
 __all__ = ["QAService"]
@@ -1,7 +1,10 @@
 """用户登录/注册逻辑。"""
 from __future__ import annotations
 
-from typing import Optional
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
 
 from werkzeug.security import check_password_hash, generate_password_hash
 
@@ -9,30 +12,90 @@ from database import db_session
 from models.db_models import User
 from models.schemas import generate_id
 
-
-def create_user(name: str, email: str, password: str, role: str = "owner") -> User:
-    password_hash = generate_password_hash(password)
+# 仅供测试/演示批量造数（ensure_user 循环创建的临时账号）使用的低迭代次数哈希；
+# 真实可登录账号（注册、改密、导入脚本中的目标用户）一律保持 werkzeug 默认强度
+SEED_HASH_METHOD = "pbkdf2:sha256:10000"
+
+
+# 登录查询缓存：email -> (过期时间, 用户列快照)。仅省去查库，口令仍每次校验；
+# 多进程部署下其他进程改密后，旧快照最多保留 AUTH_CACHE_TTL 秒
+AUTH_CACHE_SIZE = 1024
+AUTH_CACHE_TTL = 60.0
+_AUTH_COLUMNS = (User.id, User.name, User.email, User.role, User.password_hash, User.created_at)
+_auth_cache: "OrderedDict[str, Tuple[float, dict]]" = OrderedDict()
+_auth_cache_lock = threading.Lock()
+# 每次失效递增；查库前记下，写回时若已变化说明期间有改密，丢弃可能过期的快照
+_auth_cache_generation = 0
+
+
+def _auth_cache_get(email: str) -> Optional[dict]:
+    with _auth_cache_lock:
+        cached = _auth_cache.get(email)
+        if cached is None:
+            return None
+        expires_at, snapshot = cached
+        if expires_at < time.monotonic():
+            del _auth_cache[email]
+            return None
+        _auth_cache.move_to_end(email)
+        return snapshot
+
+
+def _auth_cache_put(email: str, snapshot: dict, generation: int) -> None:
+    with _auth_cache_lock:
+        if generation != _auth_cache_generation:
+            return
+        _auth_cache[email] = (time.monotonic() + AUTH_CACHE_TTL, snapshot)
+        _auth_cache.move_to_end(email)
+        while len(_auth_cache) > AUTH_CACHE_SIZE:
+            _auth_cache.popitem(last=False)
+
+
+def invalidate_auth_cache(email: Optional[str] = None) -> None:
+    """用户信息或口令变更提交后调用；不传 email 时清空全部。"""
+    global _auth_cache_generation
+    with _auth_cache_lock:
+        _auth_cache_generation += 1
+        if email is None:
+            _auth_cache.clear()
+        else:
+            _auth_cache.pop(email, None)
+
+
+def _hash_password(password: str, hash_method: Optional[str]) -> str:
+    if hash_method:
+        return generate_password_hash(password, method=hash_method)
+    return generate_password_hash(password)
+
+
+def create_user(
+    name: str, email: str, password: str, role: str = "owner", hash_method: Optional[str] = None
+) -> User:
+    password_hash = _hash_password(password, hash_method)
     with db_session() as session:
         user = session.query(User).filter_by(email=email).first()
         if user:
             user.name = name
             user.role = role
             user.password_hash = password_hash
-            session.flush()
-            return user
-        user = User(
-            id=generate_id("usr"),
-            name=name,
-            email=email,
-            role=role,
-            password_hash=password_hash,
-        )
-        session.add(user)
+        else:
+            user = User(
+                id=generate_id("usr"),
+                name=name,
+                email=email,
+                role=role,
+                password_hash=password_hash,
+            )
+            session.add(user)
         session.flush()
-        return user
+    # 提交之后再失效：提交前失效的话，并发登录可能把旧口令哈希重新写入缓存
+    invalidate_auth_cache(email)
+    return user
 
 
-def ensure_user(name: str, email: str, password: str = "123456", role: str = "owner") -> User:
+def ensure_user(
+    name: str, email: str, password: str = "123456", role: str = "owner", hash_method: Optional[str] = None
+) -> User:
     with db_session() as session:
         user = session.query(User).filter_by(email=email).first()
         if user:
@@ -42,7 +105,7 @@ def ensure_user(name: str, email: str, password: str = "123456", role: str = "ow
             name=name,
             email=email,
             role=role,
-            password_hash=generate_password_hash(password),
+            password_hash=_hash_password(password, hash_method),
         )
         session.add(user)
         session.flush()
@@ -50,11 +113,19 @@ def ensure_user(name: str, email: str, password: str = "123456", role: str = "ow
 
 
 def authenticate(email: str, password: str) -> Optional[User]:
-    with db_session() as session:
-        user = session.query(User).filter_by(email=email).first()
-        if user and user.password_hash and check_password_hash(user.password_hash, password):
-            return user
-        return None
+    snapshot = _auth_cache_get(email)
+    if snapshot is None:
+        generation = _auth_cache_generation
+        with db_session() as session:
+            row = session.query(*_AUTH_COLUMNS).filter(User.email == email).first()
+        if row is None:
+            return None
+        snapshot = dict(row._mapping)
+        _auth_cache_put(email, snapshot, generation)
+    if snapshot["password_hash"] and check_password_hash(snapshot["password_hash"], password):
+        # 游离的 User 实例，与原先会话关闭后返回的对象一样只用于读取属性
+        return User(**snapshot)
+    return None
 
 
 def login_or_register(name: str, email: str, role: str = "owner") -> User:
@@ -62,18 +133,21 @@ def login_or_register(name: str, email: str, role: str = "owner") -> User:
     return ensure_user(name=name, email=email, role=role)
 
 
-def list_users() -> list[dict]:
+def list_users(limit: Optional[int] = None) -> list[dict]:
     with db_session() as session:
-        users = session.query(User).all()
+        query = session.query(User.id, User.name, User.email, User.role, User.created_at)
+        if limit is not None:
+            query = query.limit(limit)
+        rows = query.all()
         return [
             {
-                "id": user.id,
-                "name": user.name,
-                "email": user.email,
-                "role": user.role,
-                "created_at": user.created_at.isoformat(),
+                "id": user_id,
+                "name": name,
+                "email": email,
+                "role": role,
+                "created_at": created_at.isoformat(),
             }
-            for user in users
+            for user_id, name, email, role, created_at in rows
         ]
 
 
@@ -82,4 +156,13 @@ def get_user(user_id: str) -> Optional[User]:
         return session.get(User, user_id)
 
 
-__all__ = ["create_user", "ensure_user", "authenticate", "login_or_register", "list_users", "get_user"]
+__all__ = [
+    "SEED_HASH_METHOD",
+    "create_user",
+    "ensure_user",
+    "authenticate",
+    "login_or_register",
+    "list_users",
+    "get_user",
+    "invalidate_auth_cache",
+]
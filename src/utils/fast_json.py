@@ -0,0 +1,41 @@
+"""JSON 编解码：优先 orjson，未安装时回退标准库。"""
+from __future__ import annotations
+
+import json
+from typing import Any
+
+try:  # 可选依赖，未安装时回退标准库 json
+    import orjson  # type: ignore
+except Exception:  # noqa: BLE001
+    orjson = None
+
+
+def dumps_bytes(obj: Any, sort_keys: bool = False, indent: bool = False) -> bytes:
+    """序列化为 UTF-8 字节（非 ASCII 字符不转义）；不支持的类型按 str() 输出。indent 时缩进 2 格。"""
+    if orjson is not None:
+        option = (orjson.OPT_SORT_KEYS if sort_keys else 0) | (orjson.OPT_INDENT_2 if indent else 0)
+        try:
+            return orjson.dumps(obj, default=str, option=option)
+        except TypeError:
+            pass  # 如非字符串键，交给标准库处理
+    return json.dumps(
+        obj, ensure_ascii=False, sort_keys=sort_keys, indent=2 if indent else None, default=str
+    ).encode("utf-8")
+
+
+def dumps(obj: Any, sort_keys: bool = False, indent: bool = False) -> str:
+    return dumps_bytes(obj, sort_keys=sort_keys, indent=indent).decode("utf-8")
+
+
+def loads(data: str | bytes, lenient: bool = False) -> Any:
+    """默认严格解析（orjson 不接受 NaN/Infinity 等非标准写法）；lenient 时失败再交给标准库解析。"""
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            if not lenient:
+                raise
+    return json.loads(data)
+
+
+__all__ = ["dumps", "dumps_bytes", "loads"]
@@ -2,11 +2,45 @@
 from __future__ import annotations
 
 import base64
-import json
+import binascii
+import hashlib
+import re
+from functools import lru_cache
 from pathlib import Path
-from typing import Iterable, List
+from typing import Any, BinaryIO, Iterable, Iterator, List, Optional, Tuple
 
 from config import ANALYTICS_CACHE, DATA_DIR, FEEDBACK_FILE
+from utils import fast_json
+
+try:  # 可选依赖：增量解析大 JSON 数组，未安装时整文件解析
+    import ijson  # type: ignore
+except Exception:  # noqa: BLE001
+    ijson = None
+
+
+# 分块解码的字符数（4 的倍数），峰值内存只与块大小相关
+_B64_CHUNK_CHARS = 1 << 18
+
+
+def _write_base64(fp: BinaryIO, content_base64: str, digest: Optional[Any] = None) -> None:
+    """分块解码 base64 并写入 fp，避免整文件解码出第二份完整副本；可顺带更新摘要。"""
+    pending = ""
+    for start in range(0, len(content_base64), _B64_CHUNK_CHARS):
+        piece = content_base64[start : start + _B64_CHUNK_CHARS]
+        # 换行等空白会打乱 4 字符对齐，先去掉再与上块余下的字符拼接
+        piece = pending + "".join(piece.split())
+        usable = len(piece) - len(piece) % 4
+        pending = piece[usable:]
+        if usable:
+            data = binascii.a2b_base64(piece[:usable])
+            fp.write(data)
+            if digest is not None:
+                digest.update(data)
+    if pending:
+        data = base64.b64decode(pending)
+        fp.write(data)
+        if digest is not None:
+            digest.update(data)
 
 
 def save_base64_file(file_name: str, content_base64: str, sub_dir: str = "input") -> Path:
@@ -14,46 +48,72 @@ def save_base64_file(file_name: str, content_base64: str, sub_dir: str = "input"
     target_dir.mkdir(parents=True, exist_ok=True)
     file_path = target_dir / file_name
     with open(file_path, "wb") as fp:
-        fp.write(base64.b64decode(content_base64))
+        _write_base64(fp, content_base64)
     return file_path
 
 
-def read_text_files(paths: Iterable[Path]) -> List[str]:
-    texts = []
+def save_base64_file_with_digest(file_name: str, content_base64: str, sub_dir: str = "input") -> Tuple[Path, str]:
+    """落地文件并同时返回 blake2b 摘要，省去写入后再整文件读回做哈希。"""
+    target_dir = DATA_DIR / sub_dir
+    target_dir.mkdir(parents=True, exist_ok=True)
+    file_path = target_dir / file_name
+    digest = hashlib.blake2b()
+    with open(file_path, "wb") as fp:
+        _write_base64(fp, content_base64, digest)
+    return file_path, digest.hexdigest()
+
+
+def read_text_files(paths: Iterable[Path]) -> Iterator[str]:
+    """逐个文件读取并产出文本，同一时刻只持有一个文件的内容；需要列表时自行 list()。"""
     for path in paths:
-        if path.exists() and path.is_file():
-            texts.append(path.read_text(encoding="utf-8", errors="ignore"))
-    return texts
+        if path.is_file():
+            yield path.read_text(encoding="utf-8", errors="ignore")
 
 
 def append_json_line(path: Path, payload: dict) -> None:
     path.parent.mkdir(parents=True, exist_ok=True)
-    with open(path, "a", encoding="utf-8") as fp:
-        fp.write(json.dumps(payload, ensure_ascii=False) + "\n")
+    with open(path, "ab") as fp:
+        fp.write(fast_json.dumps_bytes(payload) + b"\n")
 
 
-def read_feedback() -> List[dict]:
+def read_feedback() -> Iterator[dict]:
+    """逐行产出反馈记录，内存占用与文件大小无关；需要列表时自行 list()。"""
     if not FEEDBACK_FILE.exists():
-        return []
-    with open(FEEDBACK_FILE, "r", encoding="utf-8") as fp:
-        return [json.loads(line) for line in fp if line.strip()]
+        return
+    with open(FEEDBACK_FILE, "rb") as fp:
+        for line in fp:
+            if line.strip():
+                yield fast_json.loads(line, lenient=True)
 
 
-def read_analytics_cache() -> List[dict]:
+def read_analytics_cache() -> Iterator[dict]:
+    """逐条产出分析缓存记录；安装 ijson 时增量解析，否则整文件解析后逐条产出。"""
     if not ANALYTICS_CACHE.exists():
-        return []
-    with open(ANALYTICS_CACHE, "r", encoding="utf-8") as fp:
-        return json.load(fp)
+        return
+    if ijson is not None:
+        with open(ANALYTICS_CACHE, "rb") as fp:
+            yield from ijson.items(fp, "item", use_float=True)
+        return
+    yield from fast_json.loads(ANALYTICS_CACHE.read_bytes(), lenient=True)
 
 
 def write_analytics_cache(payload: List[dict]) -> None:
     ANALYTICS_CACHE.parent.mkdir(parents=True, exist_ok=True)
-    with open(ANALYTICS_CACHE, "w", encoding="utf-8") as fp:
-        json.dump(payload, fp, ensure_ascii=False, indent=2)
+    with open(ANALYTICS_CACHE, "wb") as fp:
+        fp.write(fast_json.dumps_bytes(payload, indent=True))
+
+
+# \W 即 “非 isalnum() 且非下划线”，与原逐字符判断等价（下划线本就替换成下划线）
+_SANITIZE_RE = re.compile(r"\W")
+
+
+@lru_cache(maxsize=1024)
+def _sanitize_title(title: str) -> str:
+    return _SANITIZE_RE.sub("_", title[:80])
 
 
 def touch_policy_document(title: str, content: str) -> Path:
-    sanitized = "".join(ch if ch.isalnum() else "_" for ch in title)[:80]
+    sanitized = _sanitize_title(title)
     file_path = DATA_DIR / "policy" / f"{sanitized}.txt"
     file_path.write_text(content, encoding="utf-8")
     return file_path
@@ -65,6 +125,7 @@ __all__ = [
     "read_feedback",
     "read_text_files",
     "save_base64_file",
+    "save_base64_file_with_digest",
     "touch_policy_document",
     "write_analytics_cache",
 ]
@@ -0,0 +1,137 @@
+"""在 LLM 回复中定位第一个括号平衡的 JSON 片段。
+
+指定 expect 时跳过解析失败或容器类型不符的片段（如结论前的 "[1]" 引用标注）。
+
+安装 numba 时对字节级扫描循环做 JIT 编译；否则用正则只在引号/反斜杠/括号处停下，
+跳过普通字符，避免逐字符的解释器开销。
+"""
+from __future__ import annotations
+
+import re
+from typing import Iterator, Optional, Tuple
+
+from utils import fast_json
+
+try:  # 可选依赖：numba JIT，未安装时使用纯 Python 扫描
+    import numpy as np
+    from numba import njit  # type: ignore
+except Exception:  # noqa: BLE001
+    njit = None
+
+_OBJECT_TOKENS_RE = re.compile(r'[{}"\\]')
+_ANY_TOKENS_RE = re.compile(r'[{}\[\]"\\]')
+
+
+def _scan_text(text: str, allow_array: bool, begin: int = 0) -> Tuple[int, int]:
+    """从 begin 起扫描，返回 [start, end) 字符下标；未找到时返回 (-1, -1)。字符串内的括号与转义引号不计入。"""
+    tokens = _ANY_TOKENS_RE if allow_array else _OBJECT_TOKENS_RE
+    start = -1
+    depth = 0
+    in_string = False
+    skip = -1
+    for match in tokens.finditer(text, begin):
+        idx = match.start()
+        if idx == skip:
+            continue
+        ch = match.group()
+        if in_string:
+            if ch == "\\":
+                skip = idx + 1
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            if start >= 0:
+                in_string = True
+        elif ch in "{[":
+            if start < 0:
+                start = idx
+            depth += 1
+        elif ch in "}]" and start >= 0:
+            depth -= 1
+            if depth == 0:
+                return start, idx + 1
+    return -1, -1
+
+
+if njit is not None:
+
+    @njit(cache=True)
+    def _scan_bytes(buf, allow_array, begin):  # pragma: no cover - 依赖 numba
+        start = -1
+        depth = 0
+        in_string = False
+        escaped = False
+        for idx in range(begin, buf.shape[0]):
+            ch = buf[idx]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif ch == 92:  # \
+                    escaped = True
+                elif ch == 34:  # "
+                    in_string = False
+                continue
+            if ch == 34:
+                if start >= 0:
+                    in_string = True
+            elif ch == 123 or (allow_array and ch == 91):  # { [
+                if start < 0:
+                    start = idx
+                depth += 1
+            elif (ch == 125 or (allow_array and ch == 93)) and start >= 0:  # } ]
+                depth -= 1
+                if depth == 0:
+                    return start, idx + 1
+        return -1, -1
+
+
+def _fragments(text: str, allow_array: bool) -> Iterator[str]:
+    """依次产出互不重叠的括号平衡片段。"""
+    if njit is not None:
+        # 括号与引号都是 ASCII，按 UTF-8 字节扫描得到的边界可直接切片后解码
+        raw = text.encode("utf-8")
+        buf = np.frombuffer(raw, dtype=np.uint8)
+        begin = 0
+        while True:
+            start, end = _scan_bytes(buf, allow_array, begin)
+            if start < 0:
+                return
+            yield raw[start:end].decode("utf-8")
+            begin = end
+    else:
+        begin = 0
+        while True:
+            start, end = _scan_text(text, allow_array, begin)
+            if start < 0:
+                return
+            yield text[start:end]
+            begin = end
+
+
+def locate_json(text: str, allow_array: bool = False, expect: Optional[type] = None) -> Optional[str]:
+    """
+    取出第一个括号平衡的 {...}（allow_array 时也包括 [...]）片段；找不到返回 None。
+
+    expect 为 dict 或 list 时只接受能解析为该类型的片段；都解析失败时退回第一个以对应括号开头的片段，
+    留给调用方做尾随逗号等本地修复。
+    """
+    if not text:
+        return None
+    if expect is None:
+        return next(_fragments(text, allow_array), None)
+    opener = "[" if expect is list else "{"
+    fallback: Optional[str] = None
+    for fragment in _fragments(text, allow_array or expect is list):
+        try:
+            value = fast_json.loads(fragment, lenient=True)
+        except ValueError:
+            value = None
+        if isinstance(value, expect):
+            return fragment
+        if fallback is None and value is None and fragment[0] == opener:
+            fallback = fragment
+    return fallback
+
+
+__all__ = ["locate_json"]
@@ -1,206 +1,478 @@
 """PDF依赖检查工具。"""
 from __future__ import annotations
 
+import ctypes.util
+import importlib.metadata
+import importlib.util
+import io
 import logging
 import platform
 import os
-from typing import Dict, List
+import plistlib
+import re
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Dict, Final, List, Mapping, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+# 进程内不变，导入时取一次
+_SYSTEM: Final[str] = platform.system()
+_WINDOWS_FONT_DIR: Final[str] = os.path.join(os.environ.get('WINDIR', 'C:\\Windows'), 'Fonts')
 
-def check_reportlab() -> Dict[str, any]:
+
+# 检查结果为不可变的 slots 数据类：缓存后可安全共享，属性访问也比多层字典取值更省
+@dataclass(slots=True, frozen=True)
+class ReportlabCheck:
+    installed: bool
+    version: Optional[str] = None
+    error: Optional[str] = None
+
+
+@dataclass(slots=True, frozen=True)
+class WeasyprintCheck:
+    installed: bool
+    version: Optional[str] = None
+    dependencies_ok: bool = False
+    error: Optional[str] = None
+    dependency_errors: Tuple[str, ...] = ()
+
+
+@dataclass(slots=True, frozen=True)
+class FontInfo:
+    name: str
+    path: str
+    size: int
+    mtime: float
+
+
+@dataclass(slots=True, frozen=True)
+class FontsCheck:
+    fonts_found: Tuple[str, ...] = ()
+    fonts_available: Tuple[FontInfo, ...] = ()
+    error: Optional[str] = None
+
+
+@dataclass(slots=True, frozen=True)
+class PdfCheck:
+    reportlab: ReportlabCheck
+    weasyprint: Optional[WeasyprintCheck]  # 快速检查未探测时为 None
+    chinese_fonts: Optional[FontsCheck]  # 同上
+    system: str
+    can_generate_pdf: bool
+
+
+@lru_cache(maxsize=1)
+def check_reportlab() -> ReportlabCheck:
     """检查reportlab是否安装。
     
     Returns:
-        Dict: 检查结果
+        ReportlabCheck: 检查结果
     """
-    result = {
-        "installed": False,
-        "version": None,
-        "error": None,
-    }
-    
     try:
         import reportlab
-        result["installed"] = True
-        result["version"] = getattr(reportlab, "__version__", "unknown")
-        logger.info(f"reportlab已安装，版本: {result['version']}")
     except ImportError as e:
-        result["error"] = str(e)
-        logger.warning(f"reportlab未安装: {e}")
+        logger.warning("reportlab未安装: %s", e)
+        return ReportlabCheck(installed=False, error=str(e))
     
-    return result
+    version = getattr(reportlab, "__version__", "unknown")
+    logger.info("reportlab已安装，版本: %s", version)
+    return ReportlabCheck(installed=True, version=version)
+
+
+# weasyprint 依赖的本地库；各平台库文件命名不同，逐个候选名探测
+_WEASYPRINT_NATIVE_LIBS = {
+    "pango": ("pango-1.0", "pango-1.0-0", "libpango-1.0-0"),
+    "gobject": ("gobject-2.0", "gobject-2.0-0", "libgobject-2.0-0"),
+    "harfbuzz": ("harfbuzz", "harfbuzz-0", "libharfbuzz-0"),
+    "fontconfig": ("fontconfig", "fontconfig-1", "libfontconfig-1"),
+}
+
 
+def _missing_native_libs() -> List[str]:
+    missing = []
+    for lib, candidates in _WEASYPRINT_NATIVE_LIBS.items():
+        if not any(ctypes.util.find_library(name) for name in candidates):
+            missing.append(lib)
+    return missing
 
-def check_weasyprint() -> Dict[str, any]:
+
+@lru_cache(maxsize=2)
+def check_weasyprint(deep: bool = False) -> WeasyprintCheck:
     """检查weasyprint是否安装及其依赖。
     
+    默认只查包元数据与本地库，不导入 weasyprint（其导入链耗时较长）；
+    deep=True 时导入并实际构造 HTML 对象验证。
+    
+    Args:
+        deep: 是否做完整的导入与构造检查
+    
     Returns:
-        Dict: 检查结果
+        WeasyprintCheck: 检查结果
     """
-    result = {
-        "installed": False,
-        "version": None,
-        "dependencies_ok": False,
-        "error": None,
-        "dependency_errors": [],
-    }
+    if not deep:
+        if importlib.util.find_spec("weasyprint") is None:
+            logger.warning("weasyprint未安装")
+            return WeasyprintCheck(installed=False, error="No module named 'weasyprint'")
+        try:
+            version = importlib.metadata.version("weasyprint")
+        except importlib.metadata.PackageNotFoundError:
+            version = "unknown"
+        logger.info("weasyprint已安装，版本: %s", version)
+        missing = _missing_native_libs()
+        if missing:
+            logger.warning("weasyprint依赖检查失败，缺少本地库: %s", missing)
+            return WeasyprintCheck(
+                installed=True, version=version, dependency_errors=(f"缺少本地库: {', '.join(missing)}",)
+            )
+        logger.info("weasyprint依赖检查通过")
+        return WeasyprintCheck(installed=True, version=version, dependencies_ok=True)
     
     try:
         import weasyprint
-        result["installed"] = True
-        result["version"] = getattr(weasyprint, "__version__", "unknown")
-        logger.info(f"weasyprint已安装，版本: {result['version']}")
-        
-        # 检查依赖
-        try:
-            from weasyprint import HTML
-            # 尝试创建一个简单的HTML对象来测试依赖
-            test_html = HTML(string="<html><body>Test</body></html>")
-            result["dependencies_ok"] = True
-            logger.info("weasyprint依赖检查通过")
-        except Exception as e:
-            result["dependency_errors"].append(str(e))
-            logger.warning(f"weasyprint依赖检查失败: {e}")
-            
     except ImportError as e:
-        result["error"] = str(e)
-        logger.warning(f"weasyprint未安装: {e}")
+        logger.warning("weasyprint未安装: %s", e)
+        return WeasyprintCheck(installed=False, error=str(e))
     
-    return result
+    version = getattr(weasyprint, "__version__", "unknown")
+    logger.info("weasyprint已安装，版本: %s", version)
+    
+    # 检查依赖
+    try:
+        from weasyprint import HTML
+        # 尝试创建一个简单的HTML对象来测试依赖
+        HTML(string="<html><body>Test</body></html>")
+    except Exception as e:
+        logger.warning("weasyprint依赖检查失败: %s", e)
+        return WeasyprintCheck(installed=True, version=version, dependency_errors=(str(e),))
+    logger.info("weasyprint依赖检查通过")
+    return WeasyprintCheck(installed=True, version=version, dependencies_ok=True)
+
+
+@lru_cache(maxsize=16)
+def _list_font_dir(directory: str) -> Mapping[str, str]:
+    """一次 scandir 列出字体目录，返回 小写文件名 -> 实际文件名；目录不存在时返回空映射。"""
+    try:
+        with os.scandir(directory) as entries:
+            return MappingProxyType({entry.name.lower(): entry.name for entry in entries})
+    except OSError:
+        return MappingProxyType({})
+
 
+# 已知中文字体文件（小写文件名 -> 显示名），系统字体索引不可用时在各字体目录中按文件名匹配
+_CJK_CANDIDATES: Dict[str, str] = {
+    # Windows
+    "simsun.ttc": "SimSun",
+    "simhei.ttf": "SimHei",
+    "msyh.ttc": "Microsoft YaHei",
+    "simkai.ttf": "KaiTi",
+    "simfang.ttf": "FangSong",
+    "deng.ttf": "DengXian",
+    "msjh.ttc": "Microsoft JhengHei",
+    # macOS
+    "stheiti light.ttc": "STHeiti",
+    "pingfang.ttc": "PingFang",
+    "hiragino sans gb.ttc": "Hiragino Sans GB",
+    "songti.ttc": "Songti",
+    "arial unicode.ttf": "Arial Unicode",
+    # Linux
+    "wqy-microhei.ttc": "WenQuanYi Micro Hei",
+    "wqy-zenhei.ttc": "WenQuanYi Zen Hei",
+    "uming.ttc": "AR PL UMing",
+    "ukai.ttc": "AR PL UKai",
+    "notosanscjk-regular.ttc": "Noto Sans CJK",
+    "notoserifcjk-regular.ttc": "Noto Serif CJK",
+    "notosanscjksc-regular.otf": "Noto Sans CJK SC",
+    "sourcehansans.ttc": "Source Han Sans",
+    "sourcehansanssc-regular.otf": "Source Han Sans SC",
+    "sourcehanserifsc-regular.otf": "Source Han Serif SC",
+}
 
-def check_chinese_fonts() -> Dict[str, any]:
+
+def _build_font_dirs(system: str) -> Tuple[str, ...]:
+    """各平台常见的中文字体目录。"""
+    if system == "Windows":
+        return (_WINDOWS_FONT_DIR,)
+    if system == "Darwin":  # macOS
+        return (
+            '/System/Library/Fonts',
+            '/System/Library/Fonts/Supplemental',
+            '/Library/Fonts',
+            os.path.expanduser('~/Library/Fonts'),
+        )
+    if system == "Linux":
+        return (
+            '/usr/share/fonts/truetype/wqy',
+            '/usr/share/fonts/truetype/arphic',
+            '/usr/share/fonts/opentype/noto',
+            '/usr/share/fonts/noto-cjk',
+            '/usr/share/fonts/adobe-source-han-sans',
+            os.path.expanduser('~/.local/share/fonts'),
+            os.path.expanduser('~/.fonts'),
+        )
+    return ()
+
+
+# 只取决于平台，导入时确定一次
+_FONT_DIRS: Final[Tuple[str, ...]] = _build_font_dirs(_SYSTEM)
+
+
+# 系统字体索引不带语言信息时（macOS/Windows），按常见中文字体族名筛选
+_CJK_FAMILY_RE = re.compile(
+    r"PingFang|Heiti|Songti|Kaiti|Hiragino Sans GB|Arial Unicode|STHeiti|STSong|STKaiti|STFangsong|"
+    r"SimSun|SimHei|SimKai|KaiTi|FangSong|Microsoft YaHei|Microsoft JhengHei|DengXian|MingLiU|"
+    r"Noto (Sans|Serif) CJK|Source Han|WenQuanYi|AR PL",
+    re.IGNORECASE,
+)
+_FONT_TOOL_TIMEOUT = 15
+
+
+def _fc_list_cjk() -> Optional[List[Tuple[str, str]]]:
+    """fontconfig 索引中支持中文的字体；未安装 fc-list 时返回 None。"""
+    try:
+        proc = subprocess.run(
+            ["fc-list", ":lang=zh", "--format=%{family}\t%{file}\n"],
+            capture_output=True,
+            text=True,
+            timeout=_FONT_TOOL_TIMEOUT,
+            check=True,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    fonts = []
+    for line in proc.stdout.splitlines():
+        family, _, path = line.partition("\t")
+        if path:
+            fonts.append((family.split(",")[0].strip(), path.strip()))
+    return fonts
+
+
+def _system_profiler_cjk() -> Optional[List[Tuple[str, str]]]:
+    """macOS 字体索引；输出较大、耗时较长，结果随上层缓存只取一次。"""
+    try:
+        proc = subprocess.run(
+            ["system_profiler", "-xml", "SPFontsDataType"],
+            capture_output=True,
+            timeout=_FONT_TOOL_TIMEOUT * 4,
+            check=True,
+        )
+        items = plistlib.loads(proc.stdout)[0].get("_items", [])
+    except (OSError, subprocess.SubprocessError, plistlib.InvalidFileException, IndexError, AttributeError):
+        return None
+    fonts = []
+    for item in items:
+        path = item.get("path") or ""
+        families = [face.get("family") or "" for face in item.get("typefaces", [])] or [item.get("_name") or ""]
+        family = next((name for name in families if _CJK_FAMILY_RE.search(name)), None)
+        if family and path:
+            fonts.append((family, path))
+    return fonts
+
+
+def _windows_registry_cjk() -> Optional[List[Tuple[str, str]]]:
+    """读取注册表中已安装字体；相对路径位于 %WINDIR%\\Fonts。"""
+    try:
+        import winreg  # type: ignore
+    except ImportError:
+        return None
+    fonts = []
+    try:
+        with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, r"SOFTWARE\Microsoft\Windows NT\CurrentVersion\Fonts") as key:
+            index = 0
+            while True:
+                try:
+                    name, value, _ = winreg.EnumValue(key, index)
+                except OSError:
+                    break
+                index += 1
+                if _CJK_FAMILY_RE.search(name):
+                    # 值名形如 "SimSun & NSimSun (TrueType)"
+                    family = re.sub(r"\s*\(.*?\)\s*$", "", name).split("&")[0].strip()
+                    fonts.append((family, value if os.path.isabs(value) else os.path.join(_WINDOWS_FONT_DIR, value)))
+    except OSError:
+        return None
+    return fonts
+
+
+@lru_cache(maxsize=1)
+def _discover_cjk_fonts(system: str) -> Optional[Tuple[Tuple[str, str], ...]]:
+    """通过系统字体索引查找中文字体，按路径去重；系统工具不可用时返回 None。"""
+    if system == "Windows":
+        fonts = _windows_registry_cjk()
+    elif system == "Darwin":
+        fonts = _fc_list_cjk()
+        if fonts is None:
+            fonts = _system_profiler_cjk()
+    else:
+        fonts = _fc_list_cjk()
+    if fonts is None:
+        return None
+    seen = set()
+    unique = []
+    for family, path in fonts:
+        if path not in seen:
+            seen.add(path)
+            unique.append((family, path))
+    return tuple(unique)
+
+
+@lru_cache(maxsize=1)
+def check_chinese_fonts() -> FontsCheck:
     """检查中文字体是否可用。
     
     Returns:
-        Dict: 检查结果
+        FontsCheck: 检查结果
     """
-    result = {
-        "fonts_found": [],
-        "fonts_available": [],
-        "error": None,
-    }
+    fonts_found: Tuple[str, ...] = ()
+    fonts_available: List[FontInfo] = []
     
     try:
-        system = platform.system()
-        font_paths = []
-        
-        if system == "Windows":
-            windows_font_dir = os.path.join(os.environ.get('WINDIR', 'C:\\Windows'), 'Fonts')
-            font_paths = [
-                ("SimSun", os.path.join(windows_font_dir, 'simsun.ttc')),
-                ("SimHei", os.path.join(windows_font_dir, 'simhei.ttf')),
-                ("Microsoft YaHei", os.path.join(windows_font_dir, 'msyh.ttc')),
-                ("KaiTi", os.path.join(windows_font_dir, 'simkai.ttf')),
-            ]
-        elif system == "Darwin":  # macOS
-            font_paths = [
-                ("STHeiti", '/System/Library/Fonts/STHeiti Light.ttc'),
-                ("PingFang", '/System/Library/Fonts/PingFang.ttc'),
-                ("Arial Unicode", '/Library/Fonts/Arial Unicode.ttf'),
-            ]
-        elif system == "Linux":
-            font_paths = [
-                ("WenQuanYi Micro Hei", '/usr/share/fonts/truetype/wqy/wqy-microhei.ttc'),
-                ("WenQuanYi Zen Hei", '/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc'),
-                ("AR PL UMing", '/usr/share/fonts/truetype/arphic/uming.ttc'),
-            ]
+        # 优先使用系统字体索引（能发现用户自行安装的字体），系统工具缺失时才回退到固定的字体目录
+        discovered = _discover_cjk_fonts(_SYSTEM)
+        if discovered is not None:
+            font_paths = list(discovered)
+            fonts_found = tuple(font_name for font_name, _ in font_paths)
+        else:
+            # 每个目录只列一次，再按小写文件名查已知字体表（不区分大小写，兼容各平台文件系统）
+            font_paths = []
+            for directory in _FONT_DIRS:
+                entries = _list_font_dir(directory)
+                for base_name, font_name in _CJK_CANDIDATES.items():
+                    actual = entries.get(base_name)
+                    if actual is not None:
+                        font_paths.append((font_name, os.path.join(directory, actual)))
+            fonts_found = tuple(_CJK_CANDIDATES.values())
         
+        # 循环外判断一次日志级别，未开启 INFO 时循环内不再构造日志调用
+        log_found = logger.info if logger.isEnabledFor(logging.INFO) else None
         for font_name, font_path in font_paths:
-            result["fonts_found"].append(font_name)
-            if os.path.exists(font_path):
-                result["fonts_available"].append({
-                    "name": font_name,
-                    "path": font_path,
-                })
-                logger.info(f"找到中文字体: {font_name} -> {font_path}")
+            # 命中的字体只 stat 一次，顺带记录大小与修改时间（便于排查损坏的字体文件）
+            try:
+                st = os.stat(font_path)
+            except OSError:
+                continue
+            fonts_available.append(FontInfo(name=font_name, path=font_path, size=st.st_size, mtime=st.st_mtime))
+            if log_found is not None:
+                log_found("找到中文字体: %s -> %s", font_name, font_path)
         
-        if not result["fonts_available"]:
+        if not fonts_available:
             logger.warning("未找到可用的中文字体")
             
     except Exception as e:
-        result["error"] = str(e)
-        logger.error(f"检查中文字体时发生错误: {e}")
+        logger.error("检查中文字体时发生错误: %s", e)
+        return FontsCheck(fonts_found=fonts_found, fonts_available=tuple(fonts_available), error=str(e))
     
-    return result
+    return FontsCheck(fonts_found=fonts_found, fonts_available=tuple(fonts_available))
 
 
-def check_pdf_dependencies() -> Dict[str, any]:
+@lru_cache(maxsize=4)
+def check_pdf_dependencies(fast: bool = True, full_report: bool = False) -> PdfCheck:
     """检查所有PDF生成依赖。
     
+    Args:
+        fast: 只需判断能否生成PDF时，reportlab 可用即返回，不再探测 weasyprint 与中文字体
+        full_report: 始终执行全部检查（诊断报告使用），优先于 fast
+    
     Returns:
-        Dict: 完整的检查结果
+        PdfCheck: 检查结果；快速返回时 weasyprint、chinese_fonts 为 None
     """
     logger.info("开始检查PDF生成依赖...")
     
-    result = {
-        "reportlab": check_reportlab(),
-        "weasyprint": check_weasyprint(),
-        "chinese_fonts": check_chinese_fonts(),
-        "system": platform.system(),
-        "can_generate_pdf": False,
-    }
+    if fast and not full_report:
+        reportlab = check_reportlab()
+        if reportlab.installed:
+            logger.info("PDF生成依赖检查通过，可以生成PDF")
+            return PdfCheck(
+                reportlab=reportlab, weasyprint=None, chinese_fonts=None, system=_SYSTEM, can_generate_pdf=True
+            )
+    
+    # 三项检查主要耗在模块导入/动态库加载与文件系统调用上（均会释放 GIL），并行后耗时取最长一项
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        reportlab_future = executor.submit(check_reportlab)
+        weasyprint_future = executor.submit(check_weasyprint)
+        fonts_future = executor.submit(check_chinese_fonts)
+        reportlab = reportlab_future.result()
+        weasyprint = weasyprint_future.result()
+        chinese_fonts = fonts_future.result()
     
     # 判断是否可以生成PDF
-    result["can_generate_pdf"] = (
-        result["reportlab"]["installed"] or 
-        (result["weasyprint"]["installed"] and result["weasyprint"]["dependencies_ok"])
-    )
+    can_generate_pdf = reportlab.installed or (weasyprint.installed and weasyprint.dependencies_ok)
     
-    if result["can_generate_pdf"]:
+    if can_generate_pdf:
         logger.info("PDF生成依赖检查通过，可以生成PDF")
     else:
         logger.error("PDF生成依赖检查失败，无法生成PDF")
     
-    return result
+    return PdfCheck(
+        reportlab=reportlab,
+        weasyprint=weasyprint,
+        chinese_fonts=chinese_fonts,
+        system=_SYSTEM,
+        can_generate_pdf=can_generate_pdf,
+    )
+
+
+def clear_pdf_check_cache() -> None:
+    """清除检查结果缓存（如安装了新字体或依赖后需要重新检查）。"""
+    for check in (check_reportlab, check_weasyprint, check_chinese_fonts, check_pdf_dependencies, _list_font_dir, _discover_cjk_fonts):
+        check.cache_clear()
 
 
 def print_diagnostic_report() -> None:
     """打印诊断报告。"""
-    result = check_pdf_dependencies()
+    result = check_pdf_dependencies(full_report=True)
     
-    print("=" * 60)
-    print("PDF生成依赖诊断报告")
-    print("=" * 60)
-    print(f"\n系统: {result['system']}")
+    # 先在内存中拼好整份报告，最后一次写出；检查过程中的日志也因此不会穿插在报告中间
+    buf = io.StringIO()
+    write = buf.write
+    write("=" * 60 + "\n")
+    write("PDF生成依赖诊断报告\n")
+    write("=" * 60 + "\n")
+    write(f"\n系统: {result.system}\n")
     
-    print("\n1. reportlab检查:")
-    if result["reportlab"]["installed"]:
-        print(f"   ✓ 已安装，版本: {result['reportlab']['version']}")
+    write("\n1. reportlab检查:\n")
+    reportlab = result.reportlab
+    if reportlab.installed:
+        write(f"   ✓ 已安装，版本: {reportlab.version}\n")
     else:
-        print(f"   ✗ 未安装: {result['reportlab']['error']}")
+        write(f"   ✗ 未安装: {reportlab.error}\n")
     
-    print("\n2. weasyprint检查:")
-    if result["weasyprint"]["installed"]:
-        print(f"   ✓ 已安装，版本: {result['weasyprint']['version']}")
-        if result["weasyprint"]["dependencies_ok"]:
-            print("   ✓ 依赖检查通过")
+    write("\n2. weasyprint检查:\n")
+    weasyprint = result.weasyprint
+    if weasyprint.installed:
+        write(f"   ✓ 已安装，版本: {weasyprint.version}\n")
+        if weasyprint.dependencies_ok:
+            write("   ✓ 依赖检查通过\n")
         else:
-            print(f"   ✗ 依赖检查失败: {result['weasyprint']['dependency_errors']}")
+            write(f"   ✗ 依赖检查失败: {list(weasyprint.dependency_errors)}\n")
     else:
-        print(f"   ✗ 未安装: {result['weasyprint']['error']}")
+        write(f"   ✗ 未安装: {weasyprint.error}\n")
     
-    print("\n3. 中文字体检查:")
-    if result["chinese_fonts"]["fonts_available"]:
-        print(f"   ✓ 找到 {len(result['chinese_fonts']['fonts_available'])} 个可用字体:")
-        for font in result["chinese_fonts"]["fonts_available"]:
-            print(f"      - {font['name']}: {font['path']}")
+    write("\n3. 中文字体检查:\n")
+    fonts = result.chinese_fonts
+    if fonts.fonts_available:
+        write(f"   ✓ 找到 {len(fonts.fonts_available)} 个可用字体:\n")
+        buf.writelines(f"      - {font.name}: {font.path}\n" for font in fonts.fonts_available)
     else:
-        print("   ✗ 未找到可用的中文字体")
-        print(f"   已检查的字体: {', '.join(result['chinese_fonts']['fonts_found'])}")
-    
-    print("\n4. 总体状态:")
-    if result["can_generate_pdf"]:
-        print("   ✓ 可以生成PDF")
-        if not result["chinese_fonts"]["fonts_available"]:
-            print("   ⚠ 警告: 未找到中文字体，PDF中的中文可能显示为方块")
+        write("   ✗ 未找到可用的中文字体\n")
+        write(f"   已检查的字体: {', '.join(fonts.fonts_found)}\n")
+    
+    write("\n4. 总体状态:\n")
+    if result.can_generate_pdf:
+        write("   ✓ 可以生成PDF\n")
+        if not fonts.fonts_available:
+            write("   ⚠ 警告: 未找到中文字体，PDF中的中文可能显示为方块\n")
     else:
-        print("   ✗ 无法生成PDF")
-        print("   建议: 安装reportlab或weasyprint库")
+        write("   ✗ 无法生成PDF\n")
+        write("   建议: 安装reportlab或weasyprint库\n")
     
-    print("=" * 60)
+    write("=" * 60 + "\n")
+    sys.stdout.write(buf.getvalue())
+    sys.stdout.flush()
 
 
 if __name__ == "__main__":
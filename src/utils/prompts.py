@@ -1,10 +1,13 @@
 """集中存放提示词模板，便于统一维护。"""
 from __future__ import annotations
 
+import sys
+from string import Formatter
 from textwrap import dedent
+from typing import Any, Mapping, Optional, Tuple
 
 
-FIELD_EXTRACTION_PROMPT = dedent(
+FIELD_EXTRACTION_PROMPT = sys.intern(dedent(
     """
     你是一名财务票据解析专家。请从给定的OCR文本中抽取结构化字段，输出JSON，字段包括：
     - invoice_number
@@ -19,10 +22,10 @@ FIELD_EXTRACTION_PROMPT = dedent(
     - unknown_fields: [{"name": str, "value": str}]
     如果没有某个字段，请返回 null。
     OCR 文本："""
-)
+))
 
 
-POLICY_VALIDATION_PROMPT = dedent(
+POLICY_VALIDATION_PROMPT = sys.intern(dedent(
     """
     你需要根据以下规则文档，对票据是否满足条件给出结论。
     规则片段：{rules}
@@ -30,10 +33,10 @@ POLICY_VALIDATION_PROMPT = dedent(
     请输出 JSON 数组，每个元素包含: rule_title, severity(LOW/MEDIUM/HIGH), message。
     如果票据符合规则，请返回空数组。
     """
-)
+))
 
 
-NL_QUERY_PROMPT = dedent(
+NL_QUERY_PROMPT = sys.intern(dedent(
     """
     你是财务分析助手。基于给定的结构化条目，回答用户的问题。
     数据示例：{records}
@@ -41,12 +44,12 @@ NL_QUERY_PROMPT = dedent(
     可用字段包含 document_id/vendor/category/currency/amount/tax_amount/issue_date/created_at。
     1. 用中文简洁回答，并引用你使用的字段。
     2. 如果问题涉及筛选/统计，请给出可执行的伪SQL。
-    3. 严格输出 JSON（不允许额外解释），schema 为 {"answer": string, "sql": string|null}，无法生成 SQL 时填 null。
+    3. 严格输出 JSON（不允许额外解释），schema 为 {{"answer": string, "sql": string|null}}，无法生成 SQL 时填 null。
     """
-)
+))
 
 
-REPORT_PROMPT = dedent(
+REPORT_PROMPT = sys.intern(dedent(
     """
     你是财务对账总结机器人。根据票据结果生成审核报告：
     - 总处理数量
@@ -57,7 +60,46 @@ REPORT_PROMPT = dedent(
     输出 Markdown。
     数据如下：{payload}
     """
-)
+))
+
+
+# 模板在导入时拆成 (字面量, 字段名) 序列，渲染时直接拼接，不再每次请求重新解析花括号
+_Parts = Tuple[Tuple[str, Optional[str]], ...]
+
+
+def _compile(template: str) -> _Parts:
+    # 字面量片段同样驻留，多处导入/reload 时共享同一对象
+    return tuple(
+        (sys.intern(literal), field) for literal, field, _spec, _conv in Formatter().parse(template)
+    )
+
+
+def _render(parts: _Parts, values: Mapping[str, Any]) -> str:
+    """与 template.format(**values) 等价（模板不含格式说明与转换符）。"""
+    buf = []
+    append = buf.append
+    for literal, field in parts:
+        append(literal)
+        if field is not None:
+            append(str(values[field]))
+    return "".join(buf)
+
+
+_POLICY_PARTS = _compile(POLICY_VALIDATION_PROMPT)
+_NL_QUERY_PARTS = _compile(NL_QUERY_PROMPT)
+_REPORT_PARTS = _compile(REPORT_PROMPT)
+
+
+def render_policy(rules: Any, payload: Any) -> str:
+    return _render(_POLICY_PARTS, {"rules": rules, "payload": payload})
+
+
+def render_nl_query(records: Any, question: Any) -> str:
+    return _render(_NL_QUERY_PARTS, {"records": records, "question": question})
+
+
+def render_report(payload: Any) -> str:
+    return _render(_REPORT_PARTS, {"payload": payload})
 
 
 __all__ = [
@@ -65,4 +107,7 @@ __all__ = [
     "NL_QUERY_PROMPT",
     "POLICY_VALIDATION_PROMPT",
     "REPORT_PROMPT",
+    "render_nl_query",
+    "render_policy",
+    "render_report",
 ]
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+JSON 修复回归测试
+验证 JSON 前带 "[1]" 之类引用标注时，按调用方期望的类型取出结果而不调用 LLM
+"""
+
+import sys
+sys.path.append('src')
+
+from services.policy_rag.json_repair import repair_json
+
+CITED_REPLY = '依据规则[1]，结论如下：{"expense_type": "住宿", "scene": "出差", "city_level": "一线"}'
+
+
+class _NoLLM:
+    """本地即可解析的用例不应走到 LLM 修复。"""
+
+    def chat(self, *args, **kwargs):
+        raise AssertionError("不应调用 LLM 修复")
+
+
+def test_bracketed_citation_before_object():
+    data = repair_json(CITED_REPLY, _NoLLM(), expect=dict)
+    assert data == {"expense_type": "住宿", "scene": "出差", "city_level": "一线"}
+
+
+def test_bracketed_citation_before_object_with_trailing_comma():
+    reply = '参见[注1]：{"expense_type": "交通", "scene": "市内",}'
+    assert repair_json(reply, _NoLLM(), expect=dict) == {"expense_type": "交通", "scene": "市内"}
+
+
+def test_expected_list_skips_leading_object():
+    reply = '说明 {"note": "无"}，结果：[{"rule_title": "住宿标准", "severity": "HIGH"}]'
+    assert repair_json(reply, _NoLLM(), expect=list) == [{"rule_title": "住宿标准", "severity": "HIGH"}]
+
+
+if __name__ == "__main__":
+    test_bracketed_citation_before_object()
+    test_bracketed_citation_before_object_with_trailing_comma()
+    test_expected_list_skips_leading_object()
+    print("✅ JSON 修复回归测试通过")
@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+"""
+知识库规则分页游标测试
+验证传入无法解析的 cursor 时接口返回 400 与明确的错误信息，而不是服务器错误
+"""
+
+import sys
+sys.path.append('src')
+
+from app import app
+
+INVALID_CURSORS = ["not-a-cursor", "bm8tc2VwYXJhdG9y", "游标"]
+
+
+def test_invalid_cursor_returns_400():
+    client = app.test_client()
+    for cursor in INVALID_CURSORS:
+        response = client.get("/api/v1/knowledge/rules", query_string={"cursor": cursor})
+        assert response.status_code == 400, (cursor, response.status_code)
+        body = response.get_json()
+        assert body["success"] is False
+        assert "无效的分页游标" in body["error"]
+
+
+if __name__ == "__main__":
+    test_invalid_cursor_returns_400()
+    print("✅ 无效游标返回 400")
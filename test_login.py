@@ -4,24 +4,36 @@
 用于验证用户账号是否可以正常登录
 """
 
+import argparse
 import sys
 import os
+from functools import lru_cache
 sys.path.append('src')
 
 from database import init_db
 from services.user_service import authenticate, list_users
 
-def test_login():
+DEFAULT_LIST_LIMIT = 50
+
+
+@lru_cache(maxsize=1)
+def _ensure_db() -> None:
+    """同一进程内只初始化一次数据库（如 pytest 会话中多次调用 test_login）。"""
+    init_db()
+
+
+def test_login(quiet: bool = False, limit: int = DEFAULT_LIST_LIMIT):
     """测试登录功能"""
 
     print("🔍 检查用户账号...")
-    init_db()
+    _ensure_db()
 
-    # 列出所有用户
-    users = list_users()
-    print(f"📋 系统中存在的用户 ({len(users)} 个):")
-    for user in users:
-        print(f"  - {user['email']} ({user['name']}) - 角色: {user['role']}")
+    # 列出用户（最多 limit 个；--quiet 时跳过）
+    if not quiet:
+        users = list_users(limit=limit)
+        lines = [f"📋 系统中存在的用户 (显示前 {len(users)} 个，上限 {limit}):"]
+        lines.extend(f"  - {user['email']} ({user['name']}) - 角色: {user['role']}" for user in users)
+        print("\n".join(lines))
 
     print("\n🔐 测试登录...")
 
@@ -44,8 +56,17 @@ def test_login():
         print("   - 密码错误")
         return False
 
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="验证用户账号是否可以正常登录")
+    parser.add_argument("--quiet", action="store_true", help="不列出系统中的用户")
+    parser.add_argument("--limit", type=int, default=DEFAULT_LIST_LIMIT, help=f"最多列出的用户数，默认 {DEFAULT_LIST_LIMIT}")
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
-    success = test_login()
+    args = parse_args()
+    success = test_login(quiet=args.quiet, limit=args.limit)
     if success:
         print("\n🎉 账号恢复成功！您可以使用以下信息登录:")
         print("   邮箱: user1@example.com")